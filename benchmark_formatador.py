@@ -0,0 +1,94 @@
+"""Benchmark: formatação vetorizada x formatação célula a célula (apply)
+
+Uso: python benchmark_formatador.py [--linhas 200000] [--repeticoes 3]
+"""
+import argparse
+from datetime import date, timedelta
+from decimal import Decimal
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from formatador import (formatar_dataframe, formatar_data_ptbr, formatar_numero_ptbr,
+                        renomear_colunas)
+
+
+def formatar_dataframe_por_celula(df: pd.DataFrame) -> pd.DataFrame:
+    """Implementação anterior (apply por célula), mantida aqui só como referência"""
+    if df.empty:
+        return df
+    df_fmt = df.copy()
+    for col in df_fmt.columns:
+        dtype = df_fmt[col].dtype
+        col_lower = col.lower()
+        is_date_col = (pd.api.types.is_datetime64_any_dtype(dtype) or 'data' in col_lower or
+                       'date' in col_lower or col_lower in ['datalote', 'date_in', 'date_out'])
+        is_money_col = ('valor' in col_lower or 'saldo' in col_lower or 'total' in col_lower or
+                        'diferenca' in col_lower or col_lower in ['value', 'totalizador'])
+        if is_date_col:
+            df_fmt[col] = df_fmt[col].apply(formatar_data_ptbr).astype(str)
+        elif is_money_col or pd.api.types.is_float_dtype(dtype):
+            df_fmt[col] = df_fmt[col].apply(lambda x: formatar_numero_ptbr(x, 2)).astype(str)
+        elif dtype == 'object':
+            try:
+                primeiro_valor = df_fmt[col].dropna().iloc[0] if len(df_fmt[col].dropna()) > 0 else None
+                if primeiro_valor is not None and hasattr(primeiro_valor, '__float__'):
+                    df_fmt[col] = df_fmt[col].apply(lambda x: formatar_numero_ptbr(x, 2)).astype(str)
+            except:
+                pass
+    return renomear_colunas(df_fmt)
+
+
+def gerar_ficha_loja(linhas: int, seed: int = 42) -> pd.DataFrame:
+    """DataFrame sintético com os tipos que o pyodbc devolve para ficha_loja"""
+    rng = np.random.default_rng(seed)
+    entidades = np.array(['3013', '3113', '3213', '3124', '3224', '3313', '3513', '3713'])
+    contas = np.array(['1141001', '1141005', '3151001', '3161001', '3162010', '3171001'])
+    saldos = rng.normal(0, 250000, linhas).round(2)
+    return pd.DataFrame({
+        'IDEntidade': entidades[rng.integers(0, len(entidades), linhas)],
+        'Ano': np.full(linhas, 2025),
+        'Mes': rng.integers(0, 13, linhas),
+        'IDConta': contas[rng.integers(0, len(contas), linhas)],
+        'Conta': 'Mercadorias para Revenda',
+        'SubConta': rng.integers(1, 2000, linhas).astype(str),
+        'Saldo_Legal': [Decimal(f"{v:.2f}") for v in saldos],
+        'IDDepartamento': rng.integers(1, 60, linhas).astype(str),
+        'Data': [date(2025, 1, 1) + timedelta(days=int(d)) for d in rng.integers(0, 365, linhas)],
+        'Valor': saldos / 3,
+    })
+
+
+def medir(funcao, df: pd.DataFrame, repeticoes: int) -> tuple:
+    melhor, saida = float('inf'), None
+    for _ in range(repeticoes):
+        inicio = perf_counter()
+        saida = funcao(df)
+        melhor = min(melhor, perf_counter() - inicio)
+    return melhor, saida
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--linhas', type=int, default=200000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    df = gerar_ficha_loja(args.linhas)
+    print(f"📊 {len(df)} linhas x {len(df.columns)} colunas (melhor de {args.repeticoes})")
+
+    t_celula, esperado = medir(formatar_dataframe_por_celula, df, args.repeticoes)
+    t_vetor, obtido = medir(formatar_dataframe, df, args.repeticoes)
+
+    identico = esperado.equals(obtido) and list(esperado.columns) == list(obtido.columns)
+    print(f"   Por célula : {t_celula:.3f}s")
+    print(f"   Vetorizado : {t_vetor:.3f}s")
+    print(f"   Ganho      : {t_celula / t_vetor:.1f}x")
+    print(f"   Saída idêntica: {'✅' if identico else '❌'}")
+    if not identico:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
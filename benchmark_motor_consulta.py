@@ -0,0 +1,120 @@
+"""Benchmark: motor de threads x motor asyncio com driver falso (latência injetada)
+
+Uso: python benchmark_motor_consulta.py [--usuarios 10] [--latencia 0.2] [--lento 2.0] [--timeout 1]
+"""
+import argparse
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+import consulta_async
+import consulta_multi_servidor
+from config import SERVIDORES
+from consulta_async import ConsultaMultiServidorAsync
+from consulta_multi_servidor import ConsultaMultiServidor
+from latencia import RegistroLatencia
+
+
+class CursorFalso:
+    """Cursor que dorme a latência do servidor e respeita cancel()"""
+
+    def __init__(self, latencia: float, linhas: int):
+        self.latencia = latencia
+        self.linhas = linhas
+        self.description = None
+        self._restantes = []
+        self._cancelado = threading.Event()
+
+    def execute(self, sql, *params):
+        if self._cancelado.wait(self.latencia):
+            raise RuntimeError("HY008 Operation canceled")
+        self.description = [('Entidade',), ('Valor',)]
+        self._restantes = [('3013', float(i)) for i in range(self.linhas)]
+        return self
+
+    def fetchmany(self, n):
+        lote, self._restantes = self._restantes[:n], self._restantes[n:]
+        return lote
+
+    def cancel(self):
+        self._cancelado.set()
+
+    def close(self):
+        pass
+
+
+class PoolFalso:
+    """Substitui pool_conexoes: latência por servidor com jitter"""
+
+    def __init__(self, latencia: float, lento: float, linhas: int):
+        self.latencias = {srv: latencia for srv in SERVIDORES}
+        self.latencias[SERVIDORES[-1]] = lento  # Um servidor sobrecarregado
+        self.linhas = linhas
+
+    @contextmanager
+    def conexao(self, servidor, database="AASI", timeout=None):
+        class Conexao:
+            timeout = 0
+            cursor = staticmethod(lambda: CursorFalso(self.latencias[servidor] * random.uniform(0.8, 1.2),
+                                                      self.linhas))
+        yield Conexao()
+
+
+def rodar(motor, usuarios: int) -> tuple:
+    """usuarios requisições simultâneas; retorna (tempo, pico de threads, respostas)"""
+    respostas, pico = [], [threading.active_count()]
+    parar = threading.Event()
+
+    def medir_threads():
+        while not parar.wait(0.01):
+            pico[0] = max(pico[0], threading.active_count())
+
+    def usuario(i):
+        respostas.append(motor().executar_consulta_simultanea("SELECT 1", request_id=f"bench-{i}"))
+
+    monitor = threading.Thread(target=medir_threads, daemon=True)
+    monitor.start()
+    inicio = perf_counter()
+    threads = [threading.Thread(target=usuario, args=(i,)) for i in range(usuarios)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    tempo = perf_counter() - inicio
+    parar.set()
+    return tempo, pico[0], respostas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--latencia', type=float, default=0.2, help='segundos por query')
+    parser.add_argument('--lento', type=float, default=2.0, help='latência do servidor sobrecarregado')
+    parser.add_argument('--timeout', type=int, default=1, help='timeout por servidor (asyncio)')
+    parser.add_argument('--linhas', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.getLogger('consulta_multi_servidor').setLevel(logging.CRITICAL)  # Cancelamentos esperados
+    consulta_multi_servidor.pool_conexoes = PoolFalso(args.latencia, args.lento, args.linhas)
+    motores = {
+        'threads': ConsultaMultiServidor,
+        'asyncio': lambda: ConsultaMultiServidorAsync(timeout_servidor=args.timeout),
+    }
+
+    print(f"📊 {args.usuarios} usuários x {len(SERVIDORES)} servidores "
+          f"(latência {args.latencia}s, 1 servidor com {args.lento}s)")
+    for nome, motor in motores.items():
+        # Histórico zerado por motor e só em memória: o LATENCIA_ARQUIVO real não recebe amostras falsas
+        latencias = RegistroLatencia(arquivo=None)
+        consulta_multi_servidor.registro_latencia = consulta_async.registro_latencia = latencias
+        tempo, pico, respostas = rodar(motor, args.usuarios)
+        linhas = sum(r['linhas_afetadas'] for r in respostas)
+        ok = sum(r['servidores_processados'] for r in respostas)
+        print(f"   {nome:8s}: {tempo:.2f}s | pico de threads {pico} | "
+              f"{ok}/{len(respostas) * len(SERVIDORES)} servidores ok | {linhas} linhas")
+
+
+if __name__ == '__main__':
+    main()
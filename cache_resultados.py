@@ -0,0 +1,126 @@
+"""Cache de Resultados Consolidados (Parquet em disco, TTL por consulta, LRU por bytes)"""
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+from time import time
+import pandas as pd
+from config import CACHE_DIR, CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+
+class CacheResultados:
+    """Guarda o DataFrame consolidado de uma consulta multi-servidor por impressão digital"""
+
+    def __init__(self, diretorio: str = CACHE_DIR, max_mb: int = CACHE_MAX_MB):
+        self.diretorio = diretorio
+        self.max_bytes = max_mb * 1024 * 1024
+        self._indice = OrderedDict()  # chave -> {'arquivo', 'bytes', 'expira', 'tipo', 'meta'}
+        self._bytes = 0
+        self._lock = Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'gravacoes': 0, 'expirados': 0,
+                      'removidos_lru': 0, 'invalidados': 0}
+        os.makedirs(self.diretorio, exist_ok=True)
+        # O índice vive em memória: arquivos de execuções anteriores são órfãos
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.parquet'):
+                self._remover_arquivo(os.path.join(self.diretorio, nome))
+
+    @staticmethod
+    def chave(tipo: str, ano=None, periodo=None, data_limite=None, meses_atras=None,
+              servidores: list = None) -> str:
+        """Impressão digital da consulta: (tipo, parâmetros, conjunto de servidores)"""
+        bruto = json.dumps([tipo, ano, periodo, data_limite, meses_atras, sorted(servidores or [])])
+        return hashlib.sha256(bruto.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _remover_arquivo(caminho: str):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def _descartar(self, chave: str, motivo: str):
+        """Remove entrada do índice (chamar com lock)"""
+        entrada = self._indice.pop(chave, None)
+        if entrada:
+            self._bytes -= entrada['bytes']
+            self.stats[motivo] += 1
+            self._remover_arquivo(entrada['arquivo'])
+
+    def obter(self, chave: str):
+        """Retorna (df, meta) se houver entrada válida; senão None"""
+        with self._lock:
+            entrada = self._indice.get(chave)
+            if entrada and entrada['expira'] <= time():
+                self._descartar(chave, 'expirados')
+                entrada = None
+            if not entrada:
+                self.stats['misses'] += 1
+                return None
+            self._indice.move_to_end(chave)  # LRU: mais recente no fim
+            arquivo, meta = entrada['arquivo'], entrada['meta']
+
+        try:
+            df = pd.read_parquet(arquivo, engine='pyarrow')
+        except Exception as e:
+            logger.warning(f"⚠️ Cache ilegível ({e}); descartando")
+            with self._lock:
+                self._descartar(chave, 'invalidados')
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['hits'] += 1
+        return df, meta
+
+    def gravar(self, chave: str, tipo: str, df: pd.DataFrame, meta: dict, ttl: int) -> bool:
+        """Grava DataFrame em Parquet e aplica o limite total de bytes (LRU)"""
+        if ttl <= 0 or df.empty:
+            return False
+
+        arquivo = os.path.join(self.diretorio, f"{chave}.parquet")
+        temporario = f"{arquivo}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(temporario, index=False, engine='pyarrow', compression='zstd')
+            os.replace(temporario, arquivo)
+        except Exception as e:
+            # Ex.: coluna object com tipos mistos que o Arrow não converte
+            logger.warning(f"⚠️ Cache: não foi possível gravar {tipo}: {e}")
+            self._remover_arquivo(temporario)
+            return False
+
+        tamanho = os.path.getsize(arquivo)
+        with self._lock:
+            if chave in self._indice:
+                entrada = self._indice.pop(chave)
+                self._bytes -= entrada['bytes']
+            self._indice[chave] = {'arquivo': arquivo, 'bytes': tamanho, 'tipo': tipo,
+                                   'expira': time() + ttl, 'meta': meta}
+            self._bytes += tamanho
+            self.stats['gravacoes'] += 1
+            while self._bytes > self.max_bytes and len(self._indice) > 1:
+                self._descartar(next(iter(self._indice)), 'removidos_lru')
+        return True
+
+    def invalidar(self, tipo: str = None) -> int:
+        """Remove entradas de uma consulta (ou todas, se tipo=None)"""
+        with self._lock:
+            chaves = [c for c, e in self._indice.items() if tipo is None or e['tipo'] == tipo]
+            for c in chaves:
+                self._descartar(c, 'invalidados')
+        if chaves:
+            logger.info(f"🧹 Cache: {len(chaves)} entrada(s) invalidada(s) ({tipo or 'todas'})")
+        return len(chaves)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {'entradas': len(self._indice), 'bytes': self._bytes,
+                    'max_bytes': self.max_bytes, **self.stats}
+
+
+# Instância única do processo
+cache_resultados = CacheResultados()
@@ -0,0 +1,97 @@
+"""Registro de Cursores em Execução para Cancelamento Real (cursor.cancel)"""
+import logging
+from contextlib import contextmanager
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class ConsultaCancelada(Exception):
+    """Consulta cancelada antes de chegar ao SQL Server"""
+
+
+class RegistroCancelamento:
+    """Mantém os cursores ativos por request_id; cancelar() interrompe as queries no servidor"""
+
+    def __init__(self):
+        self._cursores = {}     # request_id -> {id(cursor): (cursor, servidor)}
+        self._cancelados = set()
+        self._em_andamento = set()  # Requests entre iniciar() e limpar()
+        self._lock = Lock()
+
+    @contextmanager
+    def registrar(self, request_id: str, cursor, servidor: str = None):
+        """Registra o cursor enquanto o bloco executa (request_id None = não cancelável)"""
+        if request_id is None:
+            yield cursor
+            return
+
+        with self._lock:
+            if request_id in self._cancelados:
+                raise ConsultaCancelada(request_id)
+            self._cursores.setdefault(request_id, {})[id(cursor)] = (cursor, servidor)
+        try:
+            yield cursor
+        except Exception:
+            # Erro do driver provocado pelo cancel() vira ConsultaCancelada
+            if self.foi_cancelado(request_id):
+                raise ConsultaCancelada(request_id) from None
+            raise
+        finally:
+            with self._lock:
+                ativos = self._cursores.get(request_id, {})
+                ativos.pop(id(cursor), None)
+                if not ativos:
+                    self._cursores.pop(request_id, None)
+                    if request_id not in self._em_andamento:
+                        self._cancelados.discard(request_id)
+
+    def iniciar(self, request_id: str):
+        """Request em andamento: cancelar() vale também entre uma query e outra (até limpar())"""
+        with self._lock:
+            self._em_andamento.add(request_id)
+
+    def cancelar(self, request_id: str) -> int:
+        """Marca o request como cancelado e chama cursor.cancel() nos statements em curso"""
+        with self._lock:
+            if request_id not in self._em_andamento and request_id not in self._cursores:
+                return 0  # Já terminou: nada a marcar (e nada para limpar() depois)
+            self._cancelados.add(request_id)
+            cursores = [c for c, _ in self._cursores.get(request_id, {}).values()]
+        return self._cancelar_cursores(cursores)
+
+    def cancelar_servidor(self, request_id: str, servidor: str) -> int:
+        """Interrompe só a query de um servidor (ex.: timeout individual), sem cancelar o request"""
+        with self._lock:
+            cursores = [c for c, srv in self._cursores.get(request_id, {}).values() if srv == servidor]
+        return self._cancelar_cursores(cursores)
+
+    @staticmethod
+    def _cancelar_cursores(cursores: list) -> int:
+        cancelados = 0
+        for cursor in cursores:
+            try:
+                cursor.cancel()
+                cancelados += 1
+            except Exception as e:
+                logger.warning(f"⚠️ cursor.cancel() falhou: {e}")
+        return cancelados
+
+    def foi_cancelado(self, request_id: str) -> bool:
+        with self._lock:
+            return request_id in self._cancelados
+
+    def limpar(self, request_id: str):
+        """Esquece o request (chamar ao final da consulta)"""
+        with self._lock:
+            self._cancelados.discard(request_id)
+            self._em_andamento.discard(request_id)
+            self._cursores.pop(request_id, None)
+
+    def ativos(self) -> int:
+        with self._lock:
+            return sum(len(c) for c in self._cursores.values())
+
+
+# Instância única do processo
+registro_cancelamento = RegistroCancelamento()
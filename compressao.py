@@ -0,0 +1,67 @@
+"""Compressão em streaming (gzip e zstd) para downloads, uploads e respostas JSON"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard é opcional; sem ele só gzip
+    zstandard = None
+
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 3
+EXTENSOES = {'gzip': 'gz', 'zstd': 'zst'}
+MIMETYPES = {'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+POR_EXTENSAO = {ext: algoritmo for algoritmo, ext in EXTENSOES.items()}
+
+
+def disponiveis() -> list:
+    """Algoritmos utilizáveis, do preferido para o menos preferido"""
+    return ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+
+def _compressor(algoritmo: str):
+    if algoritmo == 'gzip':
+        c = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)  # wbits 31 = formato gzip
+        return c.compress, c.flush
+    if algoritmo == 'zstd' and zstandard is not None:
+        c = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+        return c.compress, c.flush
+    raise ValueError(f"Compressão indisponível: {algoritmo}")
+
+
+def comprimir(pedacos, algoritmo: str):
+    """Comprime um iterável de bytes pedaço a pedaço (memória constante)"""
+    compress, flush = _compressor(algoritmo)
+    for pedaco in pedacos:
+        saida = compress(pedaco)
+        if saida:
+            yield saida
+    yield flush()
+
+
+def comprimir_bytes(conteudo: bytes, algoritmo: str) -> bytes:
+    return b''.join(comprimir([conteudo], algoritmo))
+
+
+def validar(algoritmo: str) -> str:
+    """Nome do algoritmo se disponível; ValueError caso contrário"""
+    if algoritmo not in disponiveis():
+        raise ValueError(f"Compressão indisponível: {algoritmo} (use {', '.join(disponiveis())})")
+    return algoritmo
+
+
+def negociar(accept_encoding: str):
+    """Melhor Content-Encoding aceito pelo cliente (zstd > gzip) ou None"""
+    aceitos = {}
+    for parte in (accept_encoding or '').split(','):
+        nome, _, parametro = parte.partition(';')
+        q = 1.0
+        if parametro.strip().startswith('q='):
+            try:
+                q = float(parametro.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceitos[nome.strip().lower()] = q
+    for algoritmo in disponiveis():
+        if aceitos.get(algoritmo, aceitos.get('*', 0)) > 0:
+            return algoritmo
+    return None
@@ -1,5 +1,6 @@
 """Configurações centralizadas do sistema"""
 import os
+import tempfile
 
 # Tentar carregar .env se existir
 try:
@@ -12,11 +13,18 @@ except ImportError:
 AZURE_CLIENT_ID = os.getenv("AZURE_CLIENT_ID", "451cccf3-6015-40c7-a170-4f3569580519")
 AZURE_CLIENT_SECRET = os.getenv("AZURE_CLIENT_SECRET", "")
 AZURE_TENANT_ID = os.getenv("AZURE_TENANT_ID", "01ee7ae0-42ba-41a5-bb7b-8d4af8db7f07")
+AZURE_LOGIN_URL = os.getenv("AZURE_LOGIN_URL", "https://login.microsoftonline.com")  # Trocável por um mock local
+GRAPH_URL = os.getenv("GRAPH_URL", "https://graph.microsoft.com/v1.0")
 
 # === SHAREPOINT ===
 SHAREPOINT_SITE_ID = os.getenv("SHAREPOINT_SITE_ID", "mailadventistas.sharepoint.com,100852d9-d173-4ee5-8db2-52ca8fcbd2ca,b389c9d9-6db0-4b39-a78f-442e137797dc")
 SHAREPOINT_DRIVE_ID = os.getenv("SHAREPOINT_DRIVE_ID", "b!2VIIEHPR5U6NslLKj8vSytnJibOwbTlLp49ELhN3l9wvLr3QX4FHQrR0VdJwCbw6")
 SHAREPOINT_PASTA_DESTINO = "Consultas_Remotas"
+UPLOAD_SESSAO_ACIMA_MB = int(os.getenv("UPLOAD_SESSAO_ACIMA_MB", 4))  # Acima disso: upload session em partes
+UPLOAD_PARTE_KB = int(os.getenv("UPLOAD_PARTE_KB", 5120))            # Arredondado para múltiplo de 320 KiB
+UPLOAD_TENTATIVAS = int(os.getenv("UPLOAD_TENTATIVAS", 4))           # Por parte e por upload na fila
+UPLOAD_MEMORIA_MB = int(os.getenv("UPLOAD_MEMORIA_MB", 16))          # Arquivo gerado vai para disco acima disso
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", 2))                 # Uploads simultâneos em segundo plano
 
 # === SQL SERVER ===
 SQL_USER = os.getenv("SQL_USER", "net.bi")
@@ -30,9 +38,55 @@ WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
 SQL_SERVER_PORT = int(os.getenv("SQL_SERVER_PORT", 5555))
 SQL_SERVER_HOST = os.getenv("SQL_SERVER_HOST", "localhost")
 TIMEOUT_CONEXAO = int(os.getenv("TIMEOUT_CONEXAO", 60))
+TIMEOUT_QUERY = int(os.getenv("TIMEOUT_QUERY", 180))
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 SECRET_KEY = os.getenv("SECRET_KEY", "mude-esta-chave-em-producao")
 
+# === POOL DE CONEXÕES SQL ===
+POOL_MIN_CONEXOES = int(os.getenv("POOL_MIN_CONEXOES", 1))     # Abertas em segundo plano e mantidas
+POOL_MAX_CONEXOES = int(os.getenv("POOL_MAX_CONEXOES", 4))     # Por (servidor, database)
+POOL_TEMPO_OCIOSO = int(os.getenv("POOL_TEMPO_OCIOSO", 300))   # Segundos até fechar ociosa
+
+# === EXECUTOR DE CONSULTAS ===
+MAX_THREADS_CONSULTA = int(os.getenv("MAX_THREADS_CONSULTA", 32))            # Total no processo
+MAX_CONSULTAS_POR_SERVIDOR = int(os.getenv("MAX_CONSULTAS_POR_SERVIDOR", 4))  # Statements simultâneos por IP
+MOTOR_CONSULTA = os.getenv("MOTOR_CONSULTA", "threads")                      # threads | asyncio
+TIMEOUT_POR_SERVIDOR = int(os.getenv("TIMEOUT_POR_SERVIDOR", 240))           # Motor asyncio: fila + conexão + query
+# Principal + saldo num batch por servidor (uma ida). Desligado: duas idas, as duas consultas em paralelo
+CONSULTAS_EM_LOTE = os.getenv("CONSULTAS_EM_LOTE", "true").lower() == "true"
+
+# === TIMEOUTS ADAPTATIVOS (LATÊNCIA POR SERVIDOR/CONSULTA) ===
+LATENCIA_ARQUIVO = os.getenv("LATENCIA_ARQUIVO", os.path.join(tempfile.gettempdir(), "consultas_remotas_latencias.json"))
+LATENCIA_AMOSTRAS = int(os.getenv("LATENCIA_AMOSTRAS", 200))       # Últimas execuções guardadas por par
+LATENCIA_MIN_AMOSTRAS = int(os.getenv("LATENCIA_MIN_AMOSTRAS", 10))  # Abaixo disso: TIMEOUT_QUERY fixo
+LATENCIA_FATOR = float(os.getenv("LATENCIA_FATOR", 3.0))            # Timeout = p99 x fator
+LATENCIA_TIMEOUT_MIN = int(os.getenv("LATENCIA_TIMEOUT_MIN", 30))   # Piso (segundos)
+LATENCIA_TIMEOUT_MAX = int(os.getenv("LATENCIA_TIMEOUT_MAX", 600))  # Teto (segundos)
+LATENCIA_HEDGE = os.getenv("LATENCIA_HEDGE", "false").lower() == "true"  # Motor asyncio: 2ª tentativa após o p95
+
+# === DISJUNTOR (SERVIDORES FORA DO AR) ===
+DISJUNTOR_FALHAS = int(os.getenv("DISJUNTOR_FALHAS", 2))                    # Falhas de rede seguidas para abrir (não login)
+DISJUNTOR_INTERVALO_SONDA = int(os.getenv("DISJUNTOR_INTERVALO_SONDA", 30))  # Segundos entre tentativas da sonda
+DISJUNTOR_TIMEOUT_SONDA = int(os.getenv("DISJUNTOR_TIMEOUT_SONDA", 10))      # Timeout de conexão da sonda
+
+# === LEITURA DE RESULTADOS ===
+FETCH_TAMANHO_LOTE = int(os.getenv("FETCH_TAMANHO_LOTE", 5000))             # Linhas por fetchmany
+MAX_LINHAS_POR_SERVIDOR = int(os.getenv("MAX_LINHAS_POR_SERVIDOR", 1000000))  # 0 = sem limite
+MAX_MB_POR_SERVIDOR = int(os.getenv("MAX_MB_POR_SERVIDOR", 512))             # 0 = sem limite
+
+# === CACHE DE RESULTADOS ===
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "consultas_remotas_cache"))
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", 512))  # Total em disco (LRU acima disso)
+
+# === EXPORTAÇÃO ===
+EXPORT_LINHAS_POR_BLOCO = int(os.getenv("EXPORT_LINHAS_POR_BLOCO", 20000))  # Linhas formatadas por vez
+COMPRESSAO_PARQUET = os.getenv("COMPRESSAO_PARQUET", "snappy")             # snappy | zstd | gzip
+COMPRESSAO_MIN_BYTES = int(os.getenv("COMPRESSAO_MIN_BYTES", 1024))         # JSON menor que isso vai sem Content-Encoding
+
+# === RESULTADOS PROGRESSIVOS (SSE) ===
+SSE_LINHAS_POR_EVENTO = int(os.getenv("SSE_LINHAS_POR_EVENTO", 2000))  # Linhas por evento 'linhas'
+SSE_MAX_LINHAS = int(os.getenv("SSE_MAX_LINHAS", 5000))                # Por consulta (o resto vem no resultado final)
+
 # === SERVIDORES SQL ===
 SERVIDORES = [
     '10.30.11.2', '10.31.11.2', '10.32.11.2', '10.33.11.2', '10.34.11.2',
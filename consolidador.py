@@ -0,0 +1,161 @@
+"""Consolidação Incremental dos resultados por servidor (buffers tipados + deduplicação por hash)"""
+from threading import Lock
+import numpy as np
+import pandas as pd
+
+CAPACIDADE_INICIAL = 1024
+_TIPADOS = 'biufcmM'  # kinds numpy mantidos em buffer tipado; o resto vai para object
+
+
+def _tipo_buffer(dtype) -> np.dtype:
+    """dtype do buffer para uma coluna do pandas"""
+    if isinstance(dtype, np.dtype) and dtype.kind in _TIPADOS:
+        return dtype
+    return np.dtype(object)
+
+
+def _tipo_com_nulos(dtype: np.dtype) -> np.dtype:
+    """dtype capaz de representar linhas ausentes (como o pd.concat faria)"""
+    if dtype.kind in 'iu':
+        return np.dtype('float64')
+    if dtype.kind == 'b':
+        return np.dtype(object)
+    return dtype
+
+
+def _nulo(dtype: np.dtype):
+    if dtype.kind in 'mM':
+        return np.array('NaT', dtype=dtype)
+    return np.nan if dtype.kind in 'fc' else None
+
+
+def _unificar(atual: np.dtype, novo: np.dtype) -> np.dtype:
+    if atual == novo:
+        return atual
+    if atual.kind in 'iufc' and novo.kind in 'iufc':
+        return np.result_type(atual, novo)
+    if atual.kind == novo.kind and atual.kind in 'mM':
+        return np.result_type(atual, novo)
+    return np.dtype(object)
+
+
+class ConsolidadorIncremental:
+    """
+    Acumula o DataFrame de cada servidor assim que ele chega:
+    - colunas em buffers numpy que crescem por duplicação (sem lista de frames + concat no fim)
+    - deduplicação incremental por hash das colunas-chave (None = todas as colunas)
+    - tabela() devolve o consolidado parcial a qualquer momento
+    """
+
+    def __init__(self, deduplicar: bool = False, chaves: list = None):
+        self.deduplicar = deduplicar
+        self.chaves = chaves
+        self._buffers = {}     # coluna -> np.ndarray (capacidade >= linhas)
+        self._extensoes = {}   # coluna -> dtype pandas original (ex.: str) restaurado em tabela()
+        self._linhas = 0
+        self._capacidade = 0
+        self._hashes = set()
+        self._faixas = {}      # servidor -> (inicio, fim)
+        self.duplicadas = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return self._linhas
+
+    def _garantir_capacidade(self, necessaria: int):
+        if necessaria <= self._capacidade:
+            return
+        capacidade = max(CAPACIDADE_INICIAL, self._capacidade)
+        while capacidade < necessaria:
+            capacidade *= 2
+        for col, buf in self._buffers.items():
+            novo = np.empty(capacidade, dtype=buf.dtype)
+            novo[:self._linhas] = buf[:self._linhas]
+            self._buffers[col] = novo
+        self._capacidade = capacidade
+
+    def _converter_buffer(self, col: str, dtype: np.dtype):
+        buf = self._buffers[col]
+        if buf.dtype != dtype:
+            novo = np.empty(self._capacidade, dtype=dtype)
+            novo[:self._linhas] = buf[:self._linhas].astype(dtype)
+            self._buffers[col] = novo
+
+    def _filtrar_novas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Remove linhas já vistas (em frames anteriores ou repetidas no próprio frame)"""
+        chaves = [c for c in (self.chaves or df.columns) if c in df.columns]
+        hashes = pd.util.hash_pandas_object(df[chaves], index=False).to_numpy()
+        novas = ~pd.Series(hashes).duplicated().to_numpy()
+        if self._hashes:
+            novas &= ~np.isin(hashes, np.fromiter(self._hashes, dtype=np.uint64, count=len(self._hashes)))
+        self._hashes.update(hashes[novas].tolist())
+        self.duplicadas += int(len(df) - novas.sum())
+        return df if novas.all() else df[novas]
+
+    def adicionar(self, servidor: str, df: pd.DataFrame) -> int:
+        """Anexa o resultado de um servidor; retorna quantas linhas entraram"""
+        with self._lock:
+            if self.deduplicar and not df.empty:
+                df = self._filtrar_novas(df)
+            inicio, n = self._linhas, len(df)
+            self._faixas[servidor] = (inicio, inicio + n)
+            if n == 0:
+                return 0
+
+            self._garantir_capacidade(inicio + n)
+            for col in df.columns:
+                serie = df[col]
+                dtype = _tipo_buffer(serie.dtype)
+                if col not in self._buffers:
+                    if inicio:
+                        dtype = _tipo_com_nulos(dtype)
+                    buf = np.empty(self._capacidade, dtype=dtype)
+                    if inicio:
+                        buf[:inicio] = _nulo(dtype)
+                    self._buffers[col] = buf
+                    if not isinstance(serie.dtype, np.dtype):
+                        self._extensoes[col] = serie.dtype
+                else:
+                    self._converter_buffer(col, _unificar(self._buffers[col].dtype, dtype))
+                    if self._extensoes.get(col) != serie.dtype:
+                        self._extensoes.pop(col, None)
+                buf = self._buffers[col]
+                valores = serie.to_numpy(dtype=object) if buf.dtype == object else serie.to_numpy()
+                buf[inicio:inicio + n] = valores
+
+            # Colunas que este servidor não trouxe
+            for col in self._buffers.keys() - set(df.columns):
+                self._converter_buffer(col, _tipo_com_nulos(self._buffers[col].dtype))
+                self._buffers[col][inicio:inicio + n] = _nulo(self._buffers[col].dtype)
+
+            self._linhas += n
+            return n
+
+    def _montar(self, inicio: int, fim: int) -> pd.DataFrame:
+        """DataFrame sobre as linhas [inicio, fim) - fatias são views dos buffers"""
+        colunas = {}
+        for col, buf in self._buffers.items():
+            fatia = buf[inicio:fim]
+            extensao = self._extensoes.get(col)
+            colunas[col] = pd.array(fatia, dtype=extensao) if extensao is not None else fatia
+        return pd.DataFrame(colunas, copy=False)
+
+    def tabela(self) -> pd.DataFrame:
+        """Consolidado até o momento (pode ser chamado com servidores ainda pendentes)"""
+        with self._lock:
+            return self._montar(0, self._linhas)
+
+    def linhas_de(self, servidor: str) -> pd.DataFrame:
+        """Linhas que o servidor acrescentou (já deduplicadas)"""
+        with self._lock:
+            inicio, fim = self._faixas.get(servidor, (0, 0))
+            return self._montar(inicio, fim)
+
+    def por_servidor(self) -> dict:
+        """{servidor: DataFrame} com as linhas que cada servidor acrescentou"""
+        with self._lock:
+            return {srv: self._montar(a, b) for srv, (a, b) in self._faixas.items()}
+
+    def faixas(self) -> dict:
+        with self._lock:
+            return dict(self._faixas)
@@ -0,0 +1,268 @@
+"""Motor asyncio para Consultas Multi-Servidor (alternativo ao de threads)"""
+import asyncio
+import logging
+import uuid
+from time import perf_counter
+import pandas as pd
+from config import TIMEOUT_POR_SERVIDOR, TIMEOUT_CONEXAO, LATENCIA_HEDGE
+from consulta_multi_servidor import ConsultaMultiServidor, TIMEOUT_GLOBAL
+from executor_compartilhado import executor_consultas
+from consolidador import ConsolidadorIncremental
+from cancelamento import registro_cancelamento
+from latencia import registro_latencia
+from metricas import cronometrar
+
+logger = logging.getLogger(__name__)
+INTERVALO_CANCELAMENTO = 0.5  # segundos entre verificações do cancelado_callback
+
+
+class ConsultaMultiServidorAsync(ConsultaMultiServidor):
+    """
+    Mesma interface de ConsultaMultiServidor, com o fan-out coordenado por asyncio:
+    - pyodbc continua bloqueante, executado no executor compartilhado (limite por servidor)
+    - timeout individual por servidor (asyncio.wait_for + cursor.cancel no servidor), adaptativo
+      pelo histórico de latência quando houver
+    - LATENCIA_HEDGE: query que passa do p95 do servidor ganha uma 2ª tentativa; vale a primeira
+    - consolidação por asyncio.as_completed e cancelamento estruturado das tarefas
+    - executar_lote (CONSULTAS_EM_LOTE) passa pelo mesmo caminho: timeout e hedge em cada batch
+    """
+
+    def __init__(self, timeout_servidor: int = TIMEOUT_POR_SERVIDOR):
+        super().__init__()
+        self.timeout_servidor = timeout_servidor
+
+    def executar_consulta_simultanea(self, query, servidores: list = None,
+                                      config_consulta: dict = None,
+                                      log_callback=None, cancelado_callback=None,
+                                      parciais: dict = None, request_id: str = None,
+                                      linhas_callback=None, parametros: dict = None) -> dict:
+        """Executa query em múltiplos servidores (ponto de entrada síncrono)"""
+        return asyncio.run(self.executar_async(query, servidores, config_consulta, log_callback,
+                                               cancelado_callback, parciais, request_id,
+                                               linhas_callback, parametros))
+
+    async def _consultar_servidor(self, servidor: str, query: tuple, request_id: str,
+                                  log_callback, consulta: str = 'avulsa', tempos: dict = None,
+                                  tipos: list = None) -> tuple:
+        """
+        Uma query (sql, parâmetros) no executor compartilhado, com timeout individual.
+        tipos: batch de executar_lote (_executar_lote, df = {tipo: DataFrame}).
+        tempos recebe as etapas da 1ª tentativa (a do hedge só entra no histograma).
+        """
+        sql, parametros = query
+        
+        def enviar(rid: str):
+            etapas = tempos if rid == request_id or rid.endswith(':1') else None
+            if tipos:
+                tarefa = (self._executar_lote, servidor, sql, tipos, log_callback, rid, parametros, etapas)
+            else:
+                tarefa = (self._executar_query, servidor, sql, "AASI", log_callback, rid, parametros,
+                          consulta, etapas)
+            return asyncio.wrap_future(executor_consultas.submit(servidor, request_id, *tarefa))
+        
+        limite = registro_latencia.limite(servidor, consulta)
+        prazo = limite + TIMEOUT_CONEXAO if limite else self.timeout_servidor
+        limiar = registro_latencia.percentil(servidor, consulta, 0.95) if LATENCIA_HEDGE else None
+        try:
+            if limiar is not None:
+                return await asyncio.wait_for(self._com_hedge(servidor, enviar, limiar, request_id, log_callback),
+                                              prazo)
+            return await asyncio.wait_for(enviar(request_id), prazo)
+        except asyncio.TimeoutError:
+            # wait_for já cancelou a tarefa se ainda estava na fila; se está rodando, interromper no SQL
+            registro_cancelamento.cancelar_servidor(request_id, servidor)
+            if log_callback:
+                log_callback(f"⏱️ {servidor}: Timeout ({prazo}s)")
+            return (servidor, False, {} if tipos else pd.DataFrame(), "Timeout")
+
+    async def _com_hedge(self, servidor: str, enviar, limiar: float, request_id: str, log_callback) -> tuple:
+        """
+        Hedge: se a query passar do p95 sem responder, dispara outra igual no mesmo servidor e
+        fica com a primeira que voltar com sucesso; a outra é interrompida no SQL Server.
+        Cada tentativa tem request_id próprio para cancelar só ela.
+        """
+        rids = [f"{request_id}:{servidor}:1", f"{request_id}:{servidor}:2"]
+        tentativas = {enviar(rids[0]): rids[0]}
+        try:
+            feitas, _ = await asyncio.wait(tentativas, timeout=limiar)
+            if not feitas:
+                if log_callback:
+                    log_callback(f"🐢 {servidor}: acima do p95 ({limiar:.1f}s), 2ª tentativa")
+                tentativas[enviar(rids[1])] = rids[1]
+            while tentativas:
+                feitas, _ = await asyncio.wait(tentativas, return_when=asyncio.FIRST_COMPLETED)
+                for tentativa in feitas:
+                    tentativas.pop(tentativa)
+                    resultado = tentativa.result()
+                    if resultado[1] or not tentativas:  # Sucesso, ou a última que faltava
+                        return resultado
+        finally:
+            for tentativa, rid in tentativas.items():
+                tentativa.cancel()
+                registro_cancelamento.cancelar_servidor(rid, servidor)
+            for rid in rids:
+                registro_cancelamento.limpar(rid)
+
+    def executar_lote(self, consultas: dict, log_callback=None, cancelado_callback=None,
+                      parciais: dict = None, request_id: str = None,
+                      linhas_callback: dict = None, parametros: dict = None) -> dict:
+        """Várias consultas num único batch por servidor (ponto de entrada síncrono)"""
+        return asyncio.run(self.executar_lote_async(consultas, log_callback, cancelado_callback, parciais,
+                                                    request_id, linhas_callback, parametros))
+
+    async def executar_lote_async(self, consultas: dict, log_callback=None, cancelado_callback=None,
+                                  parciais: dict = None, request_id: str = None,
+                                  linhas_callback: dict = None, parametros: dict = None) -> dict:
+        """Como ConsultaMultiServidor.executar_lote, com timeout individual e hedge em cada batch"""
+        inicio = perf_counter()
+        lote = self._preparar_lote(consultas, parciais, linhas_callback, parametros, log_callback)
+        
+        rid = request_id or f"async-{uuid.uuid4().hex[:8]}"
+        prazo = registro_latencia.timeout_global([(srv, '+'.join(t)) for srv, t in lote.lotes.items()],
+                                                 TIMEOUT_GLOBAL)
+        tarefas = []
+        for srv in lote.lotes:
+            sql, tipos, params = lote.batch(srv)
+            tarefas.append(asyncio.create_task(
+                self._consultar_servidor(srv, (sql, params), rid, log_callback, '+'.join(tipos),
+                                         lote.tempos_servidores[srv], tipos), name=srv))
+        vigia = (asyncio.create_task(self._vigiar_cancelamento(cancelado_callback, rid, tarefas))
+                 if cancelado_callback else None)
+        
+        try:
+            for proxima in asyncio.as_completed(tarefas, timeout=prazo):
+                try:
+                    resultado = await proxima
+                except asyncio.CancelledError:
+                    if log_callback:
+                        log_callback("⛔ Cancelando consultas pendentes...")
+                    break
+                lote.receber(*resultado)
+        
+        except asyncio.TimeoutError:
+            if log_callback:
+                log_callback(f"⏱️ Timeout global ({prazo}s)")
+            for tarefa in tarefas:
+                if not tarefa.done():
+                    lote.falhou(tarefa.get_name())
+                    registro_cancelamento.cancelar_servidor(rid, tarefa.get_name())
+        
+        finally:
+            if vigia:
+                vigia.cancel()
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, *([vigia] if vigia else []), return_exceptions=True)
+            if request_id is None:
+                registro_cancelamento.limpar(rid)
+        
+        return self._respostas_lote(lote, perf_counter() - inicio, log_callback)
+
+    async def _vigiar_cancelamento(self, cancelado_callback, request_id: str, tarefas: list):
+        """Cancela as tarefas (e as queries em curso) quando o usuário cancela"""
+        while True:
+            await asyncio.sleep(INTERVALO_CANCELAMENTO)
+            if cancelado_callback():
+                registro_cancelamento.cancelar(request_id)
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                return
+
+    async def executar_async(self, query, servidores: list = None,
+                             config_consulta: dict = None,
+                             log_callback=None, cancelado_callback=None,
+                             parciais: dict = None, request_id: str = None,
+                             linhas_callback=None, parametros: dict = None) -> dict:
+        """Executa query em múltiplos servidores (corrotina)"""
+        inicio = perf_counter()
+        servidores = servidores or self.servidores
+
+        queries = self._preparar_queries(query, config_consulta, parametros)
+        servidores = list(queries.keys()) if queries else servidores
+
+        parciais = dict(parciais or {})
+        reaproveitados = [srv for srv in servidores if srv in parciais]
+        pendentes = [srv for srv in servidores if srv in queries and srv not in parciais]
+
+        if log_callback:
+            if reaproveitados:
+                log_callback(f"♻️ Reaproveitando {len(reaproveitados)} servidores da execução anterior")
+            log_callback(f"🔍 Consultando {len(pendentes)} servidores (asyncio)...")
+
+        # Cada resultado entra no consolidado assim que chega (sem lista de frames + concat no fim)
+        consolidador = ConsolidadorIncremental(
+            deduplicar=bool(config_consulta and config_consulta.get('subcontas_por_entidade')),
+            chaves=(config_consulta or {}).get('chaves_deduplicacao'))
+        for srv in reaproveitados:
+            consolidador.adicionar(srv, parciais[srv])
+        erros = []
+        servidores_ok = sum(1 for srv in reaproveitados if not parciais[srv].empty)
+        servidores_timeout, servidores_erro = [], []
+
+        # Sem request_id não haveria como interromper a query de um servidor no timeout
+        rid = request_id or f"async-{uuid.uuid4().hex[:8]}"
+        nome = (config_consulta or {}).get('id', 'avulsa')
+        prazo = registro_latencia.timeout_global([(srv, nome) for srv in pendentes], TIMEOUT_GLOBAL)
+        tempos_servidores, tempos_etapas = {srv: {} for srv in pendentes}, {}
+        tarefas = [asyncio.create_task(self._consultar_servidor(srv, queries[srv], rid, log_callback,
+                                                                nome, tempos_servidores[srv]), name=srv)
+                   for srv in pendentes]
+        vigia = (asyncio.create_task(self._vigiar_cancelamento(cancelado_callback, rid, tarefas))
+                 if cancelado_callback else None)
+
+        try:
+            for proxima in asyncio.as_completed(tarefas, timeout=prazo):
+                try:
+                    servidor, sucesso, df, erro = await proxima
+                except asyncio.CancelledError:
+                    if log_callback:
+                        log_callback("⛔ Cancelando consultas pendentes...")
+                    break
+
+                if sucesso:
+                    with cronometrar(tempos_etapas, 'consolidacao'):
+                        adicionado = consolidador.adicionar(servidor, df)
+                    if adicionado and linhas_callback:
+                        linhas_callback(servidor, consolidador.linhas_de(servidor))
+                if sucesso and not df.empty:
+                    servidores_ok += 1
+                    if erro:  # Sucesso parcial (truncado)
+                        erros.append(f"{servidor}: {erro}")
+                elif erro == "Timeout":
+                    erros.append(f"{servidor}: {erro}")
+                    servidores_timeout.append(servidor)
+                elif erro:
+                    erros.append(f"{servidor}: {erro}")
+                    servidores_erro.append(servidor)
+
+        except asyncio.TimeoutError:
+            if log_callback:
+                log_callback(f"⏱️ Timeout global ({prazo}s)")
+            for tarefa in tarefas:
+                if not tarefa.done():
+                    servidores_timeout.append(tarefa.get_name())
+                    registro_cancelamento.cancelar_servidor(rid, tarefa.get_name())
+
+        finally:
+            if vigia:
+                vigia.cancel()
+            for tarefa in tarefas:
+                tarefa.cancel()
+            await asyncio.gather(*tarefas, *([vigia] if vigia else []), return_exceptions=True)
+            if request_id is None:
+                registro_cancelamento.limpar(rid)
+
+        with cronometrar(tempos_etapas, 'consolidacao'):
+            df_final = consolidador.tabela()
+
+        tempo = perf_counter() - inicio
+
+        if log_callback:
+            log_callback(f"✅ Concluído: {len(df_final)} linhas em {tempo:.2f}s")
+
+        resposta = self._formatar_resposta(df_final, servidores_ok, len(servidores),
+                                           servidores_timeout, servidores_erro, erros, tempo)
+        resposta['metricas'] = self._metricas(nome, tempos_servidores, tempos_etapas)
+        resposta['parciais'] = consolidador.por_servidor()
+        resposta['servidores_falhos'] = servidores_timeout + servidores_erro
+        return resposta
@@ -1,11 +1,18 @@
 """Módulo de Consultas Multi-Banco (APS + AASI)"""
 import pyodbc
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from time import perf_counter
 import logging
-from config import get_connection_string, ENTIDADES_POR_SERVIDOR, SERVIDORES
-from formatador import converter_para_json
+from config import ENTIDADES_POR_SERVIDOR, SERVIDORES, TIMEOUT_CONEXAO, TIMEOUT_QUERY
+from formatador import nomes_exibicao
+from leitor_cursor import ler_dataframe
+from pool_conexoes import pool_conexoes, PoolEsgotado
+from cancelamento import registro_cancelamento, ConsultaCancelada
+from executor_compartilhado import executor_consultas
+from template_sql import compilar
+from disjuntor import registro_disjuntores, MENSAGEM_INDISPONIVEL
+from metricas import registro_metricas, cronometrar
 
 logger = logging.getLogger(__name__)
 TIMEOUT_GLOBAL = 300  # 5 minutos
@@ -19,94 +26,115 @@ class ConsultaMultiBanco:
         self.entidades_por_servidor = ENTIDADES_POR_SERVIDOR
 
     def _executar_query(self, servidor: str, query: str, database: str,
-                        log_callback=None) -> tuple:
-        """Executa query em um servidor/banco com timeout"""
+                        log_callback=None, request_id: str = None, parametros: list = None,
+                        consulta: str = 'multi_banco') -> tuple:
+        """Executa query (parametrizada com ?) em um servidor/banco com timeout"""
+        if not registro_disjuntores.permitir(servidor):
+            if log_callback:
+                log_callback(f"🔌 {database} {servidor}: indisponível (circuito aberto), ignorado")
+            return (servidor, False, pd.DataFrame(), MENSAGEM_INDISPONIVEL)
+        
+        conectado, tempos = False, {}
         try:
             if log_callback:
                 log_callback(f"📌 {database} {servidor}...")
             
-            conn_str = get_connection_string(servidor, database)
-            
-            with pyodbc.connect(conn_str, timeout=60) as conn:
-                conn.timeout = 180  # 3 minutos para execução
+            conectando = perf_counter()
+            with pool_conexoes.conexao(servidor, database, TIMEOUT_CONEXAO) as conn:
+                tempos['conexao'] = perf_counter() - conectando
+                conectado = True
+                registro_disjuntores.sucesso(servidor)
+                conn.timeout = TIMEOUT_QUERY  # 3 minutos para execução
                 
                 cursor = conn.cursor()
-                cursor.execute(query)
-                
-                colunas = [col[0] for col in cursor.description] if cursor.description else []
-                rows = cursor.fetchall()
-                df = pd.DataFrame.from_records(rows, columns=colunas)
+                with registro_cancelamento.registrar(request_id, cursor, servidor):
+                    with cronometrar(tempos, 'execucao'):
+                        cursor.execute(query, parametros) if parametros else cursor.execute(query)
+                    df, aviso = ler_dataframe(cursor, tempos=tempos)
                 cursor.close()
                 
                 if log_callback:
                     log_callback(f"✅ {database} {servidor}: {len(df)} linhas")
+                    if aviso:
+                        log_callback(f"⚠️ {database} {servidor}: {aviso}")
                 
-                return (servidor, True, df, None)
+                return (servidor, True, df, aviso)
+        
+        except ConsultaCancelada:
+            if log_callback:
+                log_callback(f"⛔ {database} {servidor}: cancelado")
+            return (servidor, False, pd.DataFrame(), "Cancelado")
         
         except pyodbc.OperationalError as e:
+            if not conectado and not isinstance(e, PoolEsgotado):
+                registro_disjuntores.falha(servidor, database, e)
             msg = "Timeout" if "timeout" in str(e).lower() else str(e)[:50]
             if log_callback:
                 log_callback(f"⏱️ {database} {servidor}: {msg}")
             return (servidor, False, pd.DataFrame(), msg)
         
         except Exception as e:
+            if not conectado:
+                registro_disjuntores.falha(servidor, database, e)
             if log_callback:
                 log_callback(f"❌ {database} {servidor}: {str(e)[:50]}")
             return (servidor, False, pd.DataFrame(), str(e))
-
-    def _gerar_entidades_sql(self, servidor: str) -> str:
-        """Gera SET statements para entidades"""
-        entidades = self.entidades_por_servidor.get(servidor, [])
-        sql = ""
-        for i in range(8):
-            val = f"'{entidades[i]}'" if i < len(entidades) else "NULL"
-            sql += f"    SET @Entidade{i+1} = {val}\n"
-        return sql
+        
+        finally:
+            registro_metricas.observar_etapas('consultas_servidor_segundos', tempos,
+                                              tipo=f"{consulta}/{database}", servidor=servidor)
 
     def executar_conferencia_13(self, ano: int, periodo: int, config: dict,
-                                 cancelado_callback=None, log_callback=None) -> dict:
+                                 cancelado_callback=None, log_callback=None,
+                                 request_id: str = None) -> dict:
         """Executa Conferência 13º em Mineiracao_APS + AASI"""
         inicio = perf_counter()
         if log_callback:
             log_callback(f"🔍 Conferência 13º: Ano {ano}, Período {periodo}")
         
-        query_aps = config['query_aps'].format(ano=ano, periodo=periodo)
-        query_aasi_tpl = config['query_aasi'].replace('{ano}', str(ano)).replace('{periodo}', str(periodo))
+        # Templates compilados: mesmo SQL em todos os servidores, valores como parâmetros
+        compiladas = config.get('compiladas') or {k: compilar(config[k]) for k in ('query_aps', 'query_aasi')}
+        query_aps, params_aps = compiladas['query_aps'].com({'ano': ano, 'periodo': periodo})
         
         resultados_aps, resultados_aasi, erros = [], [], []
         
-        with ThreadPoolExecutor(max_workers=16) as executor:
-            # Mineiracao_APS: apenas 10.31.11.2
-            futures = {
-                executor.submit(self._executar_query, '10.31.11.2', query_aps, 'Mineiracao_APS', log_callback): 'Mineiracao_APS'
-            }
-            
-            # AASI: todos os servidores
-            for srv in self.servidores:
-                query = query_aasi_tpl.replace('{entidades}', self._gerar_entidades_sql(srv))
-                futures[executor.submit(self._executar_query, srv, query, 'AASI', log_callback)] = srv
+        # Mineiracao_APS: apenas 10.31.11.2
+        futures = {
+            executor_consultas.submit('10.31.11.2', request_id, self._executar_query, '10.31.11.2',
+                                      query_aps, 'Mineiracao_APS', log_callback, request_id,
+                                      params_aps, 'conferencia_13'): 'Mineiracao_APS'
+        }
+        
+        # AASI: todos os servidores
+        for srv in self.servidores:
+            query, params = compiladas['query_aasi'].com({'ano': ano, 'periodo': periodo,
+                                                          'entidades': self.entidades_por_servidor.get(srv, [])})
+            futures[executor_consultas.submit(srv, request_id, self._executar_query, srv, query, 'AASI',
+                                              log_callback, request_id, params, 'conferencia_13')] = srv
+        
+        for future in as_completed(futures, timeout=TIMEOUT_GLOBAL):
+            # Verificar cancelamento
+            if cancelado_callback and cancelado_callback():
+                if log_callback:
+                    log_callback("⛔ Cancelando consultas pendentes...")
+                for f in futures:
+                    f.cancel()
+                break
             
-            for future in as_completed(futures, timeout=TIMEOUT_GLOBAL):
-                # Verificar cancelamento
-                if cancelado_callback and cancelado_callback():
-                    if log_callback:
-                        log_callback("⛔ Cancelando consultas pendentes...")
-                    for f in futures:
-                        f.cancel()
-                    break
-                
-                origem = futures[future]
-                try:
-                    _, sucesso, df, erro = future.result(timeout=5)
-                    if sucesso and not df.empty:
-                        if origem == 'Mineiracao_APS':
-                            resultados_aps.append(df)
-                        else:
-                            resultados_aasi.append(df)
-                    elif erro:
+            origem = futures[future]
+            try:
+                _, sucesso, df, erro = future.result(timeout=5)
+                if sucesso and not df.empty:
+                    if origem == 'Mineiracao_APS':
+                        resultados_aps.append(df)
+                    else:
+                        resultados_aasi.append(df)
+                    if erro:  # Sucesso parcial (truncado)
                         erros.append(f"{origem}: {erro}")
-                except Exception as e:
-                    erros.append(f"{origem}: {str(e)}")
+                elif erro:
+                    erros.append(f"{origem}: {erro}")
+            except Exception as e:
+                erros.append(f"{origem}: {str(e)}")
         
         # Consolidar
         df_aps = pd.concat(resultados_aps, ignore_index=True) if resultados_aps else pd.DataFrame()
@@ -116,13 +144,9 @@ class ConsultaMultiBanco:
         df_final = self._merge_aps_aasi(df_aps, df_aasi)
         tempo = perf_counter() - inicio
         
-        # Formatar dados
-        dados, colunas = converter_para_json(df_final)
-        
         return {
             'status': 'sucesso' if not df_final.empty else 'erro',
-            'dados': dados,
-            'colunas': colunas,
+            'colunas': nomes_exibicao(df_final.columns),
             'linhas_afetadas': len(df_final),
             'linhas_aps': len(df_aps),
             'linhas_aasi': len(df_aasi),
@@ -171,27 +195,31 @@ class ConsultaMultiBanco:
         if log_callback:
             log_callback(f"🔍 Conta Verbas APS: {len(self.servidores)} servidores...")
         
-        query = config['sql_template'].format(ano=ano)
+        query, params = compilar(config['sql_template']).com({'ano': ano})
         resultados, erros = [], []
         servidores_ok = 0
         
-        with ThreadPoolExecutor(max_workers=len(self.servidores)) as executor:
-            futures = {
-                executor.submit(self._executar_query, srv, query, 'APS', log_callback): srv
-                for srv in self.servidores
-            }
-            
-            try:
-                for future in as_completed(futures, timeout=TIMEOUT_GLOBAL):
-                    _, sucesso, df, erro = future.result(timeout=5)
-                    if sucesso and not df.empty:
-                        resultados.append(df)
-                        servidores_ok += 1
-                    elif erro:
+        futures = {
+            executor_consultas.submit(srv, None, self._executar_query, srv, query, 'APS', log_callback,
+                                      None, params, 'conta_verbas_aps'): srv
+            for srv in self.servidores
+        }
+        
+        try:
+            for future in as_completed(futures, timeout=TIMEOUT_GLOBAL):
+                _, sucesso, df, erro = future.result(timeout=5)
+                if sucesso and not df.empty:
+                    resultados.append(df)
+                    servidores_ok += 1
+                    if erro:  # Sucesso parcial (truncado)
                         erros.append(erro)
-            except TimeoutError:
-                if log_callback:
-                    log_callback(f"⏱️ Timeout global")
+                elif erro:
+                    erros.append(erro)
+        except TimeoutError:
+            if log_callback:
+                log_callback(f"⏱️ Timeout global")
+            for f in futures:
+                f.cancel()  # Libera a fila do executor compartilhado
         
         df_final = pd.concat(resultados, ignore_index=True) if resultados else pd.DataFrame()
         tempo = perf_counter() - inicio
@@ -199,13 +227,9 @@ class ConsultaMultiBanco:
         if log_callback:
             log_callback(f"✅ {len(df_final)} linhas de {servidores_ok} servidores em {tempo:.2f}s")
         
-        # Formatar dados
-        dados, colunas = converter_para_json(df_final)
-        
         return {
             'status': 'sucesso' if resultados else 'erro',
-            'dados': dados,
-            'colunas': colunas,
+            'colunas': nomes_exibicao(df_final.columns),
             'linhas_afetadas': len(df_final),
             'servidores_processados': servidores_ok,
             'tempo_total': round(tempo, 2),
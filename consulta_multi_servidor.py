@@ -1,14 +1,85 @@
 """Módulo de Consultas Multi-Servidor"""
 import pyodbc
 import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from time import perf_counter
 import logging
-from config import get_connection_string, ENTIDADES_POR_SERVIDOR, SERVIDORES
-from formatador import converter_para_json
+from config import ENTIDADES_POR_SERVIDOR, SERVIDORES, TIMEOUT_CONEXAO, TIMEOUT_QUERY, MOTOR_CONSULTA
+from formatador import nomes_exibicao
+from leitor_cursor import ler_dataframe, ler_resultados
+from pool_conexoes import pool_conexoes, PoolEsgotado
+from cancelamento import registro_cancelamento, ConsultaCancelada
+from executor_compartilhado import executor_consultas
+from consolidador import ConsolidadorIncremental
+from template_sql import ConsultaCompilada, compilar, juntar_lote
+from latencia import registro_latencia
+from disjuntor import registro_disjuntores, MENSAGEM_INDISPONIVEL
+from metricas import registro_metricas, cronometrar, arredondar
 
 logger = logging.getLogger(__name__)
-TIMEOUT_GLOBAL = 300  # 5 minutos
+TIMEOUT_GLOBAL = 300  # 5 minutos (sem histórico de latência)
+
+
+class _Lote:
+    """Estado de um executar_lote: batch de cada servidor, consolidação e falhas por consulta"""
+
+    def __init__(self, consultas: dict, queries: dict, parciais: dict = None, linhas_callback: dict = None):
+        self.consultas = consultas
+        self.queries = queries
+        self.linhas_callback = linhas_callback or {}
+        parciais = {tipo: dict((parciais or {}).get(tipo) or {}) for tipo in consultas}
+        
+        # Por servidor, só as consultas que ainda faltam (retentativa)
+        self.lotes = {}
+        for srv in dict.fromkeys(srv for qs in queries.values() for srv in qs):
+            tipos = [t for t in consultas if srv in queries[t] and srv not in parciais[t]]
+            if tipos:
+                self.lotes[srv] = tipos
+        
+        self.consolidadores, self.ok, self.erros = {}, {}, {}
+        for tipo, (config, _) in consultas.items():
+            self.consolidadores[tipo] = ConsolidadorIncremental(
+                deduplicar=bool(config and config.get('subcontas_por_entidade')),
+                chaves=(config or {}).get('chaves_deduplicacao'))
+            for srv, df in parciais[tipo].items():
+                self.consolidadores[tipo].adicionar(srv, df)
+            self.ok[tipo] = sum(1 for df in parciais[tipo].values() if not df.empty)
+            self.erros[tipo] = []
+        self.servidores_timeout, self.servidores_erro = [], []
+        self.tempos_servidores = {srv: {} for srv in self.lotes}
+        self.tempos_etapas = {tipo: {} for tipo in consultas}
+
+    def batch(self, servidor: str) -> tuple:
+        """(sql, tipos, parâmetros) do batch do servidor"""
+        tipos = self.lotes[servidor]
+        sqls, params = zip(*(self.queries[t][servidor] for t in tipos))
+        return juntar_lote(sqls), tipos, [p for ps in params for p in ps]
+
+    def receber(self, servidor: str, sucesso: bool, dfs: dict, erro: str = None):
+        """Resultado de _executar_lote: um DataFrame por consulta entra no consolidado de cada uma"""
+        if not sucesso:
+            (self.servidores_timeout if erro == "Timeout" else self.servidores_erro).append(servidor)
+            self._erro(servidor, erro)
+            return
+        for tipo, df in dfs.items():
+            with cronometrar(self.tempos_etapas[tipo], 'consolidacao'):
+                adicionado = self.consolidadores[tipo].adicionar(servidor, df)
+            if adicionado and tipo in self.linhas_callback:
+                self.linhas_callback[tipo](servidor, self.consolidadores[tipo].linhas_de(servidor))
+            if not df.empty:
+                self.ok[tipo] += 1
+        if erro:  # Sucesso parcial (truncado)
+            self._erro(servidor, erro)
+
+    def falhou(self, servidor: str, erro: str = None):
+        """Servidor sem resposta (exceção ou timeout global)"""
+        self.servidores_timeout.append(servidor)
+        if erro:
+            self._erro(servidor, erro)
+
+    def _erro(self, servidor: str, erro: str):
+        for tipo in self.lotes[servidor]:
+            self.erros[tipo].append(f"{servidor}: {erro}")
 
 
 class ConsultaMultiServidor:
@@ -19,168 +90,385 @@ class ConsultaMultiServidor:
         self.entidades_por_servidor = ENTIDADES_POR_SERVIDOR
 
     def _executar_query(self, servidor: str, query: str, database: str = "AASI", 
-                        log_callback=None) -> tuple:
-        """Executa query em um servidor com timeout"""
+                        log_callback=None, request_id: str = None, parametros: list = None,
+                        consulta: str = 'avulsa', tempos: dict = None) -> tuple:
+        """
+        Executa query (parametrizada com ?) em um servidor com timeout.
+        tempos: recebe as etapas em segundos (conexao, execucao, leitura, dataframe).
+        """
+        if not self._disponivel(servidor, log_callback):
+            return (servidor, False, pd.DataFrame(), MENSAGEM_INDISPONIVEL)
+        
+        tempos = {} if tempos is None else tempos
+        inicio = None
         try:
             if log_callback:
                 log_callback(f"📌 Conectando {servidor}...")
             
-            conn_str = get_connection_string(servidor, database)
-            
-            # Timeout de conexão: 60s, timeout de query: 180s (3 min)
-            with pyodbc.connect(conn_str, timeout=60) as conn:
-                conn.timeout = 180  # Timeout para execução de query
+            # Conexão reaproveitada do pool; timeout de query pelo histórico do servidor (ou 180s)
+            conectando = perf_counter()
+            with pool_conexoes.conexao(servidor, database, TIMEOUT_CONEXAO) as conn:
+                tempos['conexao'] = perf_counter() - conectando
+                registro_disjuntores.sucesso(servidor)
+                conn.timeout = registro_latencia.timeout(servidor, consulta, TIMEOUT_QUERY)
+                inicio = perf_counter()
                 
                 cursor = conn.cursor()
-                cursor.execute(query)
-                
-                # Ler colunas
-                colunas = [col[0] for col in cursor.description] if cursor.description else []
-                
-                # Ler dados
-                rows = cursor.fetchall()
-                df = pd.DataFrame.from_records(rows, columns=colunas)
+                # Cursor registrado para que /api/cancelar interrompa a query no servidor
+                with registro_cancelamento.registrar(request_id, cursor, servidor):
+                    with cronometrar(tempos, 'execucao'):
+                        cursor.execute(query, parametros) if parametros else cursor.execute(query)
+                    
+                    # Ler dados em lotes (aviso != None se truncado pelo limite)
+                    df, aviso = ler_dataframe(cursor, tempos=tempos)
                 
                 cursor.close()
+                registro_latencia.registrar(servidor, consulta, perf_counter() - inicio, len(df))
                 
                 if log_callback:
                     log_callback(f"✅ {servidor}: {len(df)} linhas")
+                    if aviso:
+                        log_callback(f"⚠️ {servidor}: {aviso}")
                 
-                return (servidor, True, df, None)
+                return (servidor, True, df, aviso)
         
-        except pyodbc.OperationalError as e:
+        except Exception as e:
+            msg = self._mensagem_erro(servidor, e, log_callback)
+            if inicio is None:
+                self._falha_conexao(servidor, database, e)
+            elif msg == "Timeout":  # Timeout da query (não da conexão)
+                registro_latencia.registrar(servidor, consulta, perf_counter() - inicio)
+            return (servidor, False, pd.DataFrame(), msg)
+        
+        finally:
+            registro_metricas.observar_etapas('consultas_servidor_segundos', tempos,
+                                              tipo=consulta, servidor=servidor)
+
+    def _disponivel(self, servidor: str, log_callback=None) -> bool:
+        """Circuito aberto (servidor fora do ar): falha na hora em vez de esperar a conexão"""
+        if registro_disjuntores.permitir(servidor):
+            return True
+        if log_callback:
+            log_callback(f"🔌 {servidor}: indisponível (circuito aberto), ignorado")
+        return False
+
+    @staticmethod
+    def _falha_conexao(servidor: str, database: str, e: Exception):
+        """Erro de rede antes de obter a conexão alimenta o disjuntor (pool esgotado/cancelamento não)"""
+        if not isinstance(e, (ConsultaCancelada, PoolEsgotado)):
+            registro_disjuntores.falha(servidor, database, e)
+
+    def _mensagem_erro(self, servidor: str, e: Exception, log_callback=None) -> str:
+        """Loga a falha de um servidor e devolve a mensagem curta para `avisos`"""
+        if isinstance(e, ConsultaCancelada):
+            if log_callback:
+                log_callback(f"⛔ {servidor}: cancelado")
+            return "Cancelado"
+        
+        if isinstance(e, pyodbc.OperationalError):
             msg = "Timeout" if "timeout" in str(e).lower() else str(e)[:50]
             if log_callback:
                 log_callback(f"⏱️ {servidor}: {msg}")
-            return (servidor, False, pd.DataFrame(), msg)
+            return msg
         
-        except Exception as e:
+        if log_callback:
+            log_callback(f"❌ {servidor}: {str(e)[:50]}")
+        logger.error(f"❌ {servidor}: {e}")
+        return str(e)
+
+    def _executar_lote(self, servidor: str, query: str, tipos: list, log_callback=None,
+                       request_id: str = None, parametros: list = None, tempos: dict = None) -> tuple:
+        """Executa um batch com uma consulta por tipo (uma ida ao servidor); df = {tipo: DataFrame}"""
+        if not self._disponivel(servidor, log_callback):
+            return (servidor, False, {}, MENSAGEM_INDISPONIVEL)
+        
+        tempos = {} if tempos is None else tempos
+        consulta, inicio = '+'.join(tipos), None
+        try:
             if log_callback:
-                log_callback(f"❌ {servidor}: {str(e)[:50]}")
-            logger.error(f"❌ {servidor}: {e}")
-            return (servidor, False, pd.DataFrame(), str(e))
+                log_callback(f"📌 Conectando {servidor} ({len(tipos)} consultas em lote)...")
+            
+            conectando = perf_counter()
+            with pool_conexoes.conexao(servidor, "AASI", TIMEOUT_CONEXAO) as conn:
+                tempos['conexao'] = perf_counter() - conectando
+                registro_disjuntores.sucesso(servidor)
+                conn.timeout = registro_latencia.timeout(servidor, consulta, TIMEOUT_QUERY)
+                inicio = perf_counter()
+                
+                cursor = conn.cursor()
+                with registro_cancelamento.registrar(request_id, cursor, servidor):
+                    with cronometrar(tempos, 'execucao'):
+                        cursor.execute(query, parametros) if parametros else cursor.execute(query)
+                    lidos = ler_resultados(cursor, len(tipos), tempos=tempos)
+                
+                cursor.close()
+            registro_latencia.registrar(servidor, consulta, perf_counter() - inicio,
+                                        sum(len(df) for df, _ in lidos))
+            
+            dfs = {tipo: df for tipo, (df, _) in zip(tipos, lidos)}
+            avisos = [f"{tipo}: {aviso}" for tipo, (_, aviso) in zip(tipos, lidos) if aviso]
+            if log_callback:
+                log_callback(f"✅ {servidor}: " + ", ".join(f"{t} {len(df)}" for t, df in dfs.items()) + " linhas")
+                for aviso in avisos:
+                    log_callback(f"⚠️ {servidor}: {aviso}")
+            
+            return (servidor, True, dfs, "; ".join(avisos) or None)
+        
+        except Exception as e:
+            msg = self._mensagem_erro(servidor, e, log_callback)
+            if inicio is None:
+                self._falha_conexao(servidor, "AASI", e)
+            elif msg == "Timeout":
+                registro_latencia.registrar(servidor, consulta, perf_counter() - inicio)
+            return (servidor, False, {}, msg)
+        
+        finally:
+            registro_metricas.observar_etapas('consultas_servidor_segundos', tempos,
+                                              tipo=consulta, servidor=servidor)
 
-    def executar_consulta_simultanea(self, query: str, servidores: list = None,
+    def executar_consulta_simultanea(self, query, servidores: list = None,
                                       config_consulta: dict = None, 
-                                      log_callback=None, cancelado_callback=None) -> dict:
-        """Executa query em múltiplos servidores"""
+                                      log_callback=None, cancelado_callback=None,
+                                      parciais: dict = None, request_id: str = None,
+                                      linhas_callback=None, parametros: dict = None) -> dict:
+        """
+        Executa query em múltiplos servidores.
+        query: ConsultaCompilada (ou template/SQL em texto, compilado aqui) e parametros
+        os valores dos placeholders ({ano}, {periodo}...); entidades/subcontas vêm do config.
+        parciais: {servidor: df} já obtidos numa execução anterior - esses
+        servidores não são consultados de novo (retentativa só dos que falharam).
+        request_id: permite que registro_cancelamento.cancelar() interrompa as queries.
+        linhas_callback(servidor, df): chamado com as linhas de cada servidor assim que chegam.
+        """
         inicio = perf_counter()
         servidores = servidores or self.servidores
         
         # Preparar queries por servidor
-        queries = self._preparar_queries(query, config_consulta)
+        queries = self._preparar_queries(query, config_consulta, parametros)
         servidores = list(queries.keys()) if queries else servidores
         
+        # Reaproveitar resultados de servidores que já responderam
+        parciais = dict(parciais or {})
+        reaproveitados = [srv for srv in servidores if srv in parciais]
+        pendentes = [srv for srv in servidores if srv in queries and srv not in parciais]
+        
         if log_callback:
-            log_callback(f"🔍 Consultando {len(servidores)} servidores...")
+            if reaproveitados:
+                log_callback(f"♻️ Reaproveitando {len(reaproveitados)} servidores da execução anterior")
+            log_callback(f"🔍 Consultando {len(pendentes)} servidores...")
         
-        resultados, erros = [], []
-        servidores_ok, servidores_timeout, servidores_erro = 0, [], []
+        # Cada resultado entra no consolidado assim que chega (sem lista de frames + concat no fim)
+        consolidador = ConsolidadorIncremental(
+            deduplicar=bool(config_consulta and config_consulta.get('subcontas_por_entidade')),
+            chaves=(config_consulta or {}).get('chaves_deduplicacao'))
+        for srv in reaproveitados:
+            consolidador.adicionar(srv, parciais[srv])
+        erros = []
+        servidores_ok = sum(1 for srv in reaproveitados if not parciais[srv].empty)
+        servidores_timeout, servidores_erro = [], []
         
-        with ThreadPoolExecutor(max_workers=len(servidores)) as executor:
-            futures = {
-                executor.submit(self._executar_query, srv, queries.get(srv, query), 
-                              "AASI", log_callback): srv
-                for srv in servidores if srv in queries
-            }
-            
-            try:
-                for future in as_completed(futures, timeout=TIMEOUT_GLOBAL):
-                    # Verificar cancelamento
-                    if cancelado_callback and cancelado_callback():
-                        if log_callback:
-                            log_callback("⛔ Cancelando consultas pendentes...")
-                        for f in futures:
-                            f.cancel()
-                        break
-                    
-                    servidor = futures[future]
-                    try:
-                        _, sucesso, df, erro = future.result(timeout=5)
-                        if sucesso and not df.empty:
-                            resultados.append(df)
-                            servidores_ok += 1
-                        elif erro:
-                            erros.append(f"{servidor}: {erro}")
-                            servidores_erro.append(servidor)
-                    except Exception as e:
-                        erros.append(f"{servidor}: {str(e)}")
-                        servidores_timeout.append(servidor)
-                        
-            except TimeoutError:
-                if log_callback:
-                    log_callback(f"⏱️ Timeout global ({TIMEOUT_GLOBAL}s)")
-                for f in futures:
-                    if not f.done():
-                        servidores_timeout.append(futures[f])
+        # Prazo do fan-out pelo histórico dos servidores pendentes (sem histórico: TIMEOUT_GLOBAL)
+        nome = (config_consulta or {}).get('id', 'avulsa')
+        prazo = registro_latencia.timeout_global([(srv, nome) for srv in pendentes], TIMEOUT_GLOBAL)
+        
+        # Executor compartilhado: limite de statements por servidor e rodízio entre requisições
+        tempos_servidores = {srv: {} for srv in pendentes}
+        futures = {
+            executor_consultas.submit(srv, request_id, self._executar_query, srv, queries[srv][0],
+                                      "AASI", log_callback, request_id, queries[srv][1], nome,
+                                      tempos_servidores[srv]): srv
+            for srv in pendentes
+        }
+        tempos_etapas = {}
+        
+        try:
+            for future in as_completed(futures, timeout=prazo):
+                # Verificar cancelamento
+                if cancelado_callback and cancelado_callback():
+                    if log_callback:
+                        log_callback("⛔ Cancelando consultas pendentes...")
+                    for f in futures:
                         f.cancel()
+                    break
+                
+                servidor = futures[future]
+                try:
+                    _, sucesso, df, erro = future.result()
+                    if sucesso:
+                        with cronometrar(tempos_etapas, 'consolidacao'):
+                            adicionado = consolidador.adicionar(servidor, df)
+                        if adicionado and linhas_callback:
+                            linhas_callback(servidor, consolidador.linhas_de(servidor))
+                    if sucesso and not df.empty:
+                        servidores_ok += 1
+                        if erro:  # Sucesso parcial (truncado)
+                            erros.append(f"{servidor}: {erro}")
+                    elif erro:
+                        erros.append(f"{servidor}: {erro}")
+                        servidores_erro.append(servidor)
+                except Exception as e:
+                    erros.append(f"{servidor}: {str(e)}")
+                    servidores_timeout.append(servidor)
+                    
+        except TimeoutError:
+            if log_callback:
+                log_callback(f"⏱️ Timeout global ({prazo}s)")
+            for f in futures:
+                if not f.done():
+                    servidores_timeout.append(futures[f])
+                    f.cancel()
         
         # Consolidar
-        df_final = pd.concat(resultados, ignore_index=True) if resultados else pd.DataFrame()
-        
-        if config_consulta and config_consulta.get('subcontas_por_entidade') and not df_final.empty:
-            df_final = df_final.drop_duplicates()
+        with cronometrar(tempos_etapas, 'consolidacao'):
+            df_final = consolidador.tabela()
         
         tempo = perf_counter() - inicio
         
         if log_callback:
             log_callback(f"✅ Concluído: {len(df_final)} linhas em {tempo:.2f}s")
         
-        return self._formatar_resposta(df_final, servidores_ok, len(servidores),
-                                       servidores_timeout, servidores_erro, erros, tempo)
+        resposta = self._formatar_resposta(df_final, servidores_ok, len(servidores),
+                                           servidores_timeout, servidores_erro, erros, tempo)
+        resposta['metricas'] = self._metricas(nome, tempos_servidores, tempos_etapas)
+        # Para retentativa: DataFrames por servidor e quem ficou de fora
+        resposta['parciais'] = consolidador.por_servidor()
+        resposta['servidores_falhos'] = servidores_timeout + servidores_erro
+        return resposta
 
-    def _preparar_queries(self, query_template: str, config: dict) -> dict:
-        """Prepara queries específicas por servidor"""
+    def executar_lote(self, consultas: dict, log_callback=None, cancelado_callback=None,
+                      parciais: dict = None, request_id: str = None,
+                      linhas_callback: dict = None, parametros: dict = None) -> dict:
+        """
+        Várias consultas num único batch por servidor (cursor.nextset() entre os resultados):
+        cada servidor é visitado uma vez e devolve um DataFrame por consulta.
+        consultas: {tipo: (config, query)}; parciais/linhas_callback: {tipo: ...} como em
+        executar_consulta_simultanea. Retorna {tipo: resposta}.
+        """
+        inicio = perf_counter()
+        lote = self._preparar_lote(consultas, parciais, linhas_callback, parametros, log_callback)
+        prazo = registro_latencia.timeout_global([(srv, '+'.join(t)) for srv, t in lote.lotes.items()],
+                                                 TIMEOUT_GLOBAL)
+        futures = {}
+        for srv in lote.lotes:
+            sql, tipos, params = lote.batch(srv)
+            futures[executor_consultas.submit(srv, request_id, self._executar_lote, srv, sql, tipos,
+                                              log_callback, request_id, params,
+                                              lote.tempos_servidores[srv])] = srv
+        
+        try:
+            for future in as_completed(futures, timeout=prazo):
+                if cancelado_callback and cancelado_callback():
+                    if log_callback:
+                        log_callback("⛔ Cancelando consultas pendentes...")
+                    for f in futures:
+                        f.cancel()
+                    break
+                
+                try:
+                    lote.receber(*future.result())
+                except Exception as e:
+                    lote.falhou(futures[future], str(e))
+        
+        except TimeoutError:
+            if log_callback:
+                log_callback(f"⏱️ Timeout global ({prazo}s)")
+            for f in futures:
+                if not f.done():
+                    lote.falhou(futures[f])
+                    f.cancel()
+        
+        return self._respostas_lote(lote, perf_counter() - inicio, log_callback)
+
+    def _preparar_lote(self, consultas: dict, parciais: dict, linhas_callback: dict, parametros: dict,
+                       log_callback=None) -> '_Lote':
+        queries = {tipo: self._preparar_queries(query, config, parametros)
+                   for tipo, (config, query) in consultas.items()}
+        lote = _Lote(consultas, queries, parciais, linhas_callback)
+        if log_callback:
+            log_callback(f"📦 Lote: {len(consultas)} consultas, {len(lote.lotes)} servidores (uma ida por servidor)")
+        return lote
+
+    def _respostas_lote(self, lote: '_Lote', tempo: float, log_callback=None) -> dict:
+        """{tipo: resposta} no mesmo formato de executar_consulta_simultanea"""
+        respostas = {}
+        for tipo in lote.consultas:
+            with cronometrar(lote.tempos_etapas[tipo], 'consolidacao'):
+                df_final = lote.consolidadores[tipo].tabela()
+            falhos = [srv for srv in lote.servidores_timeout + lote.servidores_erro
+                      if tipo in lote.lotes.get(srv, [])]
+            if log_callback:
+                log_callback(f"✅ {tipo}: {len(df_final)} linhas em {tempo:.2f}s")
+            respostas[tipo] = self._formatar_resposta(
+                df_final, lote.ok[tipo], len(lote.queries[tipo]),
+                [s for s in lote.servidores_timeout if s in falhos],
+                [s for s in lote.servidores_erro if s in falhos],
+                lote.erros[tipo], tempo)
+            respostas[tipo]['parciais'] = lote.consolidadores[tipo].por_servidor()
+            respostas[tipo]['servidores_falhos'] = falhos
+            # Tempos por servidor são do batch inteiro (compartilhado entre as consultas do lote)
+            respostas[tipo]['metricas'] = self._metricas(
+                tipo, {srv: t for srv, t in lote.tempos_servidores.items() if tipo in lote.lotes[srv]},
+                lote.tempos_etapas[tipo])
+        return respostas
+
+    @staticmethod
+    def _metricas(tipo: str, tempos_servidores: dict, tempos_etapas: dict) -> dict:
+        """Bloco 'metricas' da resposta; as etapas da requisição também vão para o histograma"""
+        registro_metricas.observar_etapas('consultas_etapa_segundos', tempos_etapas, tipo=tipo)
+        return {'tipo': tipo,
+                'servidores': {srv: arredondar(t) for srv, t in tempos_servidores.items()},
+                **arredondar(tempos_etapas)}
+
+    def _preparar_queries(self, query, config: dict, parametros: dict = None) -> dict:
+        """
+        {servidor: (sql, parâmetros)} - o texto SQL é o mesmo em todos os servidores
+        (plano reaproveitado); entidades e subcontas de cada um vão como parâmetros
+        """
+        if not isinstance(query, ConsultaCompilada):
+            query = compilar(query)
+        valores = dict(parametros or {})
         if not config:
-            return {srv: query_template for srv in self.servidores}
+            return {srv: query.com(valores) for srv in self.servidores}
         
         queries = {}
         entidades_config = config.get('entidades_por_servidor', self.entidades_por_servidor)
         subcontas = config.get('subcontas_por_entidade', {})
         
         for servidor, entidades in entidades_config.items():
-            # Gerar SET @Entidade
-            ent_set = ""
-            for i in range(8):
-                val = f"'{entidades[i]}'" if i < len(entidades) else "NULL"
-                ent_set += f"    SET @Entidade{i+1} = {val}\n"
-            
-            query = query_template.replace('{entidades}', ent_set)
-            query = query.replace('{entidades_set}', ent_set)
-            
-            # Subcontas
-            if subcontas:
-                subs = set()
-                for ent in entidades:
-                    subs.update(subcontas.get(ent, []))
-                query = query.replace('{subcontas}', ",".join(f"'{s}'" for s in subs) or "''")
-            
-            queries[servidor] = query
+            subs = set()
+            for ent in entidades:
+                subs.update(subcontas.get(ent, []))
+            queries[servidor] = query.com({**valores, 'entidades': entidades, 'subcontas': sorted(subs)})
         
         return queries
 
     def _formatar_resposta(self, df: pd.DataFrame, ok: int, total: int,
                            timeout: list, erro: list, avisos: list, tempo: float) -> dict:
-        """Formata resposta padronizada"""
+        """Resposta padronizada com o DataFrame bruto (a formatação pt-BR fica para a exibição)"""
         if df.empty:
             return {
                 'status': 'erro' if ok == 0 else 'aviso',
-                'dados': [], 'colunas': [], 'linhas_afetadas': 0,
+                'colunas': [], 'linhas_afetadas': 0,
                 'servidores_processados': ok, 'servidores_total': total,
                 'tempo_total': round(tempo, 2),
                 'mensagem': f"0 linhas - {ok} ok, {len(timeout)} timeout, {len(erro)} erro",
                 'dataframe': df, 'avisos': avisos or None
             }
         
-        # Formatar dados (datas pt-BR, números com 2 casas, colunas em português)
-        dados, colunas = converter_para_json(df)
-        
         return {
             'status': 'sucesso',
-            'dados': dados, 'colunas': colunas,
+            'colunas': nomes_exibicao(df.columns),
             'linhas_afetadas': len(df),
             'servidores_processados': ok, 'servidores_total': total,
             'tempo_total': round(tempo, 2),
             'mensagem': f"{len(df)} linhas de {ok}/{total} servidores em {tempo:.2f}s",
             'dataframe': df, 'avisos': avisos or None
-        }
\ No newline at end of file
+        }
+
+
+def criar_consulta_multi_servidor() -> ConsultaMultiServidor:
+    """Instancia o motor configurado em MOTOR_CONSULTA (threads | asyncio)"""
+    if MOTOR_CONSULTA == 'asyncio':
+        from consulta_async import ConsultaMultiServidorAsync
+        return ConsultaMultiServidorAsync()
+    return ConsultaMultiServidor()
@@ -1,6 +1,7 @@
 """Configuração de Consultas SQL Pré-Definidas"""
 from datetime import datetime
 from config import ENTIDADES_POR_SERVIDOR
+from template_sql import compilar
 
 # Subcontas específicas para consultas de cartão
 SUBCONTAS_CARTAO = {
@@ -44,6 +45,7 @@ CONSULTAS_PREDEFINIDAS = {
         'requer_periodo': False,
         'requer_ano': False,
         'entidades_por_servidor': ENTIDADES_POR_SERVIDOR,
+        'cache_ttl': 300,  # segundos em cache (0 = sem cache)
         'sql_template': """
             SELECT l.entidade as Entidade, l.Type_Document as TipoLote,
                    l.code as NúmeroLote, l.char_0 as NomeLote, l.DataLote,
@@ -202,6 +204,7 @@ CONSULTAS_PREDEFINIDAS = {
         'requer_periodo': True,
         'requer_ano': True,
         'entidades_por_servidor': ENTIDADES_POR_SERVIDOR,
+        'cache_ttl': 600,
         'sql_template': """
             DECLARE @Entidade1 varchar(10), @Entidade2 varchar(10), @Entidade3 varchar(10)
             DECLARE @Entidade4 varchar(10), @Entidade5 varchar(10), @Entidade6 varchar(10)
@@ -292,6 +295,7 @@ CONSULTAS_PREDEFINIDAS = {
         'requer_saldo_anterior': True,
         'subcontas_por_entidade': SUBCONTAS_CARTAO,
         'entidades_por_servidor': ENTIDADES_RAZAO,
+        'cache_ttl': 600,
         'sql_template': """
             DECLARE @Entidade1 varchar(10), @Entidade2 varchar(10), @Entidade3 varchar(10)
             DECLARE @Entidade4 varchar(10), @Entidade5 varchar(10), @Entidade6 varchar(10)
@@ -336,6 +340,7 @@ CONSULTAS_PREDEFINIDAS = {
         'requer_saldo_anterior': True,
         'subcontas_por_entidade': SUBCONTAS_CARTAO,
         'entidades_por_servidor': ENTIDADES_RAZAO,
+        'cache_ttl': 600,
         'sql_template': """
             DECLARE @Entidade1 varchar(10), @Entidade2 varchar(10), @Entidade3 varchar(10)
             DECLARE @Entidade4 varchar(10), @Entidade5 varchar(10), @Entidade6 varchar(10)
@@ -381,6 +386,7 @@ CONSULTAS_PREDEFINIDAS = {
         'requer_saldo_anterior': True,
         'subcontas_por_entidade': SUBCONTAS_CARTAO,
         'entidades_por_servidor': ENTIDADES_RAZAO,
+        'cache_ttl': 600,
         'sql_template': """
             DECLARE @DataLimite DATE = CAST('{data_limite}' AS DATE)
             DECLARE @Entidade1 varchar(10), @Entidade2 varchar(10), @Entidade3 varchar(10)
@@ -414,6 +420,13 @@ CONSULTAS_PREDEFINIDAS = {
 }
 
 
+# Templates compilados uma vez na importação (SQL com ? + ordem dos parâmetros)
+for _tipo, _config in CONSULTAS_PREDEFINIDAS.items():
+    _config['id'] = _tipo  # Identifica a consulta no histórico de latência
+    _config['compiladas'] = {chave: compilar(_config[chave])
+                             for chave in ('sql_template', 'query_aps', 'query_aasi') if chave in _config}
+
+
 def obter_consulta(tipo: str) -> dict:
     """Retorna configuração de uma consulta pelo tipo"""
     return CONSULTAS_PREDEFINIDAS.get(tipo)
@@ -0,0 +1,135 @@
+"""Disjuntor por Servidor SQL: falha rápida para servidores fora do ar e sonda em segundo plano"""
+import logging
+import pyodbc
+from threading import Lock, Thread
+from time import sleep, time
+from config import get_connection_string, DISJUNTOR_FALHAS, DISJUNTOR_INTERVALO_SONDA, DISJUNTOR_TIMEOUT_SONDA
+
+logger = logging.getLogger(__name__)
+
+FECHADO, ABERTO, MEIO_ABERTO = 'fechado', 'aberto', 'meio_aberto'
+MENSAGEM_INDISPONIVEL = "Servidor indisponível (circuito aberto)"
+# SQLSTATEs de servidor inacessível: falha de conexão, link caído, timeout de login/conexão
+ESTADOS_REDE = ('08001', '08S01', 'HYT00', 'HYT01')
+
+
+def erro_de_rede(erro) -> bool:
+    """
+    True se o erro indica servidor inacessível. Login recusado (28000) e banco que não abre
+    (4060) são do banco/credencial, não do servidor: não contam para o circuito.
+    """
+    texto = str(erro)
+    return any(estado in texto for estado in ESTADOS_REDE)
+
+
+class RegistroDisjuntores:
+    """
+    Circuito por servidor alimentado pelo resultado de cada conexão:
+    - fechado: consultas normais; `falhas` erros de rede seguidos (ESTADOS_REDE) abrem o circuito
+    - aberto: consultas falham na hora (sem esperar o timeout de conexão)
+    - meio_aberto: a sonda está tentando conectar; sucesso fecha o circuito, falha reabre
+    A sonda roda numa thread própria enquanto houver circuito aberto.
+    """
+
+    def __init__(self, falhas: int = DISJUNTOR_FALHAS, intervalo_sonda: int = DISJUNTOR_INTERVALO_SONDA,
+                 timeout_sonda: int = DISJUNTOR_TIMEOUT_SONDA):
+        self.falhas = max(1, falhas)
+        self.intervalo_sonda = intervalo_sonda
+        self.timeout_sonda = timeout_sonda
+        self._circuitos = {}  # servidor -> {'estado', 'falhas', 'database', 'aberto_em', 'erro'}
+        self._lock = Lock()
+        self._sonda = None
+        self.stats = {'aberturas': 0, 'fechamentos': 0, 'rejeitadas': 0, 'sondas': 0}
+
+    def _circuito(self, servidor: str) -> dict:
+        """Estado do servidor (chamar com lock)"""
+        if servidor not in self._circuitos:
+            self._circuitos[servidor] = {'estado': FECHADO, 'falhas': 0, 'database': None,
+                                         'aberto_em': None, 'erro': None}
+        return self._circuitos[servidor]
+
+    def permitir(self, servidor: str) -> bool:
+        """False se o circuito do servidor não está fechado (a consulta deve falhar na hora)"""
+        with self._lock:
+            circuito = self._circuitos.get(servidor)
+            if circuito is None or circuito['estado'] == FECHADO:
+                return True
+            self.stats['rejeitadas'] += 1
+            return False
+
+    def sucesso(self, servidor: str):
+        """Conexão obtida: zera as falhas (e fecha o circuito, se estava aberto)"""
+        with self._lock:
+            circuito = self._circuitos.get(servidor)
+            if circuito is None:
+                return
+            if circuito['estado'] != FECHADO:
+                self.stats['fechamentos'] += 1
+                logger.info(f"🔌 {servidor}: respondeu de novo, circuito fechado")
+            circuito.update(estado=FECHADO, falhas=0, aberto_em=None, erro=None)
+
+    def falha(self, servidor: str, database: str, erro):
+        """
+        Erro ao conectar. Só conta se for de rede: login/banco inválido num database não pode
+        derrubar as consultas dos outros bancos do mesmo servidor.
+        """
+        if not erro_de_rede(erro):
+            return
+        erro = str(erro)
+        with self._lock:
+            circuito = self._circuito(servidor)
+            circuito['falhas'] += 1
+            circuito.update(database=database, erro=erro[:200])
+            if circuito['estado'] == FECHADO and circuito['falhas'] >= self.falhas:
+                circuito.update(estado=ABERTO, aberto_em=time())
+                self.stats['aberturas'] += 1
+                logger.warning(f"🔌 {servidor}: circuito aberto após {circuito['falhas']} falhas de conexão")
+                self._iniciar_sonda()
+
+    def _iniciar_sonda(self):
+        """Sobe a thread da sonda se não estiver rodando (chamar com lock)"""
+        if self._sonda is None or not self._sonda.is_alive():
+            self._sonda = Thread(target=self._sondar, daemon=True, name="disjuntor-sonda")
+            self._sonda.start()
+
+    def _sondar(self):
+        while True:
+            sleep(self.intervalo_sonda)
+            with self._lock:
+                abertos = [(srv, c['database']) for srv, c in self._circuitos.items() if c['estado'] == ABERTO]
+                if not abertos:
+                    self._sonda = None
+                    return
+                for servidor, _ in abertos:
+                    self._circuitos[servidor]['estado'] = MEIO_ABERTO
+            for servidor, database in abertos:
+                self._testar(servidor, database or 'AASI')
+
+    def _testar(self, servidor: str, database: str):
+        """Conexão curta, fora do pool; servidor que responde (mesmo recusando o login) fecha o circuito"""
+        self.stats['sondas'] += 1
+        try:
+            conn = pyodbc.connect(get_connection_string(servidor, database), timeout=self.timeout_sonda)
+            conn.close()
+        except Exception as e:
+            if erro_de_rede(e):
+                with self._lock:
+                    self._circuitos[servidor].update(estado=ABERTO, erro=str(e)[:200])
+                return
+        self.sucesso(servidor)
+
+    def estado(self, servidor: str) -> str:
+        with self._lock:
+            circuito = self._circuitos.get(servidor)
+            return circuito['estado'] if circuito else FECHADO
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            circuitos = {srv: {'estado': c['estado'], 'falhas': c['falhas'], 'erro': c['erro'],
+                               'aberto_ha': round(time() - c['aberto_em']) if c['aberto_em'] else None}
+                         for srv, c in self._circuitos.items() if c['falhas'] or c['estado'] != FECHADO}
+        return {'circuitos': circuitos, **self.stats}
+
+
+# Instância única do processo
+registro_disjuntores = RegistroDisjuntores()
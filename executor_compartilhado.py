@@ -0,0 +1,124 @@
+"""Executor Compartilhado: threads de consulta únicas no processo, limite por servidor e fila justa"""
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from config import MAX_THREADS_CONSULTA, MAX_CONSULTAS_POR_SERVIDOR
+
+logger = logging.getLogger(__name__)
+
+
+class _Tarefa:
+    __slots__ = ('servidor', 'fn', 'args', 'kwargs', 'future')
+
+    def __init__(self, servidor, fn, args, kwargs):
+        self.servidor = servidor
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class ExecutorCompartilhado:
+    """
+    Pool de threads de longa duração para as queries de todas as requisições.
+    - No máximo `limite_por_servidor` statements simultâneos em cada servidor SQL
+    - Fila por request_id atendida em rodízio: uma consulta grande não bloqueia as demais
+    - future.cancel() retira a tarefa da fila enquanto ela ainda não começou
+    """
+
+    def __init__(self, max_threads: int = MAX_THREADS_CONSULTA,
+                 limite_por_servidor: int = MAX_CONSULTAS_POR_SERVIDOR):
+        self.max_threads = max(1, max_threads)
+        self.limite_por_servidor = max(1, limite_por_servidor)
+        self._filas = OrderedDict()   # request_id -> deque[_Tarefa] (ordem = vez no rodízio)
+        self._em_uso = {}             # servidor -> statements em execução
+        self._threads = []
+        self._ocupadas = 0
+        self._cond = Condition()
+        self.stats = {'executadas': 0, 'canceladas': 0, 'esperas_servidor': 0}
+
+    def submit(self, servidor: str, request_id, fn, *args, **kwargs) -> Future:
+        """Enfileira fn(*args) para o servidor; retorna um concurrent.futures.Future"""
+        tarefa = _Tarefa(servidor, fn, args, kwargs)
+        with self._cond:
+            self._filas.setdefault(request_id, deque()).append(tarefa)
+            if self._ocupadas + self._na_fila_sem_lock() > len(self._threads) and \
+                    len(self._threads) < self.max_threads:
+                thread = Thread(target=self._trabalhar, daemon=True,
+                                name=f"consulta-{len(self._threads) + 1}")
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return tarefa.future
+
+    def _na_fila_sem_lock(self) -> int:
+        return sum(len(f) for f in self._filas.values())
+
+    def _proxima(self):
+        """Próxima tarefa executável em rodízio entre requests (chamar com lock)"""
+        bloqueada = False
+        for request_id in list(self._filas):
+            fila = self._filas[request_id]
+            for tarefa in list(fila):
+                if tarefa.future.cancelled():
+                    fila.remove(tarefa)
+                    self.stats['canceladas'] += 1
+                elif self._em_uso.get(tarefa.servidor, 0) < self.limite_por_servidor:
+                    fila.remove(tarefa)
+                    # Request atendido vai para o fim da vez
+                    if fila:
+                        self._filas.move_to_end(request_id)
+                    else:
+                        del self._filas[request_id]
+                    return tarefa
+                else:
+                    bloqueada = True
+            if not fila:
+                self._filas.pop(request_id, None)
+        if bloqueada:
+            self.stats['esperas_servidor'] += 1
+        return None
+
+    def _trabalhar(self):
+        while True:
+            with self._cond:
+                tarefa = self._proxima()
+                while tarefa is None:
+                    self._cond.wait()
+                    tarefa = self._proxima()
+                self._em_uso[tarefa.servidor] = self._em_uso.get(tarefa.servidor, 0) + 1
+                self._ocupadas += 1
+
+            executou = tarefa.future.set_running_or_notify_cancel()
+            try:
+                if executou:
+                    try:
+                        tarefa.future.set_result(tarefa.fn(*tarefa.args, **tarefa.kwargs))
+                    except BaseException as e:
+                        tarefa.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._em_uso[tarefa.servidor] -= 1
+                    self._ocupadas -= 1
+                    self.stats['executadas' if executou else 'canceladas'] += 1
+                    # Vaga liberada no servidor pode destravar tarefas de outras threads
+                    self._cond.notify_all()
+                tarefa = None
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                'threads': len(self._threads),
+                'max_threads': self.max_threads,
+                'ocupadas': self._ocupadas,
+                'na_fila': self._na_fila_sem_lock(),
+                'requests_na_fila': len(self._filas),
+                'limite_por_servidor': self.limite_por_servidor,
+                'em_uso': {srv: n for srv, n in self._em_uso.items() if n},
+                **self.stats
+            }
+
+
+# Instância única do processo
+executor_consultas = ExecutorCompartilhado()
@@ -0,0 +1,126 @@
+"""Exportação do resultado guardado: CSV/Excel em blocos (formatados) e Parquet/Arrow (tipados)"""
+import logging
+import os
+import tempfile
+import pandas as pd
+from config import EXPORT_LINHAS_POR_BLOCO, COMPRESSAO_PARQUET
+from formatador import nomes_exibicao, preparar_saida
+
+logger = logging.getLogger(__name__)
+BOM_UTF8 = '\ufeff'
+# Colunas de entidade/conta sempre com dictionary encoding (poucos valores distintos)
+COLUNAS_DICIONARIO = {'IDEntidade', 'Entidade', 'entity_code', 'entidade', 'IDConta', 'Conta',
+                      'SubConta', 'IDDepartamento', 'Origem'}
+MIMETYPES = {
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file',
+}
+
+
+def _blocos(df: pd.DataFrame, tamanho: int):
+    """Fatias do DataFrame já formatadas em pt-BR (só um bloco em memória por vez)"""
+    for inicio in range(0, len(df), tamanho):
+        yield preparar_saida(df.iloc[inicio:inicio + tamanho])
+
+
+def gerar_csv(df: pd.DataFrame, tamanho_bloco: int = EXPORT_LINHAS_POR_BLOCO):
+    """Gera o CSV (sep=';', UTF-8 com BOM) em pedaços de bytes para resposta em streaming"""
+    colunas = nomes_exibicao(df.columns)
+    yield (BOM_UTF8 + pd.DataFrame(columns=colunas).to_csv(index=False, sep=';')).encode('utf-8')
+    for bloco in _blocos(df, tamanho_bloco):
+        yield bloco.to_csv(index=False, header=False, sep=';').encode('utf-8')
+
+
+def gerar_xlsx(df: pd.DataFrame, tamanho_bloco: int = EXPORT_LINHAS_POR_BLOCO) -> str:
+    """Grava XLSX com openpyxl write-only em arquivo temporário; retorna o caminho"""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Dados')
+    ws.append(nomes_exibicao(df.columns))
+    for bloco in _blocos(df, tamanho_bloco):
+        for linha in bloco.itertuples(index=False, name=None):
+            ws.append(linha)
+
+    fd, caminho = tempfile.mkstemp(suffix='.xlsx', prefix='exportacao_')
+    os.close(fd)
+    try:
+        wb.save(caminho)
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
+
+
+def ler_e_remover(caminho: str, tamanho: int = 1024 * 1024):
+    """Lê o arquivo em pedaços para a resposta e o apaga ao final (ou se o cliente desconectar)"""
+    try:
+        with open(caminho, 'rb') as f:
+            while True:
+                pedaco = f.read(tamanho)
+                if not pedaco:
+                    break
+                yield pedaco
+    finally:
+        os.remove(caminho)
+
+
+def _como_texto(serie: pd.Series) -> pd.Series:
+    """Coluna object com tipos misturados (ex.: Decimal e texto) -> texto, mantendo os nulos"""
+    return serie.map(lambda v: v if v is None or (isinstance(v, float) and v != v) else str(v))
+
+
+def tabela_arrow(df: pd.DataFrame):
+    """
+    DataFrame bruto -> pyarrow.Table tipada (Decimal como decimal128, date do pyodbc como date32,
+    datetime como timestamp), com dictionary encoding nas colunas de entidade/conta e em textos
+    de baixa cardinalidade. Colunas object que o Arrow não consegue tipar viram texto.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    try:
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        mistas = {}
+        for col in df.columns[(df.dtypes == object).to_numpy()]:
+            try:
+                pa.array(df[col], from_pandas=True)
+            except (pa.ArrowTypeError, pa.ArrowInvalid):
+                mistas[col] = _como_texto(df[col])
+        if not mistas:
+            raise
+        logger.warning(f"⚠️ Arrow: colunas com tipos misturados exportadas como texto: {', '.join(mistas)}")
+        tabela = pa.Table.from_pandas(df.assign(**mistas), preserve_index=False)
+
+    for i, campo in enumerate(tabela.schema):
+        if not (pa.types.is_string(campo.type) or pa.types.is_large_string(campo.type)):
+            continue
+        coluna = tabela.column(i)
+        if campo.name in COLUNAS_DICIONARIO or pc.count_distinct(coluna).as_py() <= len(coluna) // 2:
+            tabela = tabela.set_column(i, campo.name, pc.dictionary_encode(coluna))
+    return tabela
+
+
+def gerar_binario(df: pd.DataFrame, formato: str, compressao: str = None) -> str:
+    """
+    Grava Parquet (COMPRESSAO_PARQUET, snappy lido pelo Power BI) ou Arrow IPC/Feather (lz4)
+    em arquivo temporário; compressao ('zstd', 'gzip'...) sobrepõe o padrão
+    """
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    tabela = tabela_arrow(df)
+    fd, caminho = tempfile.mkstemp(suffix=f'.{formato}', prefix='exportacao_')
+    os.close(fd)
+    try:
+        if formato == 'parquet':
+            pq.write_table(tabela, caminho, compression=compressao or COMPRESSAO_PARQUET)
+        elif formato == 'arrow':
+            feather.write_feather(tabela, caminho, compression=compressao or 'lz4')
+        else:
+            raise ValueError(f"Formato inválido: {formato}")
+    except Exception:
+        os.remove(caminho)
+        raise
+    return caminho
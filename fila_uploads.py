@@ -0,0 +1,115 @@
+"""Fila de Uploads SharePoint em segundo plano (workers limitados, status por request_id, retentativa)"""
+import logging
+import time
+from queue import Queue
+from threading import Lock, Thread
+from config import UPLOAD_WORKERS, UPLOAD_TENTATIVAS
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_FINAIS = ('concluido', 'falhou')
+
+
+class FilaUploads:
+    """
+    Uploads executados fora da thread da consulta:
+    - no máximo `workers` uploads simultâneos contra o Graph
+    - status por upload_id: na_fila -> enviando -> concluido | falhou (com bytes enviados)
+    - upload com erro é repetido até `tentativas` vezes com backoff exponencial
+    """
+
+    def __init__(self, workers: int = UPLOAD_WORKERS, tentativas: int = UPLOAD_TENTATIVAS):
+        self.workers = max(1, workers)
+        self.tentativas = max(1, tentativas)
+        self._fila = Queue()
+        self._status = {}
+        self._threads = []
+        self._lock = Lock()
+        self.stats = {'concluidos': 0, 'falhos': 0, 'retentativas': 0}
+
+    def enfileirar(self, upload_id: str, enviar, arquivo: str, notificar=None) -> dict:
+        """
+        enviar(progresso) faz o upload e retorna {'status', 'url', 'mensagem'};
+        notificar(status) recebe cada mudança (ex.: evento SSE). Retorna o status inicial.
+        """
+        with self._lock:
+            self._status[upload_id] = {'upload_id': upload_id, 'arquivo': arquivo, 'estado': 'na_fila',
+                                       'bytes_enviados': 0, 'bytes_total': None, 'tentativa': 0,
+                                       'url': None, 'mensagem': None}
+            if len(self._threads) < self.workers:
+                thread = Thread(target=self._trabalhar, daemon=True, name=f"upload-{len(self._threads) + 1}")
+                self._threads.append(thread)
+                thread.start()
+        self._fila.put((upload_id, enviar, notificar))
+        return self._atualizar(upload_id, notificar)
+
+    def _atualizar(self, upload_id: str, notificar, **campos) -> dict:
+        with self._lock:
+            status = self._status.get(upload_id)
+            if status is None:  # Removido pela limpeza
+                return {}
+            status.update(campos)
+            copia = dict(status)
+        if notificar:
+            notificar(copia)
+        return copia
+
+    def _trabalhar(self):
+        while True:
+            upload_id, enviar, notificar = self._fila.get()
+            try:
+                self._executar(upload_id, enviar, notificar)
+            except Exception as e:
+                logger.error(f"❌ Upload {upload_id[:8]}: {e}")
+
+    def _executar(self, upload_id: str, enviar, notificar):
+        def progresso(enviados: int, total: int):
+            self._atualizar(upload_id, notificar, bytes_enviados=enviados, bytes_total=total)
+
+        for tentativa in range(1, self.tentativas + 1):
+            self._atualizar(upload_id, notificar, estado='enviando', tentativa=tentativa)
+            try:
+                resultado = enviar(progresso)
+            except Exception as e:
+                resultado = {'status': 'erro', 'mensagem': str(e)}
+
+            if resultado.get('status') == 'sucesso':
+                self.stats['concluidos'] += 1
+                self._atualizar(upload_id, notificar, estado='concluido', url=resultado.get('url'),
+                                mensagem=resultado.get('mensagem'))
+                return
+
+            if tentativa < self.tentativas:
+                espera = min(2 ** tentativa, 60)
+                self.stats['retentativas'] += 1
+                logger.warning(f"⚠️ Upload {upload_id[:8]}: {resultado.get('mensagem')} - "
+                               f"nova tentativa em {espera}s")
+                self._atualizar(upload_id, notificar, mensagem=resultado.get('mensagem'))
+                time.sleep(espera)
+
+        self.stats['falhos'] += 1
+        self._atualizar(upload_id, notificar, estado='falhou', mensagem=resultado.get('mensagem'))
+
+    def status(self, upload_id: str):
+        with self._lock:
+            status = self._status.get(upload_id)
+            return dict(status) if status else None
+
+    def pendente(self, upload_id: str) -> bool:
+        """Upload na fila ou em andamento"""
+        status = self.status(upload_id)
+        return status is not None and status['estado'] not in ESTADOS_FINAIS
+
+    def remover(self, upload_id: str):
+        with self._lock:
+            self._status.pop(upload_id, None)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            enviando = sum(1 for s in self._status.values() if s['estado'] == 'enviando')
+        return {'workers': len(self._threads), 'na_fila': self._fila.qsize(), 'enviando': enviando,
+                **self.stats}
+
+
+# Instância única do processo
+fila_uploads = FilaUploads()
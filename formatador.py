@@ -1,4 +1,5 @@
 """Módulo de Formatação de Dados para Exibição"""
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
@@ -152,57 +153,205 @@ def formatar_numero_ptbr(valor, casas=2):
         return str(valor)
 
 
+# === FORMATAÇÃO VETORIZADA (coluna inteira) ===
+# Produz exatamente o mesmo texto que formatar_data_ptbr/formatar_numero_ptbr;
+# valores que o caminho rápido não garante (inf, NaN textual, empates de
+# arredondamento, números enormes) caem no formatador por célula.
+
+_GRUPO_3 = np.array([f"{i:03d}" for i in range(1000)])
+_GRUPO_LIVRE = np.array([str(i) for i in range(1000)])
+_DECIMAIS = {c: np.array([f"{i:0{c}d}" for i in range(10 ** c)]) for c in range(1, 5)}
+_LIMITE_EXATO = 2.0 ** 52  # Acima disso o valor escalado deixa de ser inteiro exato
+_RE_DATA = r'[0-9]{4}-[0-9]{2}-[0-9]{2}'
+_RE_DATA_HORA = r'[0-9]{4}-[0-9]{2}-[0-9]{2}[ T][0-9]{2}:[0-9]{2}:[0-9]{2}'
+
+
+def _agrupar_milhares(inteiros: np.ndarray) -> np.ndarray:
+    """Parte inteira (>= 0) com separador de milhar '.'"""
+    resto = inteiros // 1000
+    saida = np.where(resto > 0, _GRUPO_3[inteiros % 1000], _GRUPO_LIVRE[inteiros % 1000]).astype('U32')
+    mask = resto > 0
+    while mask.any():
+        grupo = resto[mask] % 1000
+        acima = resto[mask] // 1000
+        prefixo = np.where(acima > 0, _GRUPO_3[grupo], _GRUPO_LIVRE[grupo])
+        saida[mask] = np.char.add(np.char.add(prefixo, '.'), saida[mask])
+        resto[mask] = acima
+        mask = resto > 0
+    return saida
+
+
+def _valores_float(serie: pd.Series, na: np.ndarray):
+    """Converte a coluna para float64 uma única vez (Decimal, int, texto numérico)"""
+    try:
+        if pd.api.types.is_numeric_dtype(serie.dtype) or pd.api.types.is_bool_dtype(serie.dtype):
+            return serie.to_numpy(dtype='float64', na_value=np.nan)
+        valores = np.asarray(serie, dtype=object).copy()
+        valores[na] = np.nan
+        return valores.astype('float64')  # float() por elemento, como no formatador por célula
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _formatar_coluna_numero(serie: pd.Series, casas: int = 2) -> pd.Series:
+    """Versão vetorizada de apply(formatar_numero_ptbr)"""
+    na = serie.isna().to_numpy()
+    valores = _valores_float(serie, na)
+    if valores is None or casas not in _DECIMAIS:
+        return serie.apply(lambda x: formatar_numero_ptbr(x, casas)).astype(str)
+
+    escala = 10 ** casas
+    absoluto = np.abs(valores)
+    with np.errstate(invalid='ignore', over='ignore'):
+        escalado = absoluto * escala
+        fracao = escalado - np.floor(escalado)
+        # Perto de ,5 o arredondamento binário pode divergir do f-string -> célula a célula
+        ambiguo = np.abs(fracao - 0.5) <= escalado * 1e-15 + 1e-9
+        rapido = ~na & np.isfinite(escalado) & (escalado < _LIMITE_EXATO) & ~ambiguo
+
+    texto = None
+    if rapido.any():
+        centavos = np.rint(escalado[rapido]).astype(np.int64)
+        texto = np.char.add(np.char.add(_agrupar_milhares(centavos // escala), ','),
+                            _DECIMAIS[casas][centavos % escala])
+        sinal = np.signbit(valores[rapido])  # -0.001 -> '-0,00', como no f-string
+        if sinal.any():
+            texto = texto.astype(f'U{texto.dtype.itemsize // 4 + 1}')  # espaço para o '-'
+            texto[sinal] = np.char.add('-', texto[sinal])
+        if rapido.all():
+            return pd.Series(texto, index=serie.index).astype(str)
+
+    saida = np.full(len(serie), '', dtype=object)
+    if texto is not None:
+        saida[rapido] = texto
+    lento = ~na & ~rapido
+    if lento.any():
+        originais = np.asarray(serie, dtype=object)
+        saida[lento] = [formatar_numero_ptbr(v, casas) for v in originais[lento]]
+
+    return pd.Series(saida, index=serie.index, dtype=object).astype(str)
+
+
+def _formatar_datas_unicas(valores: np.ndarray) -> np.ndarray:
+    """Formata valores distintos de data; textos ISO são parseados em bloco com pd.to_datetime"""
+    saida = np.empty(len(valores), dtype=object)
+    eh_texto = np.array([isinstance(v, str) for v in valores], dtype=bool)
+    resolvido = np.zeros(len(valores), dtype=bool)
+
+    if eh_texto.any():
+        indices = np.flatnonzero(eh_texto)
+        base = pd.Series(valores[eh_texto], dtype=object).str.split('.', n=1).str[0]
+        for padrao, fmt in ((_RE_DATA, '%Y-%m-%d'), (_RE_DATA_HORA, '%Y-%m-%d %H:%M:%S')):
+            m = base.str.fullmatch(padrao).fillna(False).to_numpy(dtype=bool)
+            if not m.any():
+                continue
+            datas = pd.to_datetime(base[m].str.replace('T', ' ', regex=False),
+                                   format=fmt, errors='coerce')
+            # Anos < 1000 saem sem zeros à esquerda no strftime do Python -> célula a célula
+            ok = (datas.notna() & (datas.dt.year >= 1000)).to_numpy(dtype=bool)
+            if ok.any():
+                idx = indices[m][ok]
+                saida[idx] = datas[ok].dt.strftime('%d/%m/%Y').to_numpy(dtype=object)
+                resolvido[idx] = True
+
+    pendentes = np.flatnonzero(~resolvido)
+    saida[pendentes] = [formatar_data_ptbr(v) for v in valores[pendentes]]
+    return saida
+
+
+def _formatar_coluna_data(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de apply(formatar_data_ptbr)"""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        validas = serie.dropna()
+        if validas.empty or (validas.dt.year >= 1000).all():
+            saida = serie.dt.strftime('%d/%m/%Y').astype(object).where(serie.notna(), '')
+            return saida.astype(str)
+
+    # Datas se repetem muito: formatar só os valores distintos e expandir pelos códigos
+    codigos, unicos = pd.factorize(serie)
+    formatados = np.append(_formatar_datas_unicas(np.asarray(unicos, dtype=object)), '')
+    return pd.Series(formatados[codigos], index=serie.index, dtype=object).astype(str)
+
+
+def formatar_coluna(col: str, serie: pd.Series) -> pd.Series:
+    """Formata uma coluna pelo nome/tipo (data, moeda, número); as demais voltam sem cópia"""
+    dtype = serie.dtype
+    col_lower = col.lower()
+    
+    # Detectar colunas de data pelo nome ou tipo
+    is_date_col = (
+        pd.api.types.is_datetime64_any_dtype(dtype) or
+        'data' in col_lower or 
+        'date' in col_lower or
+        col_lower in ['datalote', 'date_in', 'date_out']
+    )
+    
+    # Detectar colunas de valor monetário pelo nome
+    is_money_col = (
+        'valor' in col_lower or 
+        'saldo' in col_lower or 
+        'total' in col_lower or
+        'diferenca' in col_lower or
+        col_lower in ['value', 'totalizador']
+    )
+    
+    if is_date_col:
+        # Converter coluna inteira para string formatada
+        return _formatar_coluna_data(serie)
+    if is_money_col:
+        # Formatar como moeda brasileira - funciona com qualquer tipo numérico
+        return _formatar_coluna_numero(serie, 2)
+    if pd.api.types.is_float_dtype(dtype):
+        # Outros floats também formatados
+        return _formatar_coluna_numero(serie, 2)
+    if dtype == 'object':
+        # Verificar se é coluna numérica disfarçada (Decimal, etc)
+        try:
+            primeiro_valor = serie.dropna().iloc[0] if len(serie.dropna()) > 0 else None
+            if primeiro_valor is not None and hasattr(primeiro_valor, '__float__'):
+                # Decimal etc.: convertido para float uma única vez
+                return _formatar_coluna_numero(serie, 2)
+        except:
+            pass
+    return serie
+
+
 def formatar_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """Formata DataFrame completo: renomeia colunas, formata datas e números"""
     if df.empty:
         return df
     
-    df_fmt = df.copy()
-    
-    # Identificar e formatar colunas
-    for col in df_fmt.columns:
-        dtype = df_fmt[col].dtype
-        col_lower = col.lower()
-        
-        # Detectar colunas de data pelo nome ou tipo
-        is_date_col = (
-            pd.api.types.is_datetime64_any_dtype(dtype) or
-            'data' in col_lower or 
-            'date' in col_lower or
-            col_lower in ['datalote', 'date_in', 'date_out']
-        )
-        
-        # Detectar colunas de valor monetário pelo nome
-        is_money_col = (
-            'valor' in col_lower or 
-            'saldo' in col_lower or 
-            'total' in col_lower or
-            'diferenca' in col_lower or
-            col_lower in ['value', 'totalizador']
-        )
-        
-        if is_date_col:
-            # Converter cada valor para string formatada
-            df_fmt[col] = df_fmt[col].apply(formatar_data_ptbr).astype(str)
-        elif is_money_col:
-            # Formatar como moeda brasileira - funciona com qualquer tipo numérico
-            df_fmt[col] = df_fmt[col].apply(lambda x: formatar_numero_ptbr(x, 2)).astype(str)
-        elif pd.api.types.is_float_dtype(dtype):
-            # Outros floats também formatados
-            df_fmt[col] = df_fmt[col].apply(lambda x: formatar_numero_ptbr(x, 2)).astype(str)
-        elif dtype == 'object':
-            # Verificar se é coluna numérica disfarçada (Decimal, etc)
-            try:
-                primeiro_valor = df_fmt[col].dropna().iloc[0] if len(df_fmt[col].dropna()) > 0 else None
-                if primeiro_valor is not None and hasattr(primeiro_valor, '__float__'):
-                    df_fmt[col] = df_fmt[col].apply(lambda x: formatar_numero_ptbr(x, 2)).astype(str)
-            except:
-                pass
+    # Novo DataFrame montado coluna a coluna: as não formatadas são reaproveitadas (sem df.copy())
+    colunas = {col: formatar_coluna(col, df[col]) for col in df.columns}
     
     # Renomear colunas para português
-    df_fmt = renomear_colunas(df_fmt)
+    return renomear_colunas(pd.DataFrame(colunas, index=df.index, copy=False))
+
+
+def texto_exibido(col: str, serie: pd.Series) -> pd.Series:
+    """Texto da coluna como a tela mostra (mesma formatação e nulos de preparar_saida)"""
+    texto = formatar_coluna(col, serie).replace(['nan', 'None', 'NaT'], '')
+    return texto.fillna('').astype(str)
+
+
+def nomes_exibicao(colunas) -> list:
+    """Nomes em português das colunas (o que a tela e as exportações mostram)"""
+    return [MAPA_COLUNAS.get(col, col) for col in colunas]
+
+
+def preparar_saida(df: pd.DataFrame, formatar=True) -> pd.DataFrame:
+    """DataFrame de texto pronto para serializar (nulos viram string vazia)"""
+    if formatar:
+        df_fmt = formatar_dataframe(df)
+    else:
+        # Apenas converter tipos problemáticos
+        df_fmt = pd.DataFrame({col: _formatar_coluna_data(df[col])
+                               if pd.api.types.is_datetime64_any_dtype(df[col].dtype) else df[col]
+                               for col in df.columns}, index=df.index, copy=False)
     
-    return df_fmt
+    # Substituir 'nan' e 'None' por string vazia
+    df_fmt = df_fmt.replace(['nan', 'None', 'NaT'], '')
+    return df_fmt.fillna('')
 
 
 def converter_para_json(df: pd.DataFrame, formatar=True) -> tuple:
@@ -213,21 +362,20 @@ def converter_para_json(df: pd.DataFrame, formatar=True) -> tuple:
     if df.empty:
         return [], []
     
-    if formatar:
-        df_fmt = formatar_dataframe(df)
-    else:
-        df_fmt = df.copy()
-        # Apenas converter tipos problemáticos
-        for col in df_fmt.columns:
-            dtype = df_fmt[col].dtype
-            if pd.api.types.is_datetime64_any_dtype(dtype):
-                df_fmt[col] = df_fmt[col].apply(formatar_data_ptbr).astype(str)
-    
-    # Substituir 'nan' e 'None' por string vazia
-    df_fmt = df_fmt.replace(['nan', 'None', 'NaT'], '')
-    df_fmt = df_fmt.fillna('')
-    
+    df_fmt = preparar_saida(df, formatar)
     colunas = df_fmt.columns.tolist()
     dados = df_fmt.to_dict('records')
     
-    return dados, colunas
\ No newline at end of file
+    return dados, colunas
+
+
+def converter_para_colunas(df: pd.DataFrame, formatar=True) -> tuple:
+    """
+    Converte DataFrame para formato colunar compacto (uma lista por coluna).
+    Retorna (colunas, valores)
+    """
+    if df.empty:
+        return [], []
+    
+    df_fmt = preparar_saida(df, formatar)
+    return df_fmt.columns.tolist(), [df_fmt[col].tolist() for col in df_fmt.columns]
\ No newline at end of file
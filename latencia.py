@@ -0,0 +1,139 @@
+"""Latência por (servidor, consulta): histórico persistido e timeouts adaptativos (p99 x fator)"""
+import atexit
+import json
+import logging
+import math
+import os
+from collections import deque
+from threading import Lock
+from time import time
+from config import (LATENCIA_ARQUIVO, LATENCIA_AMOSTRAS, LATENCIA_MIN_AMOSTRAS, LATENCIA_FATOR,
+                    LATENCIA_TIMEOUT_MIN, LATENCIA_TIMEOUT_MAX, TIMEOUT_CONEXAO)
+
+logger = logging.getLogger(__name__)
+
+SALVAR_A_CADA = 60  # segundos entre gravações do histórico em disco
+
+
+def _percentil(valores: list, p: float) -> float:
+    """Percentil por posição (p em 0..1) de uma lista não vazia"""
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, math.ceil(p * len(ordenados)) - 1)]
+
+
+class RegistroLatencia:
+    """
+    Guarda as últimas `amostras` execuções de cada (servidor, consulta) - duração e linhas -
+    e deriva delas o timeout de cada um: p99 x fator, limitado a [timeout_min, timeout_max].
+    Sem histórico suficiente vale o timeout fixo de sempre. Timeouts também entram como
+    amostra (no valor do limite), senão um servidor que ficou lento nunca ganharia mais prazo.
+    """
+
+    def __init__(self, arquivo: str = LATENCIA_ARQUIVO, amostras: int = LATENCIA_AMOSTRAS):
+        self.arquivo = arquivo
+        self.amostras = max(1, amostras)
+        self._historico = {}  # (servidor, consulta) -> deque[(segundos, linhas)]
+        self._lock = Lock()
+        self._salvo_em = time()
+        self._alterado = False
+        self._carregar()
+        atexit.register(self.salvar)
+
+    def _carregar(self):
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return
+        try:
+            with open(self.arquivo, encoding='utf-8') as f:
+                dados = json.load(f)
+            for servidor, consultas in dados.items():
+                for consulta, amostras in consultas.items():
+                    self._historico[(servidor, consulta)] = deque(
+                        (tuple(a) for a in amostras), maxlen=self.amostras)
+            logger.info(f"⏱️ Latências carregadas: {len(self._historico)} pares servidor/consulta")
+        except Exception as e:
+            logger.warning(f"⚠️ Histórico de latência ignorado ({self.arquivo}): {e}")
+
+    def salvar(self):
+        """Grava o histórico (arquivo temporário + rename, nunca fica pela metade)"""
+        with self._lock:
+            if not self.arquivo or not self._alterado:
+                return
+            dados = {}
+            for (servidor, consulta), amostras in self._historico.items():
+                dados.setdefault(servidor, {})[consulta] = list(amostras)
+            self._alterado = False
+            self._salvo_em = time()
+        try:
+            temporario = f"{self.arquivo}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(dados, f)
+            os.replace(temporario, self.arquivo)
+        except OSError as e:
+            logger.warning(f"⚠️ Não foi possível gravar latências: {e}")
+
+    def registrar(self, servidor: str, consulta: str, segundos: float, linhas: int = None):
+        """Uma execução concluída (linhas=None: terminou em timeout)"""
+        with self._lock:
+            chave = (servidor, consulta)
+            if chave not in self._historico:
+                self._historico[chave] = deque(maxlen=self.amostras)
+            self._historico[chave].append((round(segundos, 3), linhas))
+            self._alterado = True
+            salvar = time() - self._salvo_em >= SALVAR_A_CADA
+        if salvar:
+            self.salvar()
+
+    def _duracoes(self, servidor: str, consulta: str) -> list:
+        with self._lock:
+            return [s for s, _ in self._historico.get((servidor, consulta), ())]
+
+    def percentil(self, servidor: str, consulta: str, p: float = 0.99):
+        """Percentil das durações ou None sem histórico suficiente"""
+        duracoes = self._duracoes(servidor, consulta)
+        if len(duracoes) < LATENCIA_MIN_AMOSTRAS:
+            return None
+        return _percentil(duracoes, p)
+
+    def limite(self, servidor: str, consulta: str):
+        """Timeout adaptativo da query em segundos (int) ou None sem histórico suficiente"""
+        p99 = self.percentil(servidor, consulta, 0.99)
+        if p99 is None:
+            return None
+        return int(min(max(math.ceil(p99 * LATENCIA_FATOR), LATENCIA_TIMEOUT_MIN), LATENCIA_TIMEOUT_MAX))
+
+    def timeout(self, servidor: str, consulta: str, padrao: int) -> int:
+        """Timeout da query: adaptativo se houver histórico, senão `padrao`"""
+        return self.limite(servidor, consulta) or padrao
+
+    def timeout_global(self, pares: list, padrao: int) -> int:
+        """
+        Prazo para um fan-out [(servidor, consulta)]: maior timeout adaptativo + conexão.
+        Basta um par sem histórico para valer o `padrao` (não se sabe quanto ele demora).
+        """
+        limites = [self.limite(servidor, consulta) for servidor, consulta in pares]
+        if not limites or None in limites:
+            return padrao
+        return max(limites) + TIMEOUT_CONEXAO
+
+    def estatisticas(self) -> dict:
+        """{servidor: {consulta: {amostras, p50, p99, timeout, s_por_mil_linhas}}}"""
+        with self._lock:
+            historico = {chave: list(amostras) for chave, amostras in self._historico.items()}
+        saida = {}
+        for (servidor, consulta), amostras in sorted(historico.items()):
+            duracoes = [s for s, _ in amostras]
+            com_linhas = [(s, n) for s, n in amostras if n]
+            saida.setdefault(servidor, {})[consulta] = {
+                'amostras': len(amostras),
+                'timeouts': sum(1 for _, n in amostras if n is None),
+                'p50': _percentil(duracoes, 0.5),
+                'p99': _percentil(duracoes, 0.99),
+                'timeout': self.limite(servidor, consulta),
+                's_por_mil_linhas': (round(1000 * sum(s for s, _ in com_linhas) / sum(n for _, n in com_linhas), 4)
+                                     if com_linhas else None),
+            }
+        return saida
+
+
+# Instância única do processo
+registro_latencia = RegistroLatencia()
@@ -0,0 +1,105 @@
+"""Leitura de resultados SQL em lotes (fetchmany) com limite por servidor"""
+import pandas as pd
+from time import perf_counter
+from config import FETCH_TAMANHO_LOTE, MAX_LINHAS_POR_SERVIDOR, MAX_MB_POR_SERVIDOR
+
+
+def _lote_para_dataframe(lote: list, colunas: list) -> pd.DataFrame:
+    """Converte um lote de Rows em colunas tipadas (o lote pode ser liberado em seguida)"""
+    return pd.DataFrame.from_records(lote, columns=colunas)
+
+
+def _concatenar(partes: list, colunas: list) -> pd.DataFrame:
+    """Concatena os lotes uma única vez, reinferindo colunas cujo tipo variou entre lotes"""
+    if not partes:
+        return pd.DataFrame(columns=colunas)
+    if len(partes) == 1:
+        return partes[0]
+
+    df = pd.concat(partes, ignore_index=True)
+    divergentes = [i for i in range(len(colunas))
+                   if len({str(p.dtypes.iloc[i]) for p in partes}) > 1]
+    for i in divergentes:
+        # Ex.: lote só com NULL (object) + lote com floats -> float64
+        df.isetitem(i, df.iloc[:, i].infer_objects())
+    return df
+
+
+def ler_dataframe(cursor, tamanho_lote: int = FETCH_TAMANHO_LOTE,
+                  max_linhas: int = MAX_LINHAS_POR_SERVIDOR,
+                  max_mb: int = MAX_MB_POR_SERVIDOR, cancelar_excedente: bool = True,
+                  tempos: dict = None) -> tuple:
+    """
+    Lê o resultado corrente do cursor em lotes e monta um único DataFrame.
+    Interrompe ao atingir max_linhas/max_mb (0 = sem limite).
+    Retorna (df, aviso) - aviso descreve o truncamento (só se o servidor tinha mais linhas) ou é None.
+    cancelar_excedente=False mantém o batch vivo (há result sets seguintes a ler).
+    tempos: se informado, acumula 'leitura' (fetchmany/rede) e 'dataframe' (montagem) em segundos.
+    """
+    colunas = [col[0] for col in cursor.description] if cursor.description else []
+    if not colunas:
+        return pd.DataFrame(), None
+
+    max_bytes = max_mb * 1024 * 1024
+    partes, linhas, bytes_lidos, aviso = [], 0, 0, None
+    no_limite = None  # Limite atingido: só é truncamento se o servidor ainda tiver linhas
+
+    leitura = montagem = 0.0
+    while True:
+        inicio = perf_counter()
+        lote = cursor.fetchmany(1 if no_limite else tamanho_lote)
+        leitura += perf_counter() - inicio
+        if not lote:
+            break
+        if no_limite:
+            aviso = no_limite
+            break
+
+        if max_linhas and linhas + len(lote) > max_linhas:
+            lote = lote[:max_linhas - linhas]
+            aviso = f"resultado truncado em {max_linhas} linhas"
+
+        inicio = perf_counter()
+        parte = _lote_para_dataframe(lote, colunas)
+        montagem += perf_counter() - inicio
+        del lote
+        partes.append(parte)
+        linhas += len(parte)
+        bytes_lidos += int(parte.memory_usage(index=False, deep=True).sum())
+
+        if aviso:
+            break
+        if max_linhas and linhas >= max_linhas:
+            no_limite = f"resultado truncado em {max_linhas} linhas"
+        elif max_bytes and bytes_lidos >= max_bytes:
+            no_limite = f"resultado truncado em {linhas} linhas (limite de {max_mb} MB)"
+
+    if aviso and cancelar_excedente:
+        # Descartar o restante no servidor antes de devolver a conexão ao pool
+        try:
+            cursor.cancel()
+        except Exception:
+            pass
+
+    inicio = perf_counter()
+    df = _concatenar(partes, colunas)
+    if tempos is not None:
+        tempos['leitura'] = tempos.get('leitura', 0.0) + leitura
+        tempos['dataframe'] = tempos.get('dataframe', 0.0) + montagem + perf_counter() - inicio
+    return df, aviso
+
+
+def ler_resultados(cursor, quantidade: int, **limites) -> list:
+    """
+    Lê os `quantidade` result sets de um batch com várias consultas (cursor.nextset() entre eles),
+    pulando os que não têm colunas (contagens). Retorna [(df, aviso), ...] na ordem das consultas.
+    """
+    resultados = []
+    while True:
+        if cursor.description:
+            ultimo = len(resultados) == quantidade - 1
+            resultados.append(ler_dataframe(cursor, cancelar_excedente=ultimo, **limites))
+            if ultimo:
+                return resultados
+        if not cursor.nextset():
+            raise ValueError(f"Batch retornou {len(resultados)} de {quantidade} resultados")
@@ -0,0 +1,97 @@
+"""Métricas de Tempo: etapas por servidor e por requisição ('metricas' na resposta) e histogramas Prometheus"""
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# Limites superiores dos buckets (segundos); +Inf é implícito
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DESCRICOES = {
+    'consultas_servidor_segundos': 'Tempo por servidor SQL e etapa (conexao, execucao, leitura, dataframe)',
+    'consultas_etapa_segundos': 'Tempo por etapa da requisição (consolidacao, formatacao, serializacao)',
+}
+
+
+@contextmanager
+def cronometrar(tempos: dict, etapa: str):
+    """Soma em tempos[etapa] o tempo do bloco (acumula se a etapa se repetir)"""
+    inicio = perf_counter()
+    try:
+        yield
+    finally:
+        tempos[etapa] = tempos.get(etapa, 0.0) + perf_counter() - inicio
+
+
+def arredondar(tempos: dict, casas: int = 4) -> dict:
+    return {etapa: round(valor, casas) if isinstance(valor, float) else valor for etapa, valor in tempos.items()}
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(rotulos: tuple, le=None) -> str:
+    """{nome="valor",...} no formato Prometheus (le = limite do bucket)"""
+    partes = [f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos]
+    if le is not None:
+        partes.append(f'le="{le}"')
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+class _Histograma:
+    __slots__ = ('contagens', 'soma', 'total')
+
+    def __init__(self, buckets: int):
+        self.contagens = [0] * buckets
+        self.soma = 0.0
+        self.total = 0
+
+
+class RegistroMetricas:
+    """Histogramas de tempo em memória, exportados no formato texto do Prometheus"""
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self._series = {}  # (métrica, ((rótulo, valor), ...)) -> _Histograma
+        self._lock = Lock()
+
+    def observar(self, metrica: str, segundos: float, **rotulos):
+        chave = (metrica, tuple(sorted(rotulos.items())))
+        indice = bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = _Histograma(len(self.buckets))
+            if indice < len(self.buckets):
+                serie.contagens[indice] += 1
+            serie.soma += segundos
+            serie.total += 1
+
+    def observar_etapas(self, metrica: str, tempos: dict, **rotulos):
+        """Uma observação por etapa de `tempos` (valores numéricos), com o rótulo etapa"""
+        for etapa, segundos in tempos.items():
+            if isinstance(segundos, float):
+                self.observar(metrica, segundos, etapa=etapa, **rotulos)
+
+    def exportar(self) -> str:
+        """Texto para GET /metrics (buckets cumulativos, _sum e _count)"""
+        with self._lock:
+            series = sorted((chave, list(s.contagens), s.soma, s.total) for chave, s in self._series.items())
+        linhas, anunciadas = [], set()
+        for (metrica, rotulos), contagens, soma, total in series:
+            if metrica not in anunciadas:
+                anunciadas.add(metrica)
+                linhas.append(f"# HELP {metrica} {DESCRICOES.get(metrica, metrica)}")
+                linhas.append(f"# TYPE {metrica} histogram")
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f"{metrica}_bucket{_rotulos(rotulos, limite)} {acumulado}")
+            linhas.append(f"{metrica}_bucket{_rotulos(rotulos, '+Inf')} {total}")
+            linhas.append(f"{metrica}_sum{_rotulos(rotulos)} {soma:.6f}")
+            linhas.append(f"{metrica}_count{_rotulos(rotulos)} {total}")
+        return '\n'.join(linhas) + '\n'
+
+
+# Instância única do processo
+registro_metricas = RegistroMetricas()
@@ -0,0 +1,75 @@
+"""Plano de Consulta: etapas com dependências, as independentes em paralelo, tempo por etapa"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+from config import MAX_THREADS_CONSULTA
+
+
+class PlanoConsulta:
+    """
+    Etapas de uma requisição (ex.: consulta principal, saldo anterior, combinação):
+    - cada etapa começa assim que as etapas de que depende terminam
+    - etapas sem dependência entre si rodam ao mesmo tempo em executor_etapas; etapa
+      que fica pronta sozinha roda na própria thread de quem chamou executar()
+    - self.tempos guarda a duração de cada etapa em segundos
+    As queries continuam no executor compartilhado. As etapas não vão para ele porque ficam
+    bloqueadas esperando as queries e ocupariam as vagas delas.
+    Com CONSULTAS_EM_LOTE o web monta uma etapa só ('lote': principal e saldo no mesmo batch
+    por servidor) e o paralelismo fica entre servidores; etapas paralelas valem com o lote
+    desligado.
+    """
+
+    def __init__(self):
+        self.etapas = {}  # nome -> (funcao, depende_de)
+        self.tempos = {}
+
+    def etapa(self, nome: str, funcao, depende_de: tuple = ()):
+        """funcao(resultados) recebe {etapa: resultado} das dependências já concluídas"""
+        self.etapas[nome] = (funcao, tuple(depende_de))
+        return self
+
+    def _cronometrar(self, nome: str, funcao, resultados: dict):
+        inicio = perf_counter()
+        try:
+            return funcao(resultados)
+        finally:
+            self.tempos[nome] = round(perf_counter() - inicio, 3)
+
+    def executar(self, cancelado_callback=None) -> dict:
+        """
+        Executa o plano e retorna {etapa: resultado}. Após cancelamento nenhuma etapa nova
+        começa (as que dependiam dela ficam fora do resultado); erro numa etapa é propagado.
+        """
+        resultados, pendentes, rodando = {}, dict(self.etapas), {}
+        try:
+            while pendentes or rodando:
+                if cancelado_callback and cancelado_callback():
+                    pendentes.clear()
+                prontas = [nome for nome, (_, deps) in pendentes.items() if all(d in resultados for d in deps)]
+                if len(prontas) == 1 and not rodando:
+                    # Nada mais em andamento: roda aqui mesmo, sem passar por outra thread
+                    nome = prontas[0]
+                    funcao, deps = pendentes.pop(nome)
+                    resultados[nome] = self._cronometrar(nome, funcao, {d: resultados[d] for d in deps})
+                    continue
+                for nome in prontas:
+                    funcao, deps = pendentes.pop(nome)
+                    future = executor_etapas.submit(self._cronometrar, nome, funcao,
+                                                    {d: resultados[d] for d in deps})
+                    rodando[future] = nome
+                if not rodando:
+                    if pendentes:
+                        raise ValueError(f"Dependência inexistente ou circular: {', '.join(pendentes)}")
+                    break
+
+                feitos, _ = wait(rodando, return_when=FIRST_COMPLETED)
+                for future in feitos:
+                    resultados[rodando.pop(future)] = future.result()
+        finally:
+            # Erro numa etapa: as que já começaram terminam antes de propagar
+            wait(rodando)
+        self.tempos = {nome: self.tempos[nome] for nome in self.etapas if nome in self.tempos}
+        return resultados
+
+
+# Instância única do processo (threads só de orquestração, reaproveitadas entre requisições)
+executor_etapas = ThreadPoolExecutor(max_workers=MAX_THREADS_CONSULTA, thread_name_prefix='plano')
@@ -0,0 +1,222 @@
+"""Pool de Conexões SQL Server por (servidor, database)"""
+import pyodbc
+import logging
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition, Lock, Thread
+from time import monotonic, sleep
+from config import (get_connection_string, TIMEOUT_CONEXAO, POOL_MIN_CONEXOES,
+                    POOL_MAX_CONEXOES, POOL_TEMPO_OCIOSO)
+
+logger = logging.getLogger(__name__)
+INTERVALO_LIMPEZA = 60  # segundos entre varreduras de conexões ociosas
+
+
+class PoolEsgotado(pyodbc.OperationalError):
+    """Nenhuma conexão livre no prazo (saturação local, não indica servidor fora do ar)"""
+
+
+class _PoolServidor:
+    """Conexões de um único par (servidor, database)"""
+
+    def __init__(self, servidor: str, database: str, minimo: int, maximo: int):
+        self.servidor = servidor
+        self.database = database
+        self.minimo = minimo
+        self.maximo = maximo
+        self.livres = deque()  # (conn, instante_devolucao)
+        self.em_uso = 0
+        self.aquecendo = False
+        self.cond = Condition()
+        self.stats = {'criadas': 0, 'reutilizadas': 0, 'descartadas': 0,
+                      'falhas_verificacao': 0, 'esperas': 0}
+
+    def _conectar(self, timeout: int):
+        conn = pyodbc.connect(get_connection_string(self.servidor, self.database), timeout=timeout)
+        self._contar('criadas')
+        return conn
+
+    def _contar(self, chave: str):
+        with self.cond:
+            self.stats[chave] += 1
+
+    @staticmethod
+    def _verificar(conn) -> bool:
+        """Teste barato de vida da conexão antes de reutilizar"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _fechar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def adquirir(self, timeout: int):
+        """Retorna conexão livre verificada ou abre uma nova (respeitando o máximo)"""
+        limite = monotonic() + timeout
+        with self.cond:
+            while True:
+                if self.livres:
+                    conn, _ = self.livres.pop()  # LIFO: a mais recente tende a estar viva
+                    self.em_uso += 1
+                    break
+                if self.em_uso < self.maximo:
+                    self.em_uso += 1
+                    conn = None
+                    break
+                restante = limite - monotonic()
+                if restante <= 0:
+                    raise PoolEsgotado(
+                        f"Timeout aguardando conexão do pool ({self.servidor}/{self.database})")
+                self.stats['esperas'] += 1
+                self.cond.wait(restante)
+
+        # Conectar/verificar fora do lock para não bloquear as demais threads
+        try:
+            if conn is not None:
+                if self._verificar(conn):
+                    self._contar('reutilizadas')
+                    return conn
+                self._contar('falhas_verificacao')
+                self._fechar(conn)
+                self.aquecer()  # As demais livres podem ter caído junto
+            return self._conectar(timeout)
+        except Exception:
+            with self.cond:
+                self.em_uso -= 1
+                self.cond.notify()
+            raise
+
+    def devolver(self, conn, descartar: bool = False):
+        """Devolve conexão ao pool (ou fecha, se descartada)"""
+        if not descartar:
+            try:
+                conn.rollback()  # Encerrar transação implícita aberta pelo SELECT
+            except Exception:
+                descartar = True
+        with self.cond:
+            self.em_uso -= 1
+            if descartar:
+                self.stats['descartadas'] += 1
+            else:
+                self.livres.append((conn, monotonic()))
+            self.cond.notify()
+        if descartar:
+            self._fechar(conn)
+            self.aquecer()
+
+    def aquecer(self):
+        """Repõe em segundo plano as conexões que faltam para o mínimo (uma thread por vez)"""
+        with self.cond:
+            if self.aquecendo or len(self.livres) + self.em_uso >= self.minimo:
+                return
+            self.aquecendo = True
+        Thread(target=self._completar, daemon=True,
+               name=f"pool-{self.servidor}-{self.database}").start()
+
+    def _completar(self):
+        try:
+            while True:
+                with self.cond:
+                    if len(self.livres) + self.em_uso >= self.minimo:
+                        return
+                try:
+                    conn = self._conectar(TIMEOUT_CONEXAO)
+                except Exception as e:
+                    # Sem retentativa aqui: a varredura periódica tenta de novo
+                    logger.warning(f"⚠️ Pool {self.servidor}/{self.database}: "
+                                   f"falha ao abrir conexão mínima: {str(e)[:100]}")
+                    return
+                with self.cond:
+                    self.livres.append((conn, monotonic()))
+                    self.cond.notify()
+        finally:
+            with self.cond:
+                self.aquecendo = False
+
+    def limpar_ociosas(self, tempo_ocioso: int):
+        """Fecha conexões ociosas além do mínimo configurado"""
+        agora = monotonic()
+        remover = []
+        with self.cond:
+            # livres[0] é a mais antiga
+            while len(self.livres) > self.minimo and agora - self.livres[0][1] > tempo_ocioso:
+                remover.append(self.livres.popleft()[0])
+            self.stats['descartadas'] += len(remover)
+        for conn in remover:
+            self._fechar(conn)
+        return len(remover)
+
+    def estatisticas(self) -> dict:
+        with self.cond:
+            return {'livres': len(self.livres), 'em_uso': self.em_uso,
+                    'minimo': self.minimo, 'maximo': self.maximo, **self.stats}
+
+
+class PoolConexoes:
+    """Pool de conexões pyodbc compartilhado pelo processo, por (servidor, database)"""
+
+    def __init__(self, minimo: int = POOL_MIN_CONEXOES, maximo: int = POOL_MAX_CONEXOES,
+                 tempo_ocioso: int = POOL_TEMPO_OCIOSO):
+        self.minimo = minimo
+        self.maximo = max(1, maximo)
+        self.tempo_ocioso = tempo_ocioso
+        self._pools = {}
+        self._lock = Lock()
+        self._limpeza = None
+
+    def _pool(self, servidor: str, database: str) -> _PoolServidor:
+        chave = (servidor, database)
+        with self._lock:
+            pool = self._pools.get(chave)
+            if pool is None:
+                pool = self._pools[chave] = _PoolServidor(servidor, database, self.minimo, self.maximo)
+                pool.aquecer()
+            if self._limpeza is None:
+                self._limpeza = Thread(target=self._loop_limpeza, daemon=True)
+                self._limpeza.start()
+        return pool
+
+    def _loop_limpeza(self):
+        while True:
+            sleep(INTERVALO_LIMPEZA)
+            try:
+                pools = list(self._pools.values())
+                total = sum(p.limpar_ociosas(self.tempo_ocioso) for p in pools)
+                if total:
+                    logger.info(f"🧹 Pool: {total} conexões ociosas fechadas")
+                for p in pools:
+                    p.aquecer()  # Repor o mínimo se houve descarte ou falha de conexão
+            except Exception as e:
+                logger.error(f"❌ Limpeza do pool: {e}")
+
+    @contextmanager
+    def conexao(self, servidor: str, database: str = "AASI", timeout: int = TIMEOUT_CONEXAO):
+        """Empresta uma conexão; em caso de erro ela é descartada em vez de devolvida"""
+        pool = self._pool(servidor, database)
+        conn = pool.adquirir(timeout)
+        try:
+            yield conn
+        except BaseException:
+            pool.devolver(conn, descartar=True)
+            raise
+        else:
+            pool.devolver(conn)
+
+    def estatisticas(self) -> dict:
+        """Estatísticas por 'servidor/database'"""
+        with self._lock:
+            pools = list(self._pools.values())
+        return {f"{p.servidor}/{p.database}": p.estatisticas() for p in pools}
+
+
+# Instância única do processo
+pool_conexoes = PoolConexoes()
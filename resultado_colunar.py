@@ -0,0 +1,262 @@
+"""Resultado Colunar Paginado e Consultas sobre o DataFrame guardado (filtro, agrupamento, top-N)"""
+import json
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import pandas as pd
+from formatador import MAPA_COLUNAS, converter_para_colunas, converter_para_json, nomes_exibicao, texto_exibido
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional; json da stdlib como fallback
+    orjson = None
+
+LIMITE_PAGINA_MAX = 5000
+VISOES_EM_CACHE = 8  # (request, ordenação, filtros) já calculados
+TEXTOS_EM_CACHE = 32  # (request, coluna) já formatadas para filtrar
+OPERADORES = {'eq', 'ne', 'gt', 'ge', 'lt', 'le', 'contem', 'em'}
+FUNCOES_AGREGACAO = {'sum', 'count', 'mean', 'min', 'max'}
+
+
+def dumps(payload: dict) -> bytes:
+    """JSON rápido (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def combinar_saldo(df: pd.DataFrame, df_saldo: pd.DataFrame) -> pd.DataFrame:
+    """Consulta principal + saldo anterior com a coluna Origem"""
+    partes = []
+    if not df.empty:
+        partes.append(df.assign(Origem='Atual'))
+    if not df_saldo.empty:
+        partes.append(df_saldo.assign(Origem='Saldo Anterior'))
+    return pd.concat(partes, ignore_index=True) if partes else df
+
+
+def _coluna_original(df: pd.DataFrame, nome: str):
+    """Aceita o nome exibido (português) ou o nome original da coluna"""
+    if nome in df.columns:
+        return nome
+    for col in df.columns:
+        if MAPA_COLUNAS.get(col) == nome:
+            return col
+    return None
+
+
+def _valor_para(serie: pd.Series, valor):
+    """Converte o valor do filtro para o tipo da coluna (número, data ou texto)"""
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return pd.Timestamp(valor)
+    if pd.api.types.is_numeric_dtype(serie.dtype) or _numerica(serie):
+        return float(valor)
+    return valor
+
+
+def _numerica(serie: pd.Series) -> bool:
+    """Coluna object com Decimal/float (ex.: Saldo_Legal do pyodbc)"""
+    if serie.dtype != object:
+        return False
+    amostra = serie.dropna()
+    return not amostra.empty and hasattr(amostra.iloc[0], '__float__') and not isinstance(amostra.iloc[0], str)
+
+
+def _como_numero(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return serie
+    return pd.to_numeric(serie, errors='coerce')
+
+
+def _mascara(df: pd.DataFrame, filtro: dict) -> pd.Series:
+    col = _coluna_original(df, filtro.get('coluna', ''))
+    op = filtro.get('op', 'eq')
+    if col is None:
+        raise ValueError(f"Coluna não encontrada: {filtro.get('coluna')}")
+    if op not in OPERADORES:
+        raise ValueError(f"Operador inválido: {op}")
+
+    serie, valor = df[col], filtro.get('valor')
+    if op == 'contem':
+        return serie.astype(str).str.contains(str(valor), case=False, regex=False, na=False)
+    if op == 'em':
+        return serie.astype(str).isin([str(v) for v in (valor or [])])
+    try:
+        valor = _valor_para(serie, valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Valor inválido para {col}: {valor}")
+    if isinstance(valor, float):
+        serie = _como_numero(serie)
+    elif isinstance(valor, str):
+        serie = serie.astype(str)
+    return {'eq': serie.eq, 'ne': serie.ne, 'gt': serie.gt,
+            'ge': serie.ge, 'lt': serie.lt, 'le': serie.le}[op](valor).fillna(False)
+
+
+def consultar(df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """
+    Filtra, agrupa/agrega, ordena e limita um resultado (tudo vetorizado no pandas).
+    spec: {'filtros': [{'coluna', 'op', 'valor'}], 'agrupar': [colunas],
+           'agregacoes': [{'coluna', 'funcao'}], 'ordenar': [{'coluna', 'desc'}], 'limite': N}
+    """
+    for filtro in spec.get('filtros') or []:
+        df = df[_mascara(df, filtro).to_numpy(dtype=bool)]
+
+    agrupar = [_coluna_original(df, c) or c for c in spec.get('agrupar') or []]
+    agregacoes = spec.get('agregacoes') or []
+    if agrupar or agregacoes:
+        faltando = [c for c in agrupar if c not in df.columns]
+        if faltando:
+            raise ValueError(f"Coluna não encontrada: {', '.join(faltando)}")
+        colunas = {}
+        for agg in agregacoes or [{'funcao': 'count'}]:
+            funcao = agg.get('funcao', 'sum')
+            if funcao not in FUNCOES_AGREGACAO:
+                raise ValueError(f"Função inválida: {funcao}")
+            col = _coluna_original(df, agg.get('coluna', '')) if agg.get('coluna') else None
+            if agg.get('coluna') and col is None:
+                raise ValueError(f"Coluna não encontrada: {agg.get('coluna')}")
+            if funcao == 'count':
+                nome = f"Qtd_{col}" if col else 'Quantidade'
+                colunas[nome] = df[col].notna() if col else pd.Series(True, index=df.index)
+            else:
+                nome = col if funcao == 'sum' else f"{col}_{funcao}"
+                colunas[nome] = (_como_numero(df[col]), funcao)
+        base = pd.DataFrame({c: df[c] for c in agrupar})
+        for nome, valor in colunas.items():
+            base[nome] = valor[0] if isinstance(valor, tuple) else valor
+        funcoes = {nome: (v[1] if isinstance(v, tuple) else 'sum') for nome, v in colunas.items()}
+        if agrupar:
+            df = base.groupby(agrupar, sort=False, dropna=False).agg(funcoes).reset_index()
+        else:
+            df = pd.DataFrame({nome: [base[nome].agg(f)] for nome, f in funcoes.items()})
+
+    ordenar = spec.get('ordenar') or []
+    if ordenar:
+        cols = [_coluna_original(df, o.get('coluna', '')) for o in ordenar]
+        if None in cols:
+            raise ValueError(f"Coluna não encontrada: {ordenar[cols.index(None)].get('coluna')}")
+        df = df.sort_values(cols, ascending=[not o.get('desc') for o in ordenar],
+                            kind='stable', na_position='last')
+
+    limite = min(int(spec.get('limite') or LIMITE_PAGINA_MAX), LIMITE_PAGINA_MAX)
+    return df.head(limite)
+
+
+class ResultadosColunares:
+    """DataFrames dos resultados por request_id, servidos em páginas colunares"""
+
+    def __init__(self):
+        self._dfs = {}
+        self._visoes = OrderedDict()  # (request_id, ordenar, desc, filtros) -> DataFrame
+        self._textos = OrderedDict()  # (request_id, coluna) -> texto pt-BR exibido, minúsculo
+        self._lock = Lock()
+
+    def guardar(self, request_id: str, df: pd.DataFrame):
+        with self._lock:
+            self._dfs[request_id] = df
+
+    def obter(self, request_id: str):
+        with self._lock:
+            return self._dfs.get(request_id)
+
+    def remover(self, request_id: str):
+        with self._lock:
+            self._dfs.pop(request_id, None)
+            for cache in (self._visoes, self._textos):
+                for chave in [c for c in cache if c[0] == request_id]:
+                    del cache[chave]
+
+    def ids(self) -> list:
+        with self._lock:
+            return list(self._dfs)
+
+    def dados(self, request_id: str) -> list:
+        """Resultado completo como lista de dicts formatados (formato legado de /api/resultado)"""
+        df = self.obter(request_id)
+        return converter_para_json(df)[0] if df is not None else []
+
+    def _texto(self, request_id: str, df: pd.DataFrame, col: str):
+        """Coluna inteira formatada como na página (filtros casam com o que o usuário vê); memoriza"""
+        chave = (request_id, col)
+        with self._lock:
+            if chave in self._textos:
+                self._textos.move_to_end(chave)
+                return self._textos[chave]
+
+        texto = texto_exibido(col, df[col]).str.lower().reset_index(drop=True)
+
+        with self._lock:
+            self._textos[chave] = texto
+            while len(self._textos) > TEXTOS_EM_CACHE:
+                self._textos.popitem(last=False)
+        return texto
+
+    def _visao(self, request_id: str, df: pd.DataFrame, ordenar: str, desc: bool,
+               filtros: tuple) -> pd.DataFrame:
+        """Aplica filtros (texto exibido contido, sem diferenciar maiúsculas) e ordenação; memoriza o resultado"""
+        chave = (request_id, ordenar, desc, filtros)
+        with self._lock:
+            if chave in self._visoes:
+                self._visoes.move_to_end(chave)
+                return self._visoes[chave]
+
+        visao = df
+        if filtros:
+            mascara = np.ones(len(df), dtype=bool)
+            for nome, texto in filtros:
+                col = _coluna_original(df, nome)
+                if col is None:
+                    raise ValueError(f"Coluna não encontrada: {nome}")
+                # '1.234,50' e '31/01/2024' como na tela, não o valor bruto
+                contem = self._texto(request_id, df, col).str.contains(str(texto).lower(), regex=False)
+                mascara &= contem.to_numpy(dtype=bool)
+            visao = df[mascara]
+        if ordenar:
+            col = _coluna_original(df, ordenar)
+            if col is None:
+                raise ValueError(f"Coluna não encontrada: {ordenar}")
+            # Ordena pelo valor bruto (números e datas na ordem certa, não como texto)
+            visao = visao.sort_values(col, ascending=not desc, kind='stable', na_position='last')
+
+        with self._lock:
+            self._visoes[chave] = visao
+            while len(self._visoes) > VISOES_EM_CACHE:
+                self._visoes.popitem(last=False)
+        return visao
+
+    def consultar(self, request_id: str, spec: dict) -> dict:
+        """Filtro/agrupamento/ordenação/top-N sobre o resultado guardado; devolve só a resposta"""
+        df = self.obter(request_id)
+        if df is None:
+            raise KeyError(request_id)
+        resposta = consultar(df, spec)
+        colunas, valores = converter_para_colunas(resposta)
+        return {'colunas': colunas or nomes_exibicao(resposta.columns),
+                'valores': valores, 'linhas': len(resposta), 'total_geral': len(df)}
+
+    def pagina(self, request_id: str, offset: int = 0, limit: int = 500, ordenar: str = None,
+               desc: bool = False, filtros: list = None) -> dict:
+        """Página colunar: {'colunas', 'valores' (uma lista por coluna), 'total', 'offset', 'limit'}"""
+        df = self.obter(request_id)
+        if df is None:
+            raise KeyError(request_id)
+
+        offset = max(0, offset)
+        limit = min(max(1, limit), LIMITE_PAGINA_MAX)
+        visao = self._visao(request_id, df, ordenar or None, desc, tuple(filtros or ()))
+
+        # Só as linhas da página passam pela formatação pt-BR
+        colunas, valores = converter_para_colunas(visao.iloc[offset:offset + limit])
+        return {
+            'colunas': colunas or nomes_exibicao(df.columns),
+            'valores': valores,
+            'total': len(visao),
+            'total_geral': len(df),
+            'offset': offset,
+            'limit': limit
+        }
+
+
+# Instância única do processo
+resultados_colunares = ResultadosColunares()
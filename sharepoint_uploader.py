@@ -3,25 +3,79 @@ import requests
 import pandas as pd
 import io
 import logging
-from config import (AZURE_CLIENT_ID, AZURE_CLIENT_SECRET, AZURE_TENANT_ID,
-                    SHAREPOINT_DRIVE_ID, SHAREPOINT_PASTA_DESTINO)
+import tempfile
+import time
+from threading import RLock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from compressao import comprimir
+from config import (AZURE_CLIENT_ID, AZURE_CLIENT_SECRET, AZURE_TENANT_ID, AZURE_LOGIN_URL, GRAPH_URL,
+                    SHAREPOINT_DRIVE_ID, SHAREPOINT_PASTA_DESTINO, EXPORT_LINHAS_POR_BLOCO, COMPRESSAO_PARQUET,
+                    UPLOAD_SESSAO_ACIMA_MB, UPLOAD_PARTE_KB, UPLOAD_TENTATIVAS, UPLOAD_MEMORIA_MB)
 
 logger = logging.getLogger(__name__)
 
+UNIDADE_PARTE = 320 * 1024  # Graph exige partes múltiplas de 320 KiB
+TAMANHO_PARTE = max(1, UPLOAD_PARTE_KB // 320) * UNIDADE_PARTE
+LIMITE_UPLOAD_SIMPLES = UPLOAD_SESSAO_ACIMA_MB * 1024 * 1024  # PUT .../content aceita até 4 MB
+RENOVAR_TOKEN_ANTES = 300  # segundos antes do expires_in
+
+
+def _formatar_numero_br(x) -> str:
+    return f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if pd.notna(x) else ""
+
+
+def _gerar_csv(df: pd.DataFrame, colunas_ordem: list = None):
+    """CSV (sep=';', UTF-8 com BOM) em pedaços de bytes, com floats no formato BR"""
+    if colunas_ordem:
+        cols = [c for c in colunas_ordem if c in df.columns]
+        cols += [c for c in df.columns if c not in colunas_ordem]
+        df = df[cols]
+    floats = df.select_dtypes(include=['float64', 'float32']).columns
+
+    yield ("\ufeff" + pd.DataFrame(columns=df.columns).to_csv(index=False, sep=";")).encode("utf-8")
+    for inicio in range(0, len(df), EXPORT_LINHAS_POR_BLOCO):
+        bloco = df.iloc[inicio:inicio + EXPORT_LINHAS_POR_BLOCO]
+        if len(floats):
+            bloco = bloco.assign(**{col: bloco[col].apply(_formatar_numero_br) for col in floats})
+        yield bloco.to_csv(index=False, header=False, sep=";").encode("utf-8")
+
+
+def _criar_sessao() -> requests.Session:
+    """Session com keep-alive e retentativa (429/5xx, respeitando Retry-After) para GET/POST"""
+    retry = Retry(total=UPLOAD_TENTATIVAS, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=frozenset({"GET", "POST"}), respect_retry_after_header=True,
+                  raise_on_status=False)
+    sessao = requests.Session()
+    sessao.mount("https://", HTTPAdapter(max_retries=retry))
+    sessao.mount("http://", HTTPAdapter(max_retries=retry))
+    return sessao
+
+
+def _arquivo_temporario():
+    """Arquivo em memória que passa para o disco acima de UPLOAD_MEMORIA_MB"""
+    return tempfile.SpooledTemporaryFile(max_size=UPLOAD_MEMORIA_MB * 1024 * 1024)
+
 
 class SharePointUploader:
-    """Upload para SharePoint via Graph API"""
+    """
+    Upload para SharePoint via Graph API.
+    Token (renovado antes de expirar), id da pasta e conexões HTTP são reaproveitados entre uploads.
+    """
 
     def __init__(self):
         self.drive_id = SHAREPOINT_DRIVE_ID
         self.base_folder = SHAREPOINT_PASTA_DESTINO
-        self.access_token = self._get_token()
-        self.pasta_id = self._obter_pasta_id()
+        self.sessao = _criar_sessao()
+        self._access_token = None
+        self._token_expira = 0.0
+        self._pasta_id = None
+        self._lock = RLock()  # pasta_id chama access_token com o lock já adquirido
 
     def _get_token(self) -> str:
         """Obtém token OAuth2"""
-        r = requests.post(
-            f"https://login.microsoftonline.com/{AZURE_TENANT_ID}/oauth2/v2.0/token",
+        r = self.sessao.post(
+            f"{AZURE_LOGIN_URL}/{AZURE_TENANT_ID}/oauth2/v2.0/token",
             data={
                 "client_id": AZURE_CLIENT_ID,
                 "client_secret": AZURE_CLIENT_SECRET,
@@ -30,28 +84,51 @@ class SharePointUploader:
             }, timeout=10)
         r.raise_for_status()
         logger.info("✅ Autenticação Graph OK")
-        return r.json()["access_token"]
+        token = r.json()
+        self._token_expira = time.monotonic() + int(token.get("expires_in", 3600)) - RENOVAR_TOKEN_ANTES
+        return token["access_token"]
+
+    @property
+    def access_token(self) -> str:
+        """Token em cache até RENOVAR_TOKEN_ANTES segundos do vencimento"""
+        with self._lock:
+            if self._access_token is None or time.monotonic() >= self._token_expira:
+                self._access_token = self._get_token()
+            return self._access_token
+
+    @property
+    def pasta_id(self) -> str:
+        """Id da pasta de destino (buscado/criado uma vez)"""
+        with self._lock:
+            if self._pasta_id is None:
+                self._pasta_id = self._obter_pasta_id()
+            return self._pasta_id
+
+    def invalidar(self):
+        """Descarta token e pasta em cache (ex.: 401 ou pasta removida)"""
+        with self._lock:
+            self._access_token, self._pasta_id = None, None
 
     def _headers(self) -> dict:
         return {"Authorization": f"Bearer {self.access_token}", "Accept": "application/json"}
 
     def _obter_pasta_id(self) -> str:
         """Obtém ou cria pasta de destino"""
-        r = requests.get(
-            f"https://graph.microsoft.com/v1.0/drives/{self.drive_id}/root/children",
+        r = self.sessao.get(
+            f"{GRAPH_URL}/drives/{self.drive_id}/root/children",
             headers=self._headers(), timeout=10)
         r.raise_for_status()
-        
+
         for item in r.json().get("value", []):
             if item.get("name") == self.base_folder and "folder" in item:
                 return item["id"]
-        
+
         return self._criar_pasta(self.base_folder)
 
     def _criar_pasta(self, nome: str) -> str:
         """Cria pasta na raiz do drive"""
-        r = requests.post(
-            f"https://graph.microsoft.com/v1.0/drives/{self.drive_id}/root/children",
+        r = self.sessao.post(
+            f"{GRAPH_URL}/drives/{self.drive_id}/root/children",
             headers=self._headers(),
             json={"name": nome, "folder": {}, "@microsoft.graph.conflictBehavior": "rename"},
             timeout=10)
@@ -59,55 +136,149 @@ class SharePointUploader:
         logger.info(f"✅ Pasta '{nome}' criada")
         return r.json()["id"]
 
-    def upload_csv(self, df: pd.DataFrame, filename: str, colunas_ordem: list = None) -> dict:
-        """Upload DataFrame como CSV"""
+    def upload_csv(self, df: pd.DataFrame, filename: str, colunas_ordem: list = None,
+                   progresso=None, compressao: str = None) -> dict:
+        """
+        Upload DataFrame como CSV (gerado em blocos, sem montar o arquivo inteiro em memória);
+        compressao 'gzip'/'zstd' comprime em streaming (filename .csv.gz/.csv.zst)
+        """
         try:
-            df_copy = df.copy()
-            
-            if colunas_ordem:
-                cols = [c for c in colunas_ordem if c in df_copy.columns]
-                cols += [c for c in df_copy.columns if c not in colunas_ordem]
-                df_copy = df_copy[cols]
-            
-            # Formatar números BR
-            for col in df_copy.select_dtypes(include=['float64', 'float32']).columns:
-                df_copy[col] = df_copy[col].apply(
-                    lambda x: f"{x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") 
-                    if pd.notna(x) else "")
-
-            buf = io.StringIO()
-            df_copy.to_csv(buf, index=False, encoding="utf-8-sig", sep=";")
-            content = buf.getvalue().encode("utf-8-sig")
-
-            r = requests.put(
-                f"https://graph.microsoft.com/v1.0/drives/{self.drive_id}/items/{self.pasta_id}:/{filename}:/content",
-                headers={**self._headers(), "Content-Type": "application/octet-stream"},
-                data=content, timeout=60)
-            r.raise_for_status()
+            pedacos = _gerar_csv(df, colunas_ordem)
+            if compressao:
+                pedacos = comprimir(pedacos, compressao)
+            with _arquivo_temporario() as arquivo:
+                for pedaco in pedacos:
+                    arquivo.write(pedaco)
+                return self._enviar(arquivo, filename, progresso)
 
-            logger.info(f"✅ Upload: {filename} ({len(content)/1024:.1f}KB)")
-            return {"status": "sucesso", "url": r.json().get("webUrl", ""), "mensagem": f"Upload: {filename}"}
-        
         except Exception as e:
             logger.error(f"❌ Upload falhou: {e}")
             return {"status": "erro", "mensagem": str(e)}
 
-    def upload_parquet(self, df: pd.DataFrame, filename: str) -> dict:
-        """Upload DataFrame como Parquet"""
+    def _na_pasta(self, metodo: str, caminho: str, headers: dict = None, **kwargs) -> requests.Response:
+        """Requisição sobre um item da pasta; 401/404 renova token e pasta em cache e tenta mais uma vez"""
+        for tentativa in (1, 2):
+            r = self.sessao.request(
+                metodo, f"{GRAPH_URL}/drives/{self.drive_id}/items/{self.pasta_id}:/{caminho}",
+                headers={**self._headers(), **(headers or {})}, **kwargs)
+            if r.status_code in (401, 404) and tentativa == 1:
+                logger.warning(f"⚠️ Graph HTTP {r.status_code}: renovando token e pasta")
+                self.invalidar()
+                continue
+            r.raise_for_status()
+            return r
+
+    def _enviar(self, arquivo, filename: str, progresso=None) -> dict:
+        """
+        Envia o arquivo para a pasta de destino (PUT simples ou upload session em partes).
+        progresso(bytes_enviados, bytes_total) é chamado no início e a cada parte aceita.
+        """
+        progresso = progresso or (lambda enviados, total: None)
+        tamanho = arquivo.seek(0, io.SEEK_END)
+        arquivo.seek(0)
+        progresso(0, tamanho)
+        if tamanho <= LIMITE_UPLOAD_SIMPLES:
+            r = self._na_pasta("PUT", f"{filename}:/content", data=arquivo.read(), timeout=60,
+                               headers={"Content-Type": "application/octet-stream"})
+            item = r.json()
+        else:
+            item = self._enviar_em_partes(arquivo, tamanho, filename, progresso)
+
+        progresso(tamanho, tamanho)
+        logger.info(f"✅ Upload: {filename} ({tamanho/1024:.1f}KB)")
+        return {"status": "sucesso", "url": item.get("webUrl", ""), "mensagem": f"Upload: {filename}"}
+
+    def _enviar_em_partes(self, arquivo, tamanho: int, filename: str, progresso) -> dict:
+        """
+        Upload session do Graph: partes de TAMANHO_PARTE com Content-Range.
+        Parte que falha é retentada com backoff, retomando do que o servidor já recebeu.
+        """
+        r = self._na_pasta("POST", f"{filename}:/createUploadSession", timeout=10,
+                           json={"item": {"@microsoft.graph.conflictBehavior": "replace"}})
+        url = r.json()["uploadUrl"]  # URL pré-autenticada: sem header Authorization
+        logger.info(f"📤 Upload session: {filename} ({tamanho/1024/1024:.1f}MB em partes de "
+                    f"{TAMANHO_PARTE // 1024}KB)")
+
+        inicio, falhas = 0, 0
         try:
-            buf = io.BytesIO()
-            df.to_parquet(buf, index=False, engine="pyarrow", compression="snappy")
-            content = buf.getvalue()
-
-            r = requests.put(
-                f"https://graph.microsoft.com/v1.0/drives/{self.drive_id}/items/{self.pasta_id}:/{filename}:/content",
-                headers={**self._headers(), "Content-Type": "application/octet-stream"},
-                data=content, timeout=60)
+            while True:
+                arquivo.seek(inicio)
+                parte = arquivo.read(TAMANHO_PARTE)
+                if not parte:
+                    raise RuntimeError(f"Upload session não concluída em {inicio}/{tamanho} bytes")
+                fim = inicio + len(parte) - 1
+                try:
+                    r = self.sessao.put(url, headers={"Content-Length": str(len(parte)),
+                                                      "Content-Range": f"bytes {inicio}-{fim}/{tamanho}"},
+                                        data=parte, timeout=60)
+                    if r.status_code in (200, 201):
+                        return r.json()
+                    if r.status_code == 202:
+                        inicio, falhas = self._proximo_byte(r.json(), fim + 1), 0
+                        progresso(inicio, tamanho)
+                        continue
+                    if r.status_code not in (416, 429) and r.status_code < 500:
+                        r.raise_for_status()  # Sessão expirada/inválida: não adianta retentar
+                    erro = f"HTTP {r.status_code}"
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    erro = str(e)
+
+                falhas += 1
+                if falhas > UPLOAD_TENTATIVAS:
+                    raise RuntimeError(f"Parte {inicio}-{fim} falhou {falhas}x: {erro}")
+                logger.warning(f"⚠️ Parte {inicio}-{fim}: {erro} - tentativa {falhas}/{UPLOAD_TENTATIVAS}")
+                time.sleep(min(2 ** falhas, 30))
+                inicio = self._retomar(url, inicio)
+        except Exception:
+            try:
+                self.sessao.delete(url, timeout=10)  # Descarta a sessão incompleta
+            except requests.RequestException:
+                pass
+            raise
+
+    @staticmethod
+    def _proximo_byte(status: dict, padrao: int) -> int:
+        """Primeiro byte de nextExpectedRanges (ex.: ['5242880-'])"""
+        faixas = status.get("nextExpectedRanges") or []
+        return int(faixas[0].split("-")[0]) if faixas else padrao
+
+    def _retomar(self, url: str, inicio: int) -> int:
+        """Consulta a sessão para saber de onde continuar"""
+        try:
+            r = self.sessao.get(url, timeout=10)
             r.raise_for_status()
+            return self._proximo_byte(r.json(), inicio)
+        except requests.RequestException:
+            return inicio
+
+    def upload_parquet(self, df: pd.DataFrame, filename: str, progresso=None) -> dict:
+        """Upload DataFrame bruto como Parquet (tipado, entidade/conta com dictionary encoding)"""
+        try:
+            import pyarrow.parquet as pq
+            from exportacao import tabela_arrow
+
+            with _arquivo_temporario() as arquivo:
+                pq.write_table(tabela_arrow(df), arquivo, compression=COMPRESSAO_PARQUET)
+                return self._enviar(arquivo, filename, progresso)
 
-            logger.info(f"✅ Upload: {filename} ({len(content)/1024:.1f}KB)")
-            return {"status": "sucesso", "url": r.json().get("webUrl", ""), "mensagem": f"Upload: {filename}"}
-        
         except Exception as e:
             logger.error(f"❌ Upload falhou: {e}")
             return {"status": "erro", "mensagem": str(e)}
+
+    def upload_arrow(self, df: pd.DataFrame, filename: str, progresso=None) -> dict:
+        """Upload DataFrame bruto como Arrow IPC (Feather v2)"""
+        try:
+            import pyarrow.feather as feather
+            from exportacao import tabela_arrow
+
+            with _arquivo_temporario() as arquivo:
+                feather.write_feather(tabela_arrow(df), arquivo, compression="lz4")
+                return self._enviar(arquivo, filename, progresso)
+
+        except Exception as e:
+            logger.error(f"❌ Upload falhou: {e}")
+            return {"status": "erro", "mensagem": str(e)}
+
+
+# Instância única do processo (token, pasta e conexões reaproveitados entre uploads)
+sharepoint_uploader = SharePointUploader()
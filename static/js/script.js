@@ -12,6 +12,7 @@ let requestIdAtual = null;
 let consultaEmAndamento = false;
 let intervalLogs = null;
 let ultimoLogIndex = 0;
+let requestIdResultado = null;  // Resultado guardado no servidor (exportação sem reenviar dados)
 
 document.addEventListener('DOMContentLoaded', function() {
     verificarStatusServidor();
@@ -23,7 +24,7 @@ document.addEventListener('DOMContentLoaded', function() {
 // Carregar consultas
 // ============================================================
 function carregarConsultasDisponiveis() {
-    fetch('/api/consultas/disponiveis')
+    fetch('/api/consultas_disponiveis')
         .then(response => response.json())
         .then(data => {
             const consultas = Array.isArray(data) ? data : (data.consultas || []);
@@ -211,23 +212,25 @@ function executarConsulta() {
     mostrarLoading();
     iniciarConsulta();
 
-    executarConsultaPreDefinida(tipo, formData);
+    if (consulta.tipo_execucao === 'single_servidor') {
+        executarConsultaPreDefinida(tipo, formData);
+    } else {
+        executarConsultaMultiServidor(tipo, formData);
+    }
 }
 
 // ============================================================
 // Single servidor
 // ============================================================
 function executarConsultaPreDefinida(tipo, formData) {
-    fetch('/api/consultas/executar', {
+    fetch('/api/consultar', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
             tipo,
             entidade: formData.get('entidade') || null,
             ano: formData.get('ano') ? parseInt(formData.get('ano')) : null,
-            periodo: formData.get('periodo') ? parseInt(formData.get('periodo')) : null,
-            data_limite: formData.get('data_limite') || null,
-            meses_atras: formData.get('meses_atras') ? parseInt(formData.get('meses_atras')) : null
+            periodo: formData.get('periodo') ? parseInt(formData.get('periodo')) : null
         })
     })
     .then(r => r.json())
@@ -235,39 +238,17 @@ function executarConsultaPreDefinida(tipo, formData) {
         esconderLoading();
         finalizarConsulta();
 
-        if (data.error) {
-            mostrarErro(data.error);
-            return;
-        }
-
         if (data.status && data.status !== 'sucesso') {
             mostrarErro(data.mensagem || 'Erro ao executar consulta');
             return;
         }
 
-        codex/fix-version-conflict-for-diagnosticsource-wz062u
-        const normalizado = normalizarResultadoApi(data);
-        dadosConsulta = normalizado.dados || [];
-        colunasOrdenadas = normalizado.colunas || [];
-        requestIdAtual = data.request_id || null;
-
-        if (normalizado.avisos && normalizado.avisos.length) {
-            mostrarPainelLogs();
-            normalizado.avisos.forEach(a => adicionarLog('⚠️ ' + a, 'warning'));
-        }
-
-        if (requestIdAtual) {
-            iniciarSSE(requestIdAtual);
-        } else {
-            mostrarResultados(normalizado);
-
         dadosConsulta = data.dados || [];
         colunasOrdenadas = data.colunas || [];
-        requestIdAtual = data.request_id || null;
+        requestIdResultado = null;
 
         if (data.avisos && data.avisos.length) {
             data.avisos.forEach(a => adicionarLog('⚠️ ' + a, 'warning'));
-        claude/optimize-csharp-ubuntu-du8RP
         }
 
         mostrarResultados(data);
@@ -280,90 +261,40 @@ function executarConsultaPreDefinida(tipo, formData) {
 }
 
 // ============================================================
-// Multi-servidor
+// Multi-servidor (request_id + stream SSE de logs e linhas)
 // ============================================================
-        codex/fix-version-conflict-for-diagnosticsource-wz062u
-function executarConsultaMultiServidor(tipo, formData, consulta) {
+function executarConsultaMultiServidor(tipo, formData) {
     mostrarPainelLogs();
     limparLogs();
     adicionarLog('🚀 Iniciando consulta...', 'info');
 
-    executarConsultaPreDefinida(tipo, formData);
-}
-
-function iniciarSSE(requestId) {
-    if (!requestId) return;
-
-    if (intervalLogs) {
-        clearInterval(intervalLogs);
-        intervalLogs = null;
-    }
-
-    ultimoLogIndex = 0;
-    requestIdAtual = requestId;
-
-    const poll = () => {
-        fetch(`/api/logs/${requestId}`)
-            .then(r => r.json())
-            .then(data => {
-                const logs = data.logs || [];
-                for (let i = ultimoLogIndex; i < logs.length; i++) {
-                    const msg = logs[i];
-                    let tipo = 'info';
-                    const lower = msg.toLowerCase();
-                    if (lower.includes('erro')) tipo = 'error';
-                    else if (lower.includes('conclu') || lower.includes('sucesso')) tipo = 'success';
-                    else if (lower.includes('cancel')) tipo = 'warning';
-                    adicionarLog(msg, tipo);
-                }
-                ultimoLogIndex = logs.length;
-            })
-            .catch(() => {});
-
-        fetch(`/api/status/${requestId}`)
-            .then(r => r.json())
-            .then(status => {
-                const st = (status.status || '').toLowerCase();
-                if (st === 'completed' || st === 'error' || st === 'cancelled') {
-                    clearInterval(intervalLogs);
-                    intervalLogs = null;
-                    buscarResultado(requestId);
-                }
-            })
-            .catch(() => {});
-    };
-
-    poll();
-    intervalLogs = setInterval(poll, 2000);
-}
-
-function buscarResultado(requestId) {
-    fetch(`/api/resultado/${requestId}`)
-        .then(r => r.json())
-        .then(data => {
-            const normalizado = normalizarResultadoApi(data);
-            dadosConsulta = normalizado.dados || [];
-            colunasOrdenadas = normalizado.colunas || [];
-            mostrarResultados(normalizado);
-            esconderLoading();
-            finalizarConsulta();
+    fetch('/api/consultar_multi', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            tipo,
+            ano: formData.get('ano') ? parseInt(formData.get('ano')) : null,
+            periodo: formData.get('periodo') ? parseInt(formData.get('periodo')) : null,
+            data_limite: formData.get('data_limite') || null,
+            meses_atras: formData.get('meses_atras') ? parseInt(formData.get('meses_atras')) : 2,
+            incluir_saldo_anterior: formData.get('incluir_saldo_anterior') === 'on'
         })
-        .catch(() => {
+    })
+    .then(r => r.json())
+    .then(data => {
+        if (!data.request_id) {
             esconderLoading();
             finalizarConsulta();
-        });
-
-function executarConsultaMultiServidor(...args) {
-    console.warn('executarConsultaMultiServidor desativado: usando /api/consultas/executar');
-}
-
-function iniciarSSE(...args) {
-    console.warn('iniciarSSE desativado: usando /api/consultas/executar');
-}
-
-function buscarResultado(...args) {
-    console.warn('buscarResultado desativado: usando /api/consultas/executar');
-        claude/optimize-csharp-ubuntu-du8RP
+            mostrarErro(data.mensagem || 'Erro ao iniciar consulta');
+            return;
+        }
+        iniciarStreamResultados(data.request_id);
+    })
+    .catch(e => {
+        esconderLoading();
+        finalizarConsulta();
+        mostrarErro('Erro: ' + e.message);
+    });
 }
 
 function mostrarPainelLogs() {
@@ -394,27 +325,150 @@ function adicionarLog(mensagem, tipo = 'info') {
 }
 
 
-function normalizarResultadoApi(data) {
-    if (data && data.dados) {
-        return {
-            ...data,
-            linhas_afetadas: data.total_linhas || data.dados.length,
-            tempo_total: data.tempo_segundos
-        };
+
+// ============================================================
+// Resultados progressivos (SSE: evento 'linhas' por servidor)
+// ============================================================
+let linhasRecebidas = 0;
+let servidoresRecebidos = new Set();
+let uploadPendente = false;
+let doneRecebido = false;
+
+function iniciarStreamResultados(requestId) {
+    if (eventSource) eventSource.close();
+    linhasRecebidas = 0;
+    servidoresRecebidos = new Set();
+    uploadPendente = false;
+    doneRecebido = false;
+    requestIdAtual = requestId;
+    document.getElementById('tableHead').innerHTML = '';
+    document.getElementById('tableBody').innerHTML = '';
+
+    eventSource = new EventSource(`/api/logs/${requestId}`);
+
+    eventSource.onmessage = (e) => {
+        const msg = e.data;
+        if (!msg) return;  // heartbeat
+        if (msg === 'DONE') {
+            doneRecebido = true;
+            // Upload SharePoint em segundo plano: stream segue aberto até o evento final
+            if (!uploadPendente) fecharStream();
+            buscarResultadoFinal(requestId);
+            return;
+        }
+        const lower = msg.toLowerCase();
+        let tipo = 'info';
+        if (lower.includes('erro')) tipo = 'error';
+        else if (lower.includes('conclu') || lower.includes('sucesso')) tipo = 'success';
+        else if (lower.includes('cancel')) tipo = 'warning';
+        adicionarLog(msg, tipo);
+    };
+
+    eventSource.addEventListener('linhas', (e) => adicionarLinhasParciais(JSON.parse(e.data)));
+    eventSource.addEventListener('upload', (e) => atualizarUpload(JSON.parse(e.data)));
+}
+
+function fecharStream() {
+    if (eventSource) eventSource.close();
+    eventSource = null;
+}
+
+function atualizarUpload(status) {
+    const finalizado = status.estado === 'concluido' || status.estado === 'falhou';
+    uploadPendente = !finalizado;
+    if (status.estado === 'enviando' && status.bytes_total) {
+        const pct = Math.round(100 * status.bytes_enviados / status.bytes_total);
+        const btn = document.getElementById('sharepointBtn');
+        if (btn) btn.innerHTML = `<span class="btn-icon">⏳</span> ${pct}%`;
+    }
+    if (finalizado) {
+        const btn = document.getElementById('sharepointBtn');
+        if (btn) btn.innerHTML = '<span class="btn-icon">☁️</span> SharePoint';
+        mostrarToast(status.estado === 'concluido' ? `☁️ ${status.arquivo} enviado ao SharePoint`
+                                                   : `❌ Upload SharePoint: ${status.mensagem || 'falhou'}`,
+                     status.estado === 'concluido' ? 'success' : 'error');
+        if (doneRecebido) fecharStream();
+    }
+}
+
+function adicionarLinhasParciais(bloco) {
+    servidoresRecebidos.add(bloco.servidor);
+    const total = (bloco.valores[0] || []).length;
+    linhasRecebidas += total + (bloco.omitidas || 0);
+
+    const resultadoDiv = document.getElementById('resultadoDiv');
+    const tableHead = document.getElementById('tableHead');
+    const tableBody = document.getElementById('tableBody');
+
+    // Primeiro bloco define o cabeçalho
+    if (bloco.colunas.length && !tableHead.children.length) {
+        const headerRow = document.createElement('tr');
+        bloco.colunas.forEach(coluna => {
+            const th = document.createElement('th');
+            th.textContent = coluna;
+            headerRow.appendChild(th);
+        });
+        tableHead.appendChild(headerRow);
+        resultadoDiv.style.display = 'block';
+        esconderLoading();
     }
 
-    if (data && data.results) {
-        return {
-            status: data.status || 'sucesso',
-            dados: data.results || [],
-            colunas: data.results && data.results.length ? Object.keys(data.results[0]) : [],
-            avisos: (data.errors || []).map(e => `${e.servidor || 'Servidor'}: ${e.error}`),
-            linhas_afetadas: data.total_rows || 0,
-            tempo_total: data.execution_time_ms ? (data.execution_time_ms / 1000).toFixed(2) : null
-        };
+    // Mesmo limite de exibição do resultado final
+    const fragmento = document.createDocumentFragment();
+    for (let i = 0; i < total && tableBody.children.length + fragmento.children.length < 1000; i++) {
+        const tr = document.createElement('tr');
+        bloco.valores.forEach(coluna => {
+            const td = document.createElement('td');
+            td.textContent = coluna[i] ?? '';
+            tr.appendChild(td);
+        });
+        fragmento.appendChild(tr);
     }
+    tableBody.appendChild(fragmento);
+
+    document.getElementById('resultadoInfo').textContent =
+        `⏳ ${linhasRecebidas} linha(s) recebida(s) de ${servidoresRecebidos.size} servidor(es)...`;
+}
+
+const LINHAS_TABELA = 1000;
+
+function buscarResultadoFinal(requestId) {
+    // Só metadados; as linhas exibidas vêm da API paginada (o resultado completo fica no servidor)
+    fetch(`/api/resultado/${requestId}?dados=0`)
+        .then(r => r.json())
+        .then(data => {
+            colunasOrdenadas = data.colunas || [];
+            requestIdResultado = data.paginado ? requestId : null;
+            if (!data.paginado || !data.linhas_afetadas) {
+                dadosConsulta = data.dados || [];
+                mostrarResultados(data);
+                return;
+            }
+            return fetch(`/api/resultado/${requestId}/pagina?offset=0&limit=${LINHAS_TABELA}`)
+                .then(r => r.json())
+                .then(pagina => {
+                    dadosConsulta = linhasDaPagina(pagina);
+                    colunasOrdenadas = pagina.colunas || colunasOrdenadas;
+                    mostrarResultados({ ...data, colunas: colunasOrdenadas, dados: dadosConsulta });
+                });
+        })
+        .catch(e => mostrarErro('Erro: ' + e.message))
+        .finally(() => {
+            esconderLoading();
+            finalizarConsulta();
+        });
+}
 
-    return { status: 'erro', dados: [], colunas: [], avisos: ['Resposta inválida da API'] };
+function linhasDaPagina(pagina) {
+    // Página colunar (uma lista por coluna) -> linhas {coluna: valor}
+    const total = (pagina.valores[0] || []).length;
+    const linhas = [];
+    for (let i = 0; i < total; i++) {
+        const linha = {};
+        pagina.colunas.forEach((coluna, j) => linha[coluna] = pagina.valores[j][i]);
+        linhas.push(linha);
+    }
+    return linhas;
 }
 
 // ============================================================
@@ -475,8 +529,8 @@ function mostrarResultados(data) {
     });
     tableHead.appendChild(headerRow);
 
-    // Limitar a 1000 linhas
-    const dadosExibir = data.dados.slice(0, 1000);
+    // Limitar a LINHAS_TABELA linhas
+    const dadosExibir = data.dados.slice(0, LINHAS_TABELA);
     
     dadosExibir.forEach(row => {
         const tr = document.createElement('tr');
@@ -495,13 +549,14 @@ function mostrarResultados(data) {
         tableBody.appendChild(tr);
     });
     
-    // Aviso de mais linhas
-    if (data.dados.length > 1000) {
+    // Aviso de mais linhas (resultado paginado: só a 1ª página veio do servidor)
+    const totalLinhas = Math.max(data.linhas_afetadas || 0, data.dados.length);
+    if (totalLinhas > dadosExibir.length) {
         const tr = document.createElement('tr');
         const td = document.createElement('td');
         td.colSpan = colunas.length;
         td.className = 'mais-linhas-aviso';
-        td.textContent = `... e mais ${data.dados.length - 1000} linha(s). Use Exportar CSV/Excel para ver todos os dados.`;
+        td.textContent = `... e mais ${totalLinhas - dadosExibir.length} linha(s). Use Exportar CSV/Excel para ver todos os dados.`;
         tr.appendChild(td);
         tableBody.appendChild(tr);
     }
@@ -524,9 +579,10 @@ function enviarParaSharePoint() {
     fetch('/api/upload_sharepoint', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
+        // Resultado guardado no servidor: vai só o request_id (a tela tem apenas a 1ª página)
         body: JSON.stringify({
-            tipo: tipoConsultaAtual, dados: dadosConsulta, 
-            colunas: colunasOrdenadas, ...parametrosUltimaConsulta
+            tipo: tipoConsultaAtual, colunas: colunasOrdenadas, ...parametrosUltimaConsulta,
+            ...(requestIdResultado ? { request_id: requestIdResultado } : { dados: dadosConsulta })
         })
     })
     .then(r => r.json())
@@ -544,7 +600,17 @@ function enviarParaSharePoint() {
 // ============================================================
 // Exportar
 // ============================================================
+function baixarDoServidor(formato, extensao) {
+    const nome = `consulta_${tipoConsultaAtual}_${new Date().toISOString().slice(0,10)}`;
+    const link = document.createElement('a');
+    link.href = `/api/resultado/${requestIdResultado}/exportar/${formato}?nome_arquivo=${encodeURIComponent(nome)}`;
+    link.download = `${nome}.${extensao}`;
+    link.click();
+    mostrarToast('⬇️ Download iniciado', 'success');
+}
+
 function exportarCSV() {
+    if (requestIdResultado) { baixarDoServidor('csv', 'csv'); return; }
     if (dadosConsulta.length === 0) { mostrarToast('Sem dados', 'error'); return; }
     
     const colunas = colunasOrdenadas.length > 0 ? colunasOrdenadas : Object.keys(dadosConsulta[0]);
@@ -572,6 +638,7 @@ function exportarCSV() {
 }
 
 function exportarExcel() {
+    if (requestIdResultado) { baixarDoServidor('excel', 'xlsx'); return; }
     if (dadosConsulta.length === 0) { mostrarToast('Sem dados', 'error'); return; }
     
     const colunas = colunasOrdenadas.length > 0 ? colunasOrdenadas : Object.keys(dadosConsulta[0]);
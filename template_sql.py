@@ -0,0 +1,87 @@
+"""Templates SQL Compilados: placeholders {nome} viram marcadores ? (plano reaproveitado no SQL Server)"""
+import re
+from functools import lru_cache
+
+MAX_ENTIDADES = 8  # @Entidade1..@Entidade8 declarados nos templates
+# '{nome}' (entre aspas) ou {nome}
+_PLACEHOLDER = re.compile(r"'\{(\w+)\}'|\{(\w+)\}")
+# Variáveis T-SQL (@Entidade1, @DataLimite...), sem pegar @@ROWCOUNT e afins
+_VARIAVEL = re.compile(r"(?<![@\w])@(\w+)")
+
+
+def _texto(valor):
+    return None if valor is None else str(valor)
+
+
+def _valor(valor):
+    return valor
+
+
+def _lista(valores):
+    """Lista -> '1,2,1010' para STRING_SPLIT"""
+    return ','.join(str(v) for v in valores or [])
+
+
+def _entidade(i: int):
+    return lambda entidades: entidades[i] if i < len(entidades or []) else None
+
+
+class ConsultaCompilada:
+    """
+    Template convertido uma única vez em SQL parametrizado:
+    - '{x}' (entre aspas) -> ? com o valor como texto; {x} -> ? com o valor como veio (int, etc.)
+    - {entidades}/{entidades_set} -> SET @EntidadeN = ? (N = 1..8, NULL quando sobrar)
+    - {subcontas} -> SELECT value FROM STRING_SPLIT(?, ',') com a lista num único parâmetro
+    O texto SQL é o mesmo para qualquer ano/período/servidor; só os parâmetros mudam.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parametros = []  # (nome, conversão) na ordem dos marcadores
+        self.sql = _PLACEHOLDER.sub(self._marcador, template)
+
+    def _marcador(self, m) -> str:
+        if m.group(1):
+            self.parametros.append((m.group(1), _texto))
+            return '?'
+
+        nome = m.group(2)
+        if nome in ('entidades', 'entidades_set'):
+            self.parametros.extend(('entidades', _entidade(i)) for i in range(MAX_ENTIDADES))
+            return '\n'.join(f"SET @Entidade{i + 1} = ?" for i in range(MAX_ENTIDADES))
+        if nome == 'subcontas':
+            self.parametros.append((nome, _lista))
+            return "SELECT value FROM STRING_SPLIT(?, ',')"
+        self.parametros.append((nome, _valor))
+        return '?'
+
+    @property
+    def nomes(self) -> set:
+        return {nome for nome, _ in self.parametros}
+
+    def com(self, valores: dict) -> tuple:
+        """(sql, parâmetros) para cursor.execute(sql, parâmetros)"""
+        faltando = self.nomes - valores.keys()
+        if faltando:
+            raise ValueError(f"Parâmetro(s) ausente(s) na consulta: {', '.join(sorted(faltando))}")
+        return self.sql, [converter(valores[nome]) for nome, converter in self.parametros]
+
+
+@lru_cache(maxsize=64)
+def juntar_lote(sqls: tuple) -> str:
+    """
+    Várias consultas já compiladas num único batch (uma ida ao servidor, um result set cada).
+    As variáveis de cada consulta ganham sufixo (_1, _2...) porque DECLARE repetido no mesmo
+    batch é erro; SET NOCOUNT ON evita result sets de contagem entre os SELECTs.
+    Os parâmetros são os de cada consulta concatenados, na mesma ordem.
+    """
+    partes = ['SET NOCOUNT ON;']
+    for i, sql in enumerate(sqls, 1):
+        partes.append(f"-- consulta {i}\n" + _VARIAVEL.sub(rf"@\g<1>_{i}", sql.strip().rstrip(';')) + ';')
+    return '\n'.join(partes)
+
+
+@lru_cache(maxsize=64)
+def compilar(template: str) -> ConsultaCompilada:
+    """Compila (ou devolve já compilado) um template"""
+    return ConsultaCompilada(template)
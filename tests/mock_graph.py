@@ -0,0 +1,167 @@
+"""
+Mock local do Microsoft Graph (token, pasta, upload simples e upload session) para testar o upload
+sem rede. Uso manual: python tests/mock_graph.py e, no .env,
+GRAPH_URL=http://127.0.0.1:8765 e AZURE_LOGIN_URL=http://127.0.0.1:8765
+"""
+import json
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+class MockGraph:
+    """
+    Estado do drive falso e falhas injetáveis:
+    - revogar_tokens(): tokens emitidos até agora passam a receber 401
+    - recriar_pasta(): a pasta ganha id novo (o id antigo passa a receber 404)
+    - perder_resposta_parte = n: a n-ésima parte é gravada mas a conexão cai sem resposta
+    - status_atrasado = n: as próximas n consultas à sessão (GET) devolvem o estado anterior
+      à última parte, como um servidor que ainda não consolidou o que recebeu
+    """
+
+    def __init__(self, porta: int = 0):
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', porta), _Handler)
+        self.servidor.mock = self
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        self.tokens, self.revogados = [], set()
+        self.pasta_id, self.pastas = 'pasta-1', 1
+        self.arquivos = {}  # (pasta_id, nome) -> bytes
+        self.sessoes = {}   # id -> {'pasta', 'nome', 'dados', 'anterior' (bytes antes da última parte)}
+        self.partes = 0
+        self.perder_resposta_parte = None
+        self.status_atrasado = 0
+        self.respostas = []  # (método, caminho, status) de cada requisição
+
+    def __enter__(self):
+        Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *_):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def revogar_tokens(self):
+        self.revogados.update(self.tokens)
+
+    def recriar_pasta(self):
+        self.pastas += 1
+        self.pasta_id = f"pasta-{self.pastas}"
+
+    def status(self, metodo: str, prefixo: str = '') -> list:
+        return [s for m, c, s in self.respostas if m == metodo and c.startswith(prefixo)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *_):
+        pass
+
+    @property
+    def mock(self) -> MockGraph:
+        return self.server.mock
+
+    def _corpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _responder(self, status: int, corpo: dict = None):
+        self.mock.respostas.append((self.command, self.path, status))
+        dados = json.dumps(corpo or {}).encode() if status != 204 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _autorizado(self) -> bool:
+        token = (self.headers.get('Authorization') or '').removeprefix('Bearer ')
+        if token in self.mock.tokens and token not in self.mock.revogados:
+            return True
+        self._responder(401, {'error': {'code': 'InvalidAuthenticationToken'}})
+        return False
+
+    def _item(self, pasta: str, nome: str) -> dict:
+        return {'id': f"{pasta}/{nome}", 'name': nome, 'webUrl': f"{self.mock.url}/arquivos/{pasta}/{nome}",
+                'size': len(self.mock.arquivos[(pasta, nome)])}
+
+    def do_POST(self):
+        corpo = self._corpo()
+        if self.path.endswith('/oauth2/v2.0/token'):
+            self.mock.tokens.append(f"token-{len(self.mock.tokens) + 1}")
+            return self._responder(200, {'access_token': self.mock.tokens[-1], 'expires_in': 3600})
+        if not self._autorizado():
+            return
+        if self.path.endswith('/root/children'):
+            self.mock.recriar_pasta()
+            return self._responder(201, {'id': self.mock.pasta_id, 'name': json.loads(corpo)['name'],
+                                         'folder': {}})
+        caminho = re.search(r'/items/([^:]+):/(.+):/createUploadSession$', self.path)
+        if caminho:
+            pasta, nome = caminho.groups()
+            if pasta != self.mock.pasta_id:
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            sessao = str(len(self.mock.sessoes) + 1)
+            self.mock.sessoes[sessao] = {'pasta': pasta, 'nome': nome, 'dados': b'', 'anterior': 0}
+            return self._responder(200, {'uploadUrl': f"{self.mock.url}/sessao/{sessao}"})
+        self._responder(400)
+
+    def do_GET(self):
+        if self.path.endswith('/root/children'):
+            if not self._autorizado():
+                return
+            return self._responder(200, {'value': [
+                {'id': 'arquivo-solto', 'name': 'Consultas_Remotas.csv', 'file': {}},
+                {'id': self.mock.pasta_id, 'name': 'Consultas_Remotas', 'folder': {}}]})
+        sessao = self.mock.sessoes.get(self.path.rsplit('/', 1)[-1]) if self.path.startswith('/sessao/') else None
+        if sessao is None:
+            return self._responder(404)
+        recebido = len(sessao['dados'])
+        if self.mock.status_atrasado:
+            self.mock.status_atrasado -= 1
+            recebido = sessao['anterior']
+        self._responder(200, {'nextExpectedRanges': [f"{recebido}-"]})
+
+    def do_PUT(self):
+        corpo = self._corpo()
+        if self.path.startswith('/sessao/'):
+            return self._parte(self.mock.sessoes.get(self.path.rsplit('/', 1)[-1]), corpo)
+        if not self._autorizado():
+            return
+        caminho = re.search(r'/items/([^:]+):/(.+):/content$', self.path)
+        if not caminho or caminho.group(1) != self.mock.pasta_id:
+            return self._responder(404, {'error': {'code': 'itemNotFound'}})
+        self.mock.arquivos[caminho.groups()] = corpo
+        self._responder(201, self._item(*caminho.groups()))
+
+    def _parte(self, sessao: dict, corpo: bytes):
+        """PUT na uploadUrl (pré-autenticada): aceita só a faixa que começa no próximo byte esperado"""
+        if sessao is None:
+            return self._responder(404)
+        inicio, fim, tamanho = map(int, re.match(r'bytes (\d+)-(\d+)/(\d+)',
+                                                 self.headers['Content-Range']).groups())
+        if inicio != len(sessao['dados']) or fim - inicio + 1 != len(corpo):
+            return self._responder(416, {'error': {'code': 'invalidRange'}})
+        sessao['anterior'], sessao['dados'] = len(sessao['dados']), sessao['dados'] + corpo
+        self.mock.partes += 1
+        if self.mock.partes == self.mock.perder_resposta_parte:
+            self.mock.respostas.append((self.command, self.path, None))
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fim + 1 < tamanho:
+            return self._responder(202, {'nextExpectedRanges': [f"{fim + 1}-"]})
+        self.mock.arquivos[(sessao['pasta'], sessao['nome'])] = sessao['dados']
+        self._responder(201, self._item(sessao['pasta'], sessao['nome']))
+
+    def do_DELETE(self):
+        self.mock.sessoes.pop(self.path.rsplit('/', 1)[-1], None)
+        self._responder(204)
+
+
+if __name__ == '__main__':
+    mock = MockGraph(8765)
+    print(f"Mock Graph em {mock.url} (Ctrl+C para sair)")
+    try:
+        mock.servidor.serve_forever()
+    except KeyboardInterrupt:
+        mock.servidor.server_close()
@@ -0,0 +1,105 @@
+"""Cancelamento real: ConsultaMultiServidor._executar_query bloqueada no execute é interrompida por cursor.cancel()"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Event
+
+import pytest
+
+pytest.importorskip('pyodbc', exc_type=ImportError)  # consulta_multi_servidor importa o driver (exige unixODBC)
+
+import consulta_multi_servidor as modulo
+from cancelamento import registro_cancelamento
+
+
+class CursorLento:
+    """Cursor falso: execute() só retorna quando cancel() é chamado (como o driver ODBC)"""
+
+    def __init__(self):
+        self.executando = Event()
+        self.cancelado = Event()
+
+    def execute(self, sql, *params):
+        self.executando.set()
+        if not self.cancelado.wait(timeout=5):
+            raise AssertionError("execute não foi interrompido")
+        raise RuntimeError("HY008 Operation canceled")
+
+    def cancel(self):
+        self.cancelado.set()
+
+    def close(self):
+        pass
+
+
+class PoolFalso:
+    """Substitui pool_conexoes: cada servidor recebe uma conexão cujo cursor é o CursorLento dele"""
+
+    def __init__(self, cursores: dict):
+        self.cursores = cursores
+
+    @contextmanager
+    def conexao(self, servidor, database="AASI", timeout=None):
+        cursor = self.cursores[servidor]
+        yield type('ConexaoFalsa', (), {'timeout': 0, 'cursor': lambda self: cursor})()
+
+
+@pytest.fixture
+def cursores(monkeypatch):
+    cursores = {'srv1': CursorLento(), 'srv2': CursorLento()}
+    monkeypatch.setattr(modulo, 'pool_conexoes', PoolFalso(cursores))
+    yield cursores
+    registro_cancelamento.limpar('req')
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def _executar(executor, servidor):
+    return executor.submit(modulo.ConsultaMultiServidor()._executar_query, servidor, "SELECT 1",
+                           request_id='req')
+
+
+def test_cancelar_interrompe_query_em_andamento(cursores, executor):
+    registro_cancelamento.iniciar('req')
+    future = _executar(executor, 'srv1')
+    assert cursores['srv1'].executando.wait(timeout=2)
+
+    assert registro_cancelamento.cancelar('req') == 1
+    servidor, sucesso, df, erro = future.result(timeout=1)
+
+    assert (servidor, sucesso, erro) == ('srv1', False, "Cancelado")
+    assert df.empty
+    assert registro_cancelamento.ativos() == 0
+
+
+def test_cancelar_servidor_interrompe_so_aquele_servidor(cursores, executor):
+    registro_cancelamento.iniciar('req')
+    futures = [_executar(executor, 'srv1'), _executar(executor, 'srv2')]
+    assert cursores['srv1'].executando.wait(timeout=2) and cursores['srv2'].executando.wait(timeout=2)
+
+    assert registro_cancelamento.cancelar_servidor('req', 'srv1') == 1
+    # O request não foi cancelado: o erro do driver chega como erro do servidor
+    assert futures[0].result(timeout=1)[3] != "Cancelado"
+    assert not cursores['srv2'].cancelado.is_set()
+
+    registro_cancelamento.cancelar('req')
+    assert futures[1].result(timeout=1)[3] == "Cancelado"
+
+
+def test_request_cancelado_nao_inicia_query(cursores):
+    registro_cancelamento.iniciar('req')
+    registro_cancelamento.cancelar('req')
+
+    assert modulo.ConsultaMultiServidor()._executar_query('srv1', "SELECT 1", request_id='req')[3] == "Cancelado"
+    assert not cursores['srv1'].executando.is_set()
+
+
+def test_cancelar_apos_o_fim_nao_deixa_marca(cursores):
+    registro_cancelamento.iniciar('req')
+    registro_cancelamento.limpar('req')
+
+    assert registro_cancelamento.cancelar('req') == 0
+    assert not registro_cancelamento.foi_cancelado('req')
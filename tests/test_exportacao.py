@@ -0,0 +1,30 @@
+"""Parquet/Arrow tipados a partir do DataFrame bruto do pyodbc"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from exportacao import tabela_arrow
+
+
+def test_tipos_do_pyodbc():
+    tabela = tabela_arrow(pd.DataFrame({'Entidade': ['0001', '0002'],
+                                        'DataLote': [date(2024, 1, 31), None],
+                                        'Date_In': [datetime(2024, 1, 31, 8), None],
+                                        'Saldo': [Decimal('1.50'), Decimal('-2.25')]}))
+
+    assert pa.types.is_dictionary(tabela.schema.field('Entidade').type)
+    assert tabela.schema.field('DataLote').type == pa.date32()
+    assert pa.types.is_timestamp(tabela.schema.field('Date_In').type)
+    assert pa.types.is_decimal(tabela.schema.field('Saldo').type)
+
+
+def test_coluna_com_tipos_misturados_vira_texto():
+    tabela = tabela_arrow(pd.DataFrame({'Conta': [Decimal('1.5'), 'A-1', None, 7],
+                                        'Saldo': [Decimal('1'), Decimal('2'), None, Decimal('3')]}))
+
+    assert tabela.column('Conta').to_pylist() == ['1.5', 'A-1', None, '7']
+    assert pa.types.is_decimal(tabela.schema.field('Saldo').type)
@@ -0,0 +1,45 @@
+"""Página colunar: filtros casam com o texto pt-BR exibido; ordenação pelo valor bruto"""
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from resultado_colunar import ResultadosColunares
+
+
+@pytest.fixture
+def resultados():
+    resultados = ResultadosColunares()
+    resultados.guardar('req', pd.DataFrame({
+        'Entidade': ['0001', '0002', '0003', '0004'],
+        'DataLote': [date(2024, 1, 31), date(2024, 2, 1), None, date(2023, 12, 31)],
+        'Saldo': [Decimal('1234.5'), Decimal('-20'), Decimal('1234567.891'), None],
+    }))
+    return resultados
+
+
+def _entidades(pagina: dict) -> list:
+    return pagina['valores'][pagina['colunas'].index('Entidade')]
+
+
+def test_filtro_numero_pelo_texto_exibido(resultados):
+    pagina = resultados.pagina('req', filtros=[('Saldo', '1.234')])
+    assert _entidades(pagina) == ['0001', '0003']
+
+    # Valor bruto '1234.5' não aparece na tela
+    assert resultados.pagina('req', filtros=[('Saldo', '1234.5')])['total'] == 0
+    assert _entidades(resultados.pagina('req', filtros=[('Saldo', '-20,00')])) == ['0002']
+
+
+def test_filtro_data_pelo_texto_exibido(resultados):
+    pagina = resultados.pagina('req', filtros=[('DataLote', '31/')])
+    assert _entidades(pagina) == ['0001', '0004']
+
+    assert resultados.pagina('req', filtros=[('DataLote', '2024-01')])['total'] == 0
+    assert _entidades(resultados.pagina('req', filtros=[('DataLote', '/2024'), ('Saldo', '1.234,50')])) == ['0001']
+
+
+def test_ordenacao_pelo_valor_bruto_com_filtro(resultados):
+    pagina = resultados.pagina('req', ordenar='Saldo', desc=True, filtros=[('Saldo', ',')])
+    assert _entidades(pagina) == ['0003', '0001', '0002']
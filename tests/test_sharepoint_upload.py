@@ -0,0 +1,98 @@
+"""Upload SharePoint contra o mock local do Graph: upload session, retomada, 401 e 404"""
+import time
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import sharepoint_uploader as modulo
+from mock_graph import MockGraph
+
+PARTE = 64 * 1024
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    with MockGraph() as mock:
+        monkeypatch.setattr(modulo, 'GRAPH_URL', mock.url)
+        monkeypatch.setattr(modulo, 'AZURE_LOGIN_URL', mock.url)
+        # Partes pequenas e sem espera entre tentativas
+        monkeypatch.setattr(modulo, 'TAMANHO_PARTE', PARTE)
+        monkeypatch.setattr(modulo, 'time', SimpleNamespace(sleep=lambda s: None, monotonic=time.monotonic))
+        yield mock
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'Entidade': [f"{i % 40:04d}" for i in range(12000)],
+                         'Conta': [f"1.1.{i % 300}" for i in range(12000)],
+                         'Saldo': [i * 1.25 for i in range(12000)]})
+
+
+def _csv(df) -> bytes:
+    return b''.join(modulo._gerar_csv(df))
+
+
+def test_upload_session_em_partes(graph, df, monkeypatch):
+    monkeypatch.setattr(modulo, 'LIMITE_UPLOAD_SIMPLES', 0)
+    progresso = []
+
+    r = modulo.SharePointUploader().upload_csv(df, 'saldos.csv', progresso=lambda e, t: progresso.append(e))
+
+    assert r['status'] == 'sucesso'
+    assert graph.arquivos[('pasta-1', 'saldos.csv')] == _csv(df)
+    assert graph.partes == -(-len(_csv(df)) // PARTE)
+    assert progresso[0] == 0 and progresso[-1] == len(_csv(df))
+
+
+def test_upload_session_retoma_apos_resposta_perdida_e_416(graph, df, monkeypatch):
+    monkeypatch.setattr(modulo, 'LIMITE_UPLOAD_SIMPLES', 0)
+    # 2ª parte gravada sem resposta; a 1ª consulta à sessão ainda não a enxerga -> reenvio dá 416
+    graph.perder_resposta_parte = 2
+    graph.status_atrasado = 1
+
+    r = modulo.SharePointUploader().upload_csv(df, 'saldos.csv')
+
+    assert r['status'] == 'sucesso'
+    assert graph.arquivos[('pasta-1', 'saldos.csv')] == _csv(df)
+    assert 416 in graph.status('PUT', '/sessao/')
+    assert len(graph.status('GET', '/sessao/')) == 2
+
+
+def test_upload_session_desiste_e_descarta_sessao(graph, df, monkeypatch):
+    monkeypatch.setattr(modulo, 'LIMITE_UPLOAD_SIMPLES', 0)
+    monkeypatch.setattr(modulo, 'UPLOAD_TENTATIVAS', 1)
+    graph.status_atrasado = 10  # Retomada sempre aponta para a faixa já recebida
+    graph.perder_resposta_parte = 1
+
+    r = modulo.SharePointUploader().upload_csv(df, 'saldos.csv')
+
+    assert r['status'] == 'erro'
+    assert graph.sessoes == {}
+    assert graph.status('DELETE', '/sessao/') == [204]
+
+
+def test_401_renova_token(graph, df):
+    uploader = modulo.SharePointUploader()
+    assert uploader.upload_csv(df.head(10), 'a.csv')['status'] == 'sucesso'
+    graph.revogar_tokens()
+
+    r = uploader.upload_csv(df.head(10), 'b.csv')
+
+    assert r['status'] == 'sucesso'
+    assert graph.tokens == ['token-1', 'token-2']
+    assert 401 in graph.status('PUT')
+    assert ('pasta-1', 'b.csv') in graph.arquivos
+
+
+def test_404_renova_pasta_em_cache(graph, df, monkeypatch):
+    uploader = modulo.SharePointUploader()
+    assert uploader.upload_csv(df.head(10), 'a.csv')['status'] == 'sucesso'
+    graph.recriar_pasta()  # Pasta removida e criada de novo por outra pessoa
+    monkeypatch.setattr(modulo, 'LIMITE_UPLOAD_SIMPLES', 0)
+
+    r = uploader.upload_csv(df, 'b.csv')
+
+    assert r['status'] == 'sucesso'
+    assert 404 in graph.status('POST')
+    assert graph.arquivos[('pasta-2', 'b.csv')] == _csv(df)
@@ -1,15 +1,17 @@
 """Servidor Web para Consultas SQL - Com Logs em Tempo Real"""
-from flask import Flask, render_template, request, jsonify, send_file, Response
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from datetime import datetime, timedelta
 import pandas as pd
 import io
+import json
 import logging
 import traceback
 import uuid
 import sys
 from queue import Queue, Empty
 from threading import Thread, Timer
-from config import WEB_PORT, WEB_HOST, DEBUG_MODE, SECRET_KEY
+from config import (WEB_PORT, WEB_HOST, DEBUG_MODE, SECRET_KEY, SSE_LINHAS_POR_EVENTO, SSE_MAX_LINHAS,
+                    COMPRESSAO_MIN_BYTES, CONSULTAS_EM_LOTE)
 
 logging.basicConfig(
     level=logging.DEBUG if DEBUG_MODE else logging.INFO,
@@ -25,11 +27,15 @@ app.secret_key = SECRET_KEY
 logs_queues = {}      # Queue para SSE em tempo real
 resultados = {}       # Resultados das consultas
 consultas_ativas = {} # Flags de cancelamento {request_id: {'cancelado': False}}
+parciais_servidores = {}  # Para retentativa {request_id: {'data', 'fases': {tipo: {servidor: df}}, 'ts'}}
 LOG_TTL_MINUTES = 10
+PARCIAIS_TTL_MINUTES = 5
 
 
 def limpar_dados_antigos():
     """Remove dados antigos"""
+    from resultado_colunar import resultados_colunares
+    from fila_uploads import fila_uploads
     agora = datetime.now()
     for rid in list(resultados.keys()):
         if resultados.get(f"{rid}_ts"):
@@ -38,6 +44,11 @@ def limpar_dados_antigos():
                 resultados.pop(f"{rid}_ts", None)
                 logs_queues.pop(rid, None)
                 consultas_ativas.pop(rid, None)
+                resultados_colunares.remover(rid)
+                fila_uploads.remover(rid)
+    for rid in list(parciais_servidores.keys()):
+        if agora - parciais_servidores[rid]['ts'] > timedelta(minutes=PARCIAIS_TTL_MINUTES):
+            parciais_servidores.pop(rid, None)
     Timer(60, limpar_dados_antigos).start()
 
 Timer(60, limpar_dados_antigos).start()
@@ -50,6 +61,75 @@ def enviar_log(request_id: str, msg: str):
         logs_queues[request_id].put(msg)
 
 
+def enviar_evento(request_id: str, evento: str, dados: dict):
+    """Envia evento SSE nomeado (ex.: 'linhas') com payload JSON"""
+    if request_id in logs_queues:
+        logs_queues[request_id].put({'evento': evento, 'dados': dados})
+
+
+def _criar_linhas_cb(request_id: str, fase: str):
+    """Callback que envia por SSE as linhas formatadas de cada servidor assim que chegam"""
+    from formatador import converter_para_colunas
+    
+    def linhas_cb(servidor: str, df: pd.DataFrame):
+        estado = consultas_ativas.get(request_id)
+        if estado is None or estado.get('cancelado'):
+            return
+        restante = SSE_MAX_LINHAS - estado.get('linhas_enviadas', 0)
+        parte = df.iloc[:max(restante, 0)]
+        for inicio in range(0, len(parte), SSE_LINHAS_POR_EVENTO):
+            colunas, valores = converter_para_colunas(parte.iloc[inicio:inicio + SSE_LINHAS_POR_EVENTO])
+            enviar_evento(request_id, 'linhas', {'fase': fase, 'servidor': servidor,
+                                                 'colunas': colunas, 'valores': valores})
+        estado['linhas_enviadas'] = estado.get('linhas_enviadas', 0) + len(parte)
+        if len(parte) < len(df):
+            # Sem linhas: o cliente só atualiza a contagem e aguarda o resultado final
+            enviar_evento(request_id, 'linhas', {'fase': fase, 'servidor': servidor, 'colunas': [],
+                                                 'valores': [], 'omitidas': len(df) - len(parte)})
+    
+    return linhas_cb
+
+
+def _criar_upload_cb(request_id: str):
+    """Callback da fila de uploads: evento SSE 'upload' a cada mudança e log ao terminar"""
+    def upload_cb(status: dict):
+        enviar_evento(request_id, 'upload', status)
+        if status['estado'] == 'concluido':
+            enviar_log(request_id, f"✅ Upload concluído: {status.get('url') or ''}")
+        elif status['estado'] == 'falhou':
+            enviar_log(request_id, f"❌ Erro upload: {status.get('mensagem') or ''}")
+    
+    return upload_cb
+
+
+def _guardar_resultado(request_id: str, resposta: dict):
+    """Salva a resposta; o DataFrame bruto fica na API paginada e só é formatado na exibição/exportação"""
+    from resultado_colunar import resultados_colunares
+    
+    df = resposta.pop('dataframe', None)
+    if df is not None:
+        resultados_colunares.guardar(request_id, df)
+        resposta['paginado'] = True
+    resultados[request_id] = resposta
+
+
+@app.after_request
+def comprimir_json(resposta):
+    """Content-Encoding zstd/gzip nas respostas JSON, conforme o Accept-Encoding do cliente"""
+    if resposta.mimetype != 'application/json' or resposta.direct_passthrough or \
+            'Content-Encoding' in resposta.headers:
+        return resposta
+    from compressao import negociar, comprimir_bytes
+    
+    resposta.vary.add('Accept-Encoding')
+    algoritmo = negociar(request.headers.get('Accept-Encoding'))
+    corpo = resposta.get_data()
+    if algoritmo and len(corpo) >= COMPRESSAO_MIN_BYTES:
+        resposta.set_data(comprimir_bytes(corpo, algoritmo))
+        resposta.headers['Content-Encoding'] = algoritmo
+    return resposta
+
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     logger.error(f"Erro: {e}\n{traceback.format_exc()}")
@@ -92,6 +172,7 @@ def stream_logs(request_id):
             logs_queues[request_id] = Queue()
         
         queue = logs_queues[request_id]
+        aguardando_upload = False
         
         # Enviar heartbeat inicial
         yield "data: 🔄 Conectado ao stream de logs...\n\n"
@@ -104,7 +185,20 @@ def stream_logs(request_id):
                 
                 if msg == "DONE":
                     yield "data: DONE\n\n"
-                    break
+                    # Upload em segundo plano: stream segue até o evento final de 'upload'
+                    from fila_uploads import fila_uploads
+                    if not fila_uploads.pendente(request_id):
+                        break
+                    aguardando_upload = True
+                    continue
+                
+                # Eventos nomeados (ex.: linhas por servidor) vão como JSON
+                if isinstance(msg, dict):
+                    yield f"event: {msg['evento']}\ndata: {json.dumps(msg['dados'], ensure_ascii=False)}\n\n"
+                    if aguardando_upload and msg['evento'] == 'upload' and \
+                            msg['dados'].get('estado') in ('concluido', 'falhou'):
+                        break
+                    continue
                     
                 yield f"data: {msg}\n\n"
                 
@@ -141,8 +235,10 @@ def consultar_single():
             return jsonify({'status': 'erro', 'mensagem': 'Tipo de consulta não informado'}), 400
         
         from consultas_config import obter_consulta
-        from config import SERVIDOR_POR_ENTIDADE, get_connection_string
+        from config import SERVIDOR_POR_ENTIDADE
         from formatador import converter_para_json
+        from leitor_cursor import ler_dataframe
+        from pool_conexoes import pool_conexoes
         
         config = obter_consulta(tipo)
         if not config:
@@ -156,24 +252,16 @@ def consultar_single():
         if not servidor:
             return jsonify({'status': 'erro', 'mensagem': f'Entidade {entidade} não encontrada'}), 404
         
-        # Montar query
-        query = config['sql_template']
-        query = query.replace('{ano}', str(ano))
-        query = query.replace('{periodo}', str(periodo))
-        query = query.replace('{entidade}', entidade)
-        
-        # Executar
-        conn_str = get_connection_string(servidor, 'AASI')
+        # Montar query (template compilado; valores vão como parâmetros)
+        query, params = config['compiladas']['sql_template'].com(
+            {'ano': ano, 'periodo': periodo, 'entidade': entidade})
         
-        import pyodbc
-        with pyodbc.connect(conn_str, timeout=30) as conn:
+        # Executar (conexão do pool compartilhado)
+        with pool_conexoes.conexao(servidor, 'AASI', timeout=30) as conn:
             conn.timeout = 90
             cursor = conn.cursor()
-            cursor.execute(query)
-            
-            colunas = [col[0] for col in cursor.description] if cursor.description else []
-            rows = cursor.fetchall()
-            df = pd.DataFrame.from_records(rows, columns=colunas)
+            cursor.execute(query, params) if params else cursor.execute(query)
+            df, aviso = ler_dataframe(cursor)
             cursor.close()
         
         # Formatar dados (datas pt-BR, números com 2 casas, colunas em português)
@@ -185,7 +273,8 @@ def consultar_single():
             'colunas': colunas,
             'linhas_afetadas': len(df),
             'servidor': servidor,
-            'mensagem': f'{len(df)} linhas de {servidor}'
+            'mensagem': f'{len(df)} linhas de {servidor}',
+            'avisos': [aviso] if aviso else None
         })
         
     except Exception as e:
@@ -204,6 +293,10 @@ def consultar_multi():
     resultados[f"{request_id}_ts"] = datetime.now()
     consultas_ativas[request_id] = {'cancelado': False}
     
+    # Cancelável desde já; a thread chama registro_cancelamento.limpar() ao terminar
+    from cancelamento import registro_cancelamento
+    registro_cancelamento.iniciar(request_id)
+    
     data = request.json or {}
     
     # Iniciar consulta em thread separada
@@ -228,17 +321,25 @@ def cancelar_consulta(request_id):
     consultas_ativas[request_id]['cancelado'] = True
     enviar_log(request_id, "⛔ Cancelamento solicitado...")
     
+    # Interromper as queries em execução nos servidores
+    from cancelamento import registro_cancelamento
+    interrompidas = registro_cancelamento.cancelar(request_id)
+    if interrompidas:
+        enviar_log(request_id, f"⛔ {interrompidas} query(s) interrompida(s) no servidor")
+    
     return jsonify({'status': 'sucesso', 'mensagem': 'Cancelamento solicitado'})
 
 
 @app.route('/api/cancelar_todas', methods=['POST'])
 def cancelar_todas():
     """Cancela todas as consultas em andamento"""
+    from cancelamento import registro_cancelamento
     canceladas = 0
     for rid, estado in consultas_ativas.items():
         if not estado.get('cancelado') and resultados.get(rid) is None:
             estado['cancelado'] = True
             enviar_log(rid, "⛔ Cancelamento solicitado...")
+            registro_cancelamento.cancelar(rid)
             canceladas += 1
     
     return jsonify({
@@ -247,8 +348,34 @@ def cancelar_todas():
     })
 
 
-def _executar_consulta_async(request_id: str, data: dict):
-    """Executa consulta em background"""
+@app.route('/api/retentar/<request_id>', methods=['POST'])
+def retentar_consulta(request_id):
+    """Reexecuta só os servidores que falharam, reaproveitando os que responderam"""
+    anterior = parciais_servidores.get(request_id)
+    if not anterior:
+        return jsonify({'status': 'erro', 'mensagem': 'Nenhum resultado parcial disponível para retentar'}), 404
+    
+    novo_id = str(uuid.uuid4())
+    logs_queues[novo_id] = Queue()
+    resultados[novo_id] = None
+    resultados[f"{novo_id}_ts"] = datetime.now()
+    consultas_ativas[novo_id] = {'cancelado': False}
+    from cancelamento import registro_cancelamento
+    registro_cancelamento.iniciar(novo_id)
+    
+    thread = Thread(target=_executar_consulta_async, args=(novo_id, anterior['data'], request_id))
+    thread.daemon = True
+    thread.start()
+    
+    return jsonify({
+        'status': 'iniciado',
+        'request_id': novo_id,
+        'mensagem': f"Retentando {sum(len(f) for f in anterior['falhos'].values())} servidor(es)"
+    })
+
+
+def _executar_consulta_async(request_id: str, data: dict, retentar_de: str = None):
+    """Executa consulta em background (retentar_de: request_id cujos parciais reaproveitar)"""
     def log_cb(msg):
         enviar_log(request_id, msg)
     
@@ -261,9 +388,11 @@ def _executar_consulta_async(request_id: str, data: dict):
         ano = int(data.get('ano', datetime.now().year))
         periodo = int(data.get('periodo', datetime.now().month))
         upload_sharepoint = data.get('upload_sharepoint', False)
+        formato_sharepoint = data.get('formato_sharepoint', 'csv')  # csv | csv.gz | csv.zst | parquet | arrow
         incluir_saldo = data.get('incluir_saldo_anterior', False)
         data_limite = data.get('data_limite')
         meses_atras = int(data.get('meses_atras', 2))
+        forcar_atualizacao = data.get('forcar_atualizacao', False)
         
         log_cb(f"🔍 Iniciando consulta: {tipo}")
         log_cb(f"📅 Ano: {ano} | Período: {periodo}")
@@ -284,79 +413,102 @@ def _executar_consulta_async(request_id: str, data: dict):
         if config.get('tipo') == 'multi_banco':
             log_cb("🔄 Modo: Multi-banco (APS + AASI)")
             from consulta_multi_banco import ConsultaMultiBanco
-            resposta = ConsultaMultiBanco().executar_conferencia_13(ano, periodo, config, foi_cancelado, log_cb)
+            resposta = ConsultaMultiBanco().executar_conferencia_13(ano, periodo, config, foi_cancelado, log_cb,
+                                                                    request_id)
         
         # Multi-servidor
         else:
             log_cb(f"🔄 Modo: Multi-servidor")
-            from consulta_multi_servidor import ConsultaMultiServidor
+            from consulta_multi_servidor import criar_consulta_multi_servidor
             
-            query = config['sql_template']
-            if config.get('requer_data_limite') and data_limite:
-                query = query.replace('{data_limite}', data_limite)
-            if config.get('requer_ano'):
-                query = query.replace('{ano}', str(ano))
-            if config.get('requer_periodo'):
-                query = query.replace('{periodo}', str(periodo))
-            if config.get('requer_meses_atras'):
-                query = query.replace('{meses_atras}', str(meses_atras))
+            # Templates compilados: mesmo SQL para qualquer parâmetro (valores vão em `parametros`)
+            consultas = {tipo: (config, config['compiladas']['sql_template'])}
+            if incluir_saldo and config.get('requer_saldo_anterior'):
+                config_saldo = obter_consulta('saldo_anterior')
+                if config_saldo:
+                    log_cb("💳 Incluindo saldo anterior...")
+                    consultas['saldo_anterior'] = (config_saldo, config_saldo['compiladas']['sql_template'])
             
-            consulta = ConsultaMultiServidor()
+            consulta = criar_consulta_multi_servidor()
             servidores = list(config.get('entidades_por_servidor', {}).keys())
             log_cb(f"📡 Servidores: {len(servidores)}")
             
-            resposta = consulta.executar_consulta_simultanea(query, servidores, config, log_cb, foi_cancelado)
+            parametros = {'ano': ano, 'periodo': periodo, 'data_limite': data_limite, 'meses_atras': meses_atras}
+            fases_anteriores = parciais_servidores.get(retentar_de, {}).get('fases', {})
             
-            # Verificar cancelamento antes do saldo anterior
+            def executar(selecionadas):
+                return _executar_multi_com_cache(consulta, selecionadas, servidores, parametros,
+                                                 forcar_atualizacao, log_cb, foi_cancelado,
+                                                 fases_anteriores, request_id)
+            
+            # Plano: principal e saldo anterior ao mesmo tempo sobre os mesmos servidores
+            # (num único batch por servidor ou em statements paralelos); combinação depois de ambos
+            from plano_consulta import PlanoConsulta
+            plano = PlanoConsulta()
+            if CONSULTAS_EM_LOTE and len(consultas) > 1:
+                plano.etapa('lote', lambda _: executar(consultas))
+            else:
+                for fase in consultas:
+                    plano.etapa(fase, lambda _, fase=fase: executar({fase: consultas[fase]}))
+            etapas_consulta = tuple(plano.etapas)
+            if 'saldo_anterior' in consultas:
+                plano.etapa('combinar', lambda r: _combinar_saldo(_respostas_das_etapas(r), tipo, log_cb),
+                            depende_de=etapas_consulta)
+            saida = plano.executar(foi_cancelado)
+            
+            respostas = _respostas_das_etapas({e: saida[e] for e in etapas_consulta if e in saida})
+            fases, falhos = {}, {}
+            for fase, resp in respostas.items():
+                fases[fase], falhos[fase] = resp.pop('parciais', {}), resp.get('servidores_falhos', [])
+            resposta = respostas.get(tipo, {})
+            resposta['tempo_fases'] = dict(plano.tempos)
+            metricas = resposta.setdefault('metricas', {'tipo': tipo})  # Do cache vem sem tempos de servidor
+            if 'saldo_anterior' in respostas:
+                metricas['saldo_anterior'] = respostas['saldo_anterior'].get('metricas')
+            log_cb("⏱️ Fases: " + " | ".join(f"{nome} {t:.2f}s" for nome, t in plano.tempos.items()))
+            
+            # Verificar cancelamento (o plano não inicia etapas novas depois dele)
             if foi_cancelado():
                 log_cb("⛔ Consulta cancelada")
-                resultados[request_id] = {'status': 'cancelado', 'mensagem': 'Consulta cancelada', 'dados': resposta.get('dados', [])}
+                _guardar_resultado(request_id, {'status': 'cancelado', 'mensagem': 'Consulta cancelada',
+                                                'colunas': resposta.get('colunas', []),
+                                                'dataframe': resposta.get('dataframe')})
                 return
             
-            # Saldo anterior
-            if incluir_saldo and config.get('requer_saldo_anterior'):
-                log_cb("💳 Buscando saldo anterior...")
-                config_saldo = obter_consulta('saldo_anterior')
-                if config_saldo:
-                    query_saldo = config_saldo['sql_template'].replace('{meses_atras}', str(meses_atras))
-                    resp_saldo = consulta.executar_consulta_simultanea(
-                        query_saldo, servidores, config_saldo, log_cb, foi_cancelado)
-                    
-                    if resp_saldo['status'] == 'sucesso' and resp_saldo['dados']:
-                        for r in resposta['dados']:
-                            r['Origem'] = 'Atual'
-                        for r in resp_saldo['dados']:
-                            r['Origem'] = 'Saldo Anterior'
-                        resposta['dados'].extend(resp_saldo['dados'])
-                        resposta['linhas_afetadas'] = len(resposta['dados'])
-                        if 'Origem' not in resposta['colunas']:
-                            resposta['colunas'].append('Origem')
-                        log_cb(f"✅ Combinado: {len(resposta['dados'])} linhas")
+            # Guardar parciais por servidor se algum falhou (permite retentar só esses)
+            if any(falhos.values()):
+                parciais_servidores[request_id] = {'data': data, 'fases': fases, 'falhos': falhos,
+                                                   'ts': datetime.now()}
+                resposta['retentavel'] = True
+                log_cb(f"♻️ {sum(len(f) for f in falhos.values())} servidor(es) com falha - use Retentar")
         
         # Verificar cancelamento antes do upload
         if foi_cancelado():
             log_cb("⛔ Consulta cancelada antes do upload")
-            resultados[request_id] = {'status': 'cancelado', 'mensagem': 'Consulta cancelada', 'dados': resposta.get('dados', [])}
+            _guardar_resultado(request_id, {'status': 'cancelado', 'mensagem': 'Consulta cancelada',
+                                            'colunas': resposta.get('colunas', []),
+                                            'dataframe': resposta.get('dataframe')})
             return
         
-        # Upload SharePoint
-        if upload_sharepoint and resposta['status'] == 'sucesso' and resposta.get('dados'):
-            log_cb("☁️ Enviando para SharePoint...")
-            df = pd.DataFrame(resposta['dados'])
-            if resposta.get('colunas'):
-                cols = [c for c in resposta['colunas'] if c in df.columns]
-                df = df[cols]
-            resposta['sharepoint'] = _upload_sharepoint(df, tipo, ano, periodo)
-            if resposta['sharepoint'].get('status') == 'sucesso':
-                log_cb(f"✅ Upload concluído: {resposta['sharepoint'].get('url', '')}")
-            else:
-                log_cb(f"❌ Erro upload: {resposta['sharepoint'].get('mensagem', '')}")
+        # Upload SharePoint em segundo plano: o resultado fica disponível sem esperar o Graph
+        if upload_sharepoint and resposta['status'] == 'sucesso' and resposta.get('linhas_afetadas'):
+            from fila_uploads import fila_uploads
+            
+            def enviar(progresso, df=resposta['dataframe']):
+                if formato_sharepoint not in ('parquet', 'arrow'):  # Parquet/Arrow: tipado, sem pt-BR
+                    from formatador import preparar_saida
+                    df = preparar_saida(df)
+                return _upload_sharepoint(df, tipo, ano, periodo, formato_sharepoint, progresso)
+            
+            resposta['sharepoint'] = fila_uploads.enfileirar(
+                request_id, enviar, _nome_arquivo_sharepoint(tipo, formato_sharepoint),
+                _criar_upload_cb(request_id))
+            log_cb(f"☁️ Upload para SharePoint ({formato_sharepoint}) na fila")
         
-        resposta.pop('dataframe', None)
         log_cb(f"✅ Consulta finalizada! {resposta.get('linhas_afetadas', 0)} linhas")
         
-        # Salvar resultado
-        resultados[request_id] = resposta
+        # Salvar resultado (DataFrame fica guardado para a API paginada /api/resultado/<id>/pagina)
+        _guardar_resultado(request_id, resposta)
         
     except Exception as e:
         log_cb(f"❌ Erro: {str(e)}")
@@ -365,9 +517,105 @@ def _executar_consulta_async(request_id: str, data: dict):
     
     finally:
         # Sinalizar fim
+        from cancelamento import registro_cancelamento
+        registro_cancelamento.limpar(request_id)
         enviar_log(request_id, "DONE")
 
 
+def _respostas_das_etapas(resultados: dict) -> dict:
+    """{etapa: {tipo: resposta}} -> {tipo: resposta}"""
+    return {tipo: resposta for respostas in resultados.values() for tipo, resposta in respostas.items()}
+
+
+def _combinar_saldo(respostas: dict, tipo: str, log_cb) -> dict:
+    """Junta o saldo anterior (coluna Origem) na resposta principal, se ambos vieram com dados"""
+    resposta, resp_saldo = respostas.get(tipo), respostas.get('saldo_anterior')
+    if resposta and resp_saldo and resp_saldo['status'] == 'sucesso' and resp_saldo['linhas_afetadas']:
+        from resultado_colunar import combinar_saldo
+        from formatador import nomes_exibicao
+        df = combinar_saldo(resposta['dataframe'], resp_saldo['dataframe'])
+        resposta['dataframe'] = df
+        resposta['colunas'] = nomes_exibicao(df.columns)
+        resposta['linhas_afetadas'] = len(df)
+        log_cb(f"✅ Combinado: {len(df)} linhas")
+    return resposta
+
+
+def _executar_multi_com_cache(consulta, consultas: dict, servidores: list, parametros: dict, forcar: bool,
+                              log_cb, foi_cancelado, parciais: dict = None, request_id: str = None) -> dict:
+    """
+    Executa as consultas multi-servidor {tipo: (config, query)} reaproveitando o cache de resultados;
+    as que faltam vão num batch por servidor (CONSULTAS_EM_LOTE) ou uma após a outra.
+    Retorna {tipo: resposta}.
+    """
+    from cache_resultados import cache_resultados, CacheResultados
+    from time import perf_counter
+    
+    parciais = parciais or {}
+    respostas, chaves = {}, {}
+    if forcar:
+        log_cb("🔄 Atualização forçada: ignorando cache")
+    
+    for tipo, (config, _) in consultas.items():
+        if not config.get('cache_ttl', 0):
+            continue
+        
+        # Só parâmetros que a consulta usa entram na chave
+        chaves[tipo] = CacheResultados.chave(
+            tipo,
+            ano=parametros['ano'] if config.get('requer_ano') else None,
+            periodo=parametros['periodo'] if config.get('requer_periodo') else None,
+            data_limite=parametros['data_limite'] if config.get('requer_data_limite') else None,
+            meses_atras=parametros['meses_atras'] if config.get('requer_meses_atras') else None,
+            servidores=servidores)
+        if forcar:
+            continue
+        
+        inicio = perf_counter()
+        encontrado = cache_resultados.obter(chaves[tipo])
+        if encontrado:
+            df, meta = encontrado
+            log_cb(f"⚡ {tipo}: {len(df)} linhas do cache")
+            _criar_linhas_cb(request_id, tipo)('cache', df)
+            resposta = consulta._formatar_resposta(df, meta['servidores_ok'], meta['servidores_total'],
+                                                   [], [], [], perf_counter() - inicio)
+            resposta['cache'] = True
+            respostas[tipo] = resposta
+    
+    pendentes = {tipo: c for tipo, c in consultas.items() if tipo not in respostas}
+    if len(pendentes) > 1 and CONSULTAS_EM_LOTE:
+        # Uma ida por servidor: todas as consultas no mesmo batch, lidas com nextset()
+        respostas.update(consulta.executar_lote(
+            pendentes, log_cb, foi_cancelado, parciais, request_id,
+            {tipo: _criar_linhas_cb(request_id, tipo) for tipo in pendentes}, parametros))
+    else:
+        for tipo, (config, query) in pendentes.items():
+            if respostas and foi_cancelado():
+                break
+            respostas[tipo] = consulta.executar_consulta_simultanea(
+                query, servidores, config, log_cb, foi_cancelado, parciais.get(tipo), request_id,
+                _criar_linhas_cb(request_id, tipo), parametros)
+    
+    # Cachear apenas resultados completos (sem timeout/erro/truncamento)
+    for tipo, chave in chaves.items():
+        resposta = respostas.get(tipo)
+        if (tipo in pendentes and resposta and resposta['status'] == 'sucesso'
+                and not resposta.get('avisos') and not foi_cancelado()):
+            meta = {'servidores_ok': resposta['servidores_processados'],
+                    'servidores_total': resposta['servidores_total']}
+            cache_resultados.gravar(chave, tipo, resposta['dataframe'], meta, consultas[tipo][0]['cache_ttl'])
+    return respostas
+
+
+@app.route('/api/cache/invalidar', methods=['POST'])
+def invalidar_cache():
+    """Invalida o cache de resultados de uma consulta (ou de todas)"""
+    from cache_resultados import cache_resultados
+    tipo = (request.json or {}).get('tipo')
+    removidos = cache_resultados.invalidar(tipo)
+    return jsonify({'status': 'sucesso', 'mensagem': f'{removidos} entrada(s) removida(s)'})
+
+
 @app.route('/api/resultado/<request_id>')
 def obter_resultado(request_id):
     """Obtém resultado de uma consulta pelo request_id"""
@@ -380,22 +628,119 @@ def obter_resultado(request_id):
         return jsonify({'status': 'processando', 'mensagem': 'Consulta ainda em andamento'})
     
     resultado['request_id'] = request_id
-    return jsonify(resultado)
+    # ?dados=0: só metadados (as linhas vêm paginadas de /api/resultado/<id>/pagina)
+    if 'sharepoint' in resultado:
+        from fila_uploads import fila_uploads
+        resultado['sharepoint'] = fila_uploads.status(request_id) or resultado['sharepoint']
+    if request.args.get('dados') == '0':
+        return jsonify({k: v for k, v in resultado.items() if k != 'dados'})
+    if not resultado.get('paginado'):
+        return jsonify(resultado)
+    
+    # Linhas formatadas em pt-BR só agora, a partir do DataFrame bruto guardado
+    from resultado_colunar import resultados_colunares
+    from metricas import registro_metricas, cronometrar, arredondar
+    tempos = {}
+    with cronometrar(tempos, 'formatacao'):
+        dados = resultados_colunares.dados(request_id)
+    metricas = {**(resultado.get('metricas') or {}), **arredondar(tempos)}
+    with cronometrar(tempos, 'serializacao'):
+        resposta = jsonify({**resultado, 'metricas': metricas, 'dados': dados})
+    # A serialização termina depois do corpo pronto: vai no cabeçalho Server-Timing e no histograma
+    resposta.headers['Server-Timing'] = ', '.join(f"{etapa};dur={s * 1000:.1f}" for etapa, s in tempos.items())
+    registro_metricas.observar_etapas('consultas_etapa_segundos', tempos, tipo=metricas.get('tipo', 'avulsa'))
+    return resposta
+
+
+@app.route('/api/upload/<request_id>')
+def obter_status_upload(request_id):
+    """Status do upload SharePoint em segundo plano (na_fila, enviando, concluido, falhou)"""
+    from fila_uploads import fila_uploads
+    status = fila_uploads.status(request_id)
+    if status is None:
+        return jsonify({'status': 'erro', 'mensagem': 'Upload não encontrado'}), 404
+    return jsonify({'status': 'sucesso', **status})
+
+
+@app.route('/api/resultado/<request_id>/pagina')
+def obter_pagina_resultado(request_id):
+    """
+    Página colunar do resultado: ?offset=0&limit=500&ordenar=<coluna>&desc=1
+    &filtro=<coluna>:<texto> (repetível)
+    """
+    from resultado_colunar import resultados_colunares, dumps
+    
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 500))
+    except ValueError:
+        return jsonify({'status': 'erro', 'mensagem': 'offset/limit inválidos'}), 400
+    
+    filtros = []
+    for filtro in request.args.getlist('filtro'):
+        coluna, sep, texto = filtro.partition(':')
+        if not sep:
+            return jsonify({'status': 'erro', 'mensagem': f'Filtro inválido: {filtro}'}), 400
+        filtros.append((coluna, texto))
+    
+    try:
+        pagina = resultados_colunares.pagina(request_id, offset, limit, request.args.get('ordenar'),
+                                             request.args.get('desc') in ('1', 'true'), filtros)
+    except KeyError:
+        return jsonify({'status': 'erro', 'mensagem': 'Resultado não encontrado'}), 404
+    except ValueError as e:
+        return jsonify({'status': 'erro', 'mensagem': str(e)}), 400
+    
+    pagina.update({'status': 'sucesso', 'request_id': request_id})
+    return Response(dumps(pagina), mimetype='application/json')
+
+
+@app.route('/api/resultado/<request_id>/consulta', methods=['POST'])
+def consultar_resultado(request_id):
+    """
+    Consulta sobre o resultado guardado, devolvendo só a resposta (colunar):
+    {"filtros": [{"coluna", "op": eq|ne|gt|ge|lt|le|contem|em, "valor"}],
+     "agrupar": ["IDEntidade", "IDConta"], "agregacoes": [{"coluna": "Saldo_Legal", "funcao": "sum"}],
+     "ordenar": [{"coluna": "Saldo_Legal", "desc": true}], "limite": 10}
+    """
+    from resultado_colunar import resultados_colunares, dumps
+    
+    try:
+        resposta = resultados_colunares.consultar(request_id, request.json or {})
+    except KeyError:
+        return jsonify({'status': 'erro', 'mensagem': 'Resultado não encontrado'}), 404
+    except (ValueError, TypeError) as e:
+        return jsonify({'status': 'erro', 'mensagem': str(e)}), 400
+    
+    resposta.update({'status': 'sucesso', 'request_id': request_id})
+    return Response(dumps(resposta), mimetype='application/json')
+
 
+def _nome_arquivo_sharepoint(tipo: str, formato: str = 'csv') -> str:
+    nomes = {
+        'ficha_loja': "BalanceteLoja",
+        'lotes_sem_anexo': "LotesSemAnexo",
+        'conferencia_13': "Conferencia13"
+    }
+    return f"{nomes.get(tipo, f'Consulta_{tipo}')}.{formato}"
 
-def _upload_sharepoint(df: pd.DataFrame, tipo: str, ano: int, periodo: int) -> dict:
-    """Helper para upload SharePoint"""
+
+def _upload_sharepoint(df: pd.DataFrame, tipo: str, ano: int, periodo: int, formato: str = 'csv',
+                       progresso=None) -> dict:
+    """Helper para upload SharePoint (formato: csv | csv.gz | csv.zst | parquet | arrow)"""
     try:
-        from sharepoint_uploader import SharePointUploader
-        
-        nomes = {
-            'ficha_loja': "BalanceteLoja.csv",
-            'lotes_sem_anexo': "LotesSemAnexo.csv",
-            'conferencia_13': "Conferencia13.csv"
-        }
-        filename = nomes.get(tipo, f"Consulta_{tipo}.csv")
-        
-        return SharePointUploader().upload_csv(df, filename)
+        from sharepoint_uploader import sharepoint_uploader as uploader
+        from compressao import POR_EXTENSAO, validar
+        
+        filename = _nome_arquivo_sharepoint(tipo, formato)
+        if formato == 'parquet':
+            return uploader.upload_parquet(df, filename, progresso=progresso)
+        if formato == 'arrow':
+            return uploader.upload_arrow(df, filename, progresso=progresso)
+        if formato.startswith('csv.'):
+            compressao = validar(POR_EXTENSAO.get(formato[4:], formato[4:]))
+            return uploader.upload_csv(df, filename, progresso=progresso, compressao=compressao)
+        return uploader.upload_csv(df, filename, progresso=progresso)
     except Exception as e:
         return {'status': 'erro', 'mensagem': str(e)}
 
@@ -410,6 +755,18 @@ def upload_sharepoint():
         tipo = data.get('tipo', 'consulta')
         ano = int(data.get('ano', datetime.now().year))
         periodo = int(data.get('periodo', datetime.now().month))
+        formato = data.get('formato', 'csv')
+        
+        # Com request_id o arquivo sai do DataFrame bruto guardado (Parquet/Arrow exigem)
+        if data.get('request_id') or formato in ('parquet', 'arrow'):
+            from resultado_colunar import resultados_colunares
+            df = resultados_colunares.obter(data.get('request_id', ''))
+            if df is None:
+                raise ValueError("Resultado não encontrado para o request_id")
+            if formato not in ('parquet', 'arrow'):
+                from formatador import preparar_saida
+                df, formato = preparar_saida(df), formato if formato.startswith('csv') else 'csv'
+            return jsonify(_upload_sharepoint(df, tipo, ano, periodo, formato))
         
         if not dados:
             raise ValueError("Sem dados para enviar")
@@ -419,7 +776,7 @@ def upload_sharepoint():
             cols = [c for c in colunas if c in df.columns]
             df = df[cols]
         
-        resultado = _upload_sharepoint(df, tipo, ano, periodo)
+        resultado = _upload_sharepoint(df, tipo, ano, periodo, formato if formato.startswith('csv') else 'csv')
         return jsonify(resultado)
     except Exception as e:
         logger.error(f"Erro upload SharePoint: {e}")
@@ -454,7 +811,13 @@ def exportar(formato):
         elif formato == 'csv':
             output = io.StringIO()
             df.to_csv(output, index=False, sep=';', encoding='utf-8-sig')
-            return send_file(io.BytesIO(output.getvalue().encode('utf-8-sig')),
+            conteudo = output.getvalue().encode('utf-8-sig')
+            if data.get('compressao'):  # gzip | zstd -> .csv.gz / .csv.zst
+                from compressao import validar, comprimir_bytes, EXTENSOES, MIMETYPES
+                compressao = validar(data['compressao'])
+                return send_file(io.BytesIO(comprimir_bytes(conteudo, compressao)), mimetype=MIMETYPES[compressao],
+                               as_attachment=True, download_name=f'{nome}.csv.{EXTENSOES[compressao]}')
+            return send_file(io.BytesIO(conteudo),
                            mimetype='text/csv', as_attachment=True, download_name=f'{nome}.csv')
         
         raise ValueError(f"Formato inválido: {formato}")
@@ -462,16 +825,90 @@ def exportar(formato):
         return jsonify({'erro': str(e)}), 400
 
 
+@app.route('/api/resultado/<request_id>/exportar/<formato>')
+def exportar_resultado(request_id, formato):
+    """
+    Exporta o resultado guardado (csv, excel, parquet ou arrow), sem reenviar os dados.
+    ?compressao=gzip|zstd: CSV comprimido em streaming (.csv.gz/.csv.zst); no Parquet/Arrow vira o codec interno
+    """
+    from resultado_colunar import resultados_colunares
+    from exportacao import gerar_csv, gerar_xlsx, gerar_binario, ler_e_remover, MIMETYPES
+    import compressao
+    import os
+    
+    df = resultados_colunares.obter(request_id)
+    if df is None:
+        return jsonify({'status': 'erro', 'mensagem': 'Resultado não encontrado'}), 404
+    nome = request.args.get('nome_arquivo', 'exportacao')
+    codec = request.args.get('compressao')
+    
+    if formato == 'csv':
+        if codec:
+            try:
+                compressao.validar(codec)
+            except ValueError as e:
+                return jsonify({'status': 'erro', 'mensagem': str(e)}), 400
+            return Response(stream_with_context(compressao.comprimir(gerar_csv(df), codec)),
+                            mimetype=compressao.MIMETYPES[codec],
+                            headers={'Content-Disposition':
+                                     f'attachment; filename="{nome}.csv.{compressao.EXTENSOES[codec]}"'})
+        return Response(stream_with_context(gerar_csv(df)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{nome}.csv"'})
+    
+    if formato == 'excel':
+        caminho = gerar_xlsx(df)
+        return Response(ler_e_remover(caminho),
+                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        headers={'Content-Disposition': f'attachment; filename="{nome}.xlsx"',
+                                 'Content-Length': str(os.path.getsize(caminho))})
+    
+    # Parquet/Arrow: DataFrame bruto e tipado (sem formatação pt-BR)
+    if formato in MIMETYPES:
+        try:
+            caminho = gerar_binario(df, formato, codec)
+        except ValueError as e:  # Codec não suportado pelo formato (ArrowInvalid)
+            return jsonify({'status': 'erro', 'mensagem': str(e)}), 400
+        return Response(ler_e_remover(caminho), mimetype=MIMETYPES[formato],
+                        headers={'Content-Disposition': f'attachment; filename="{nome}.{formato}"',
+                                 'Content-Length': str(os.path.getsize(caminho))})
+    
+    return jsonify({'status': 'erro', 'mensagem': f"Formato inválido: {formato}"}), 400
+
+
 @app.route('/api/status')
 def status():
     """Status do servidor"""
+    from pool_conexoes import pool_conexoes
+    from cache_resultados import cache_resultados
+    from executor_compartilhado import executor_consultas
+    from fila_uploads import fila_uploads
+    from disjuntor import registro_disjuntores
     return jsonify({
         'status': 'online', 
         'timestamp': datetime.now().isoformat(),
-        'consultas_ativas': len([r for r in resultados.values() if r is None])
+        'consultas_ativas': len([r for r in resultados.values() if r is None]),
+        'pool_conexoes': pool_conexoes.estatisticas(),
+        'cache_resultados': cache_resultados.estatisticas(),
+        'executor_consultas': executor_consultas.estatisticas(),
+        'fila_uploads': fila_uploads.estatisticas(),
+        'disjuntores': registro_disjuntores.estatisticas()
     })
 
 
+@app.route('/metrics')
+def exportar_metricas():
+    """Histogramas de tempo por consulta, servidor e etapa no formato texto do Prometheus"""
+    from metricas import registro_metricas
+    return Response(registro_metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/latencias')
+def latencias():
+    """Histórico de latência por servidor/consulta e timeouts adaptativos derivados"""
+    from latencia import registro_latencia
+    return jsonify({'status': 'sucesso', 'latencias': registro_latencia.estatisticas()})
+
+
 if __name__ == '__main__':
     print(f"\n{'='*50}")
     print(f"SERVIDOR WEB - CONSULTAS SQL")